@@ -0,0 +1,191 @@
+""" Script to tune the inference settings of a trained model on this host.
+
+    Sweeps the batch size and the TensorFlow intra-op and inter-op
+    thread pools on a sample of a triples file, measures the throughput
+    and the p95 batch latency of every setting, and writes the best one
+    to data/logs/<lang>_inference_config.json, which translate.py and
+    serve.py load when --batch_size and the thread flags are not given.
+
+    The thread pools can only be sized before TensorFlow runs its first
+    op, so every thread setting is measured in its own process.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from src.utils.inference_config import inference_config_path, set_thread_pools
+
+parser = argparse.ArgumentParser(description="Autotune Arguments")
+
+parser.add_argument(
+  '--model', type=str, required=False, default='gat', help='The model used to verbalise the triples')
+parser.add_argument(
+  '--lang', type=str, required=True, help='Language of the trained model')
+parser.add_argument(
+  '--triples', type=str, required=True, help='Path to a triple file like the real inputs')
+parser.add_argument(
+  '--sample', type=int, required=False, default=256,
+  help='Number of triple sets sampled from the file to time every setting')
+parser.add_argument(
+  '--seed', type=int, required=False, default=0, help='Random seed of the sample')
+parser.add_argument(
+  '--batch_sizes', type=str, required=False, default='1,8,16,32,64',
+  help='Comma separated batch sizes to try')
+parser.add_argument(
+  '--intra_op', type=str, required=False, default=None,
+  help='Comma separated intra-op thread counts to try, defaults to powers of 2 up to the cores')
+parser.add_argument(
+  '--inter_op', type=str, required=False, default='1,2',
+  help='Comma separated inter-op thread counts to try')
+parser.add_argument(
+  '--max_p95_ms', type=float, required=False, default=None,
+  help='Only recommend the settings whose p95 batch latency is below this')
+parser.add_argument(
+  '--output', type=str, required=False, default=None,
+  help='Path of the recommended config, defaults to data/logs/<lang>_inference_config.json')
+parser.add_argument(
+  '--sentencepiece', type=str, required=False, default='False', help='Use sentencepiece or not')
+parser.add_argument(
+  '--eager', type=str, required=False, default='False',
+  help='Run the predict step eagerly instead of as a tf.function graph (debugging)')
+parser.add_argument(
+  '--xla', type=str, required=False, default='False', help='Use XLA JIT compilation for the predict step')
+parser.add_argument(
+  '--dtype', type=str, required=False, default=None,
+  help='Compute dtype used for inference float32 | bfloat16, defaults to the training one')
+parser.add_argument(
+  '--quantized', type=str, required=False, default='False',
+  help='Load the model from the int8 file exported by quantize.py instead of the checkpoint, '
+       'a smaller file but not a faster model')
+parser.add_argument(
+  '--saved_model', type=str, required=False, default=None,
+  help='Directory of a model exported by export.py, used instead of the training checkpoint')
+parser.add_argument(
+  '--trial', type=str, required=False, default=None,
+  help='Internal, times the batch sizes with the <intra>,<inter> thread pools and prints them')
+
+
+def _ints(text):
+  return [int(value) for value in text.split(',') if value]
+
+
+def sample_triples(path, size, seed):
+  """
+  Reservoir sample of the triple sets of a file.
+  :param path: Path to the triple file
+  :type path: str
+  :param size: Number of triple sets sampled
+  :type size: int
+  :param seed: Random seed of the sample
+  :type seed: int
+  :return: the sampled triple sets, in the order of the file
+  :rtype: list
+  """
+  rng = random.Random(seed)
+  sample = []
+  with open(path, 'r') as f:
+    for i, line in enumerate(line for line in f if line.strip()):
+      if len(sample) < size:
+        sample.append((i, line))
+      else:
+        j = rng.randint(0, i)
+        if j < size:
+          sample[j] = (i, line)
+
+  return [line for _, line in sorted(sample)]
+
+
+def run_trial(args, intra_op, inter_op):
+  """
+  Times every batch size with the given thread pools, in this process.
+  :return: throughput in triple sets/sec and p95 batch latency in ms
+           of every batch size
+  :rtype: list
+  """
+  set_thread_pools(intra_op, inter_op)
+  from src.serving.verbalizer import Verbalizer
+
+  verbalizer = Verbalizer(args)
+  triple_sets = sample_triples(args.triples, args.sample, args.seed)
+  results = []
+  for batch_size in _ints(args.batch_sizes):
+    batches = [triple_sets[i:i + batch_size] for i in range(0, len(triple_sets), batch_size)]
+    # the first batch traces the predict step
+    verbalizer.verbalize(batches[0])
+    latencies = []
+    start = time.time()
+    for batch in batches:
+      batch_start = time.time()
+      verbalizer.verbalize(batch)
+      latencies.append(time.time() - batch_start)
+    elapsed = time.time() - start
+    results.append({"batch_size": batch_size, "intra_op_parallelism": intra_op,
+                    "inter_op_parallelism": inter_op,
+                    "throughput": len(triple_sets) / elapsed,
+                    "p95_ms": float(np.percentile(latencies, 95)) * 1000.})
+
+  return results
+
+
+def recommend(trials, max_p95_ms=None):
+  """
+  The setting with the highest throughput, among the ones meeting the
+  latency bound if any does, else the one with the lowest latency.
+  """
+  within = [trial for trial in trials if max_p95_ms is None or trial["p95_ms"] <= max_p95_ms]
+  if within:
+    return max(within, key=lambda trial: trial["throughput"])
+  return min(trials, key=lambda trial: trial["p95_ms"])
+
+
+if __name__ == "__main__":
+  args = parser.parse_args()
+  if args.trial is not None:
+    intra_op, inter_op = _ints(args.trial)
+    print('TRIAL ' + json.dumps(run_trial(args, intra_op, inter_op)))
+    sys.exit(0)
+
+  cores = multiprocessing.cpu_count()
+  if args.intra_op is not None:
+    intra_ops = _ints(args.intra_op)
+  else:
+    intra_ops = sorted(set([2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores] + [cores]))
+
+  trials = []
+  for intra_op in intra_ops:
+    for inter_op in _ints(args.inter_op):
+      print('Timing intra_op {} inter_op {}'.format(intra_op, inter_op))
+      output = subprocess.check_output(
+        [sys.executable] + sys.argv + ['--trial', '{},{}'.format(intra_op, inter_op)])
+      for line in output.decode('utf-8').split('\n'):
+        if line.startswith('TRIAL '):
+          for trial in json.loads(line[len('TRIAL '):]):
+            print('  batch_size {batch_size:4d} : {throughput:8.2f} triple sets/sec, '
+                  'p95 {p95_ms:8.1f}ms'.format(**trial))
+            trials.append(trial)
+
+  best = recommend(trials, args.max_p95_ms)
+  config = {"batch_size": best["batch_size"],
+            "intra_op_parallelism": best["intra_op_parallelism"],
+            "inter_op_parallelism": best["inter_op_parallelism"],
+            "throughput": best["throughput"], "p95_ms": best["p95_ms"],
+            "max_p95_ms": args.max_p95_ms, "host": platform.node(), "cores": cores,
+            "trials": trials}
+  path = args.output or inference_config_path(args.lang)
+  with open(path, 'w') as fp:
+    json.dump(config, fp, indent=2)
+  print('Recommended batch_size {} intra_op {} inter_op {} ({:.2f} triple sets/sec, '
+        'p95 {:.1f}ms), written to {}'.format(best["batch_size"], best["intra_op_parallelism"],
+                                             best["inter_op_parallelism"], best["throughput"],
+                                             best["p95_ms"], path))
@@ -0,0 +1,239 @@
+""" Script to benchmark the GAT-Transformer model.
+
+    train  - steps/sec of the training step, eager vs compiled with
+             tf.function (and optionally XLA).
+    decode - sentences/sec of the trained model on a triples file,
+             with ROUGE and BLEU against the references if given.
+             Run it once per setting (--dtype, --quantized, --beam_size 1
+             --greedy True/False, --compact_every, --draft_lang, --sort_batches ...) to compare them.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import copy
+import os
+import pickle
+import re
+import subprocess
+import tempfile
+import time
+
+import tensorflow as tf
+
+from src.DataLoader import GetGATDataset
+from src.models.GraphAttentionModel import TransGAT
+from src.trainers.GATtrainer import _get_train_step
+from src.utils.InferenceUtils import LoadModel, _decode_predictions, _shortlist_candidates, \
+  _restore_order, _sort_by_size, _tensorize_triples
+from src.utils.PreprocessingUtils import PreProcess
+from src.utils.metrics import LossLayer
+from src.utils.model_utils import compile_step, graph_input_signature, set_precision_policy
+from src.utils.quantization import quantized_weights_path
+from src.utils.rogue import rouge_n
+
+parser = argparse.ArgumentParser(description="Benchmark Arguments")
+
+parser.add_argument(
+  '--mode', type=str, default='train', help='What to benchmark -> train | decode')
+parser.add_argument(
+  '--lang', type=str, required=True, help='Language of the trained model parameters')
+parser.add_argument(
+  '--steps', type=int, default=100, help='Number of timed steps')
+parser.add_argument(
+  '--warmup', type=int, default=5, help='Number of untimed steps run first (tracing, building)')
+parser.add_argument(
+  '--eager', type=str, default='False', help='Decode eagerly instead of with a tf.function graph')
+parser.add_argument(
+  '--xla', type=str, default='False', help='Use XLA JIT compilation for the compiled steps')
+parser.add_argument(
+  '--triples', type=str, required=False, help='Path to the triple file to decode')
+parser.add_argument(
+  '--ref', type=str, required=False, help='Path to the reference sentences of the triple file')
+parser.add_argument(
+  '--batch_size', type=int, default=32, help='Batch size to do inference')
+parser.add_argument(
+  '--sentencepiece', type=str, default='False', help='Use sentencepiece or not')
+parser.add_argument(
+  '--dtype', type=str, required=False, default=None,
+  help='Compute dtype used for inference float32 | bfloat16, defaults to the training one')
+parser.add_argument(
+  '--shortlist', type=int, default=0,
+  help='Decode over a shortlist with the K most frequent target tokens, 0 to disable')
+parser.add_argument(
+  '--quantized', type=str, default='False', help='Load the model from the int8 file exported by quantize.py '
+       'instead of the checkpoint')
+parser.add_argument(
+  '--beam_size', type=int, default=None, help='Beam size used to decode, defaults to the training one')
+parser.add_argument(
+  '--greedy', type=str, default='True',
+  help='Use the greedy search when the beam size is 1, False to time the beam search path')
+parser.add_argument(
+  '--compact_every', type=int, default=0,
+  help='Drop the finished sentences from the beam search every N steps, 0 to disable')
+parser.add_argument(
+  '--sort_batches', type=str, default='False',
+  help='Batch the triple sets sorted by size, as translate.py does by default')
+parser.add_argument(
+  '--draft_lang', type=str, default=None,
+  help='Decode with speculative greedy decoding, proposals from the model of this language')
+parser.add_argument(
+  '--draft_steps', type=int, default=4, help='Number of tokens proposed by the draft model per step')
+
+args = parser.parse_args()
+
+
+def _load_params(lang):
+  log_dir = 'data/logs'
+  with open(log_dir + '/' + lang + '_model_params', 'rb') as fp:
+    params = pickle.load(fp)
+
+  return params
+
+
+def _steps_per_sec(step_fn, batches, warmup):
+  """
+  Runs the step over the batches and returns the number of steps
+  per second, ignoring the first warmup steps.
+  """
+  for batch in batches[:warmup]:
+    step_fn(*batch)
+
+  start = time.time()
+  for batch in batches[warmup:]:
+    outputs = step_fn(*batch)
+    # make sure the step actually finished before timing the next one
+    tf.nest.map_structure(lambda t: t.numpy(), outputs)
+
+  return (len(batches) - warmup) / (time.time() - start)
+
+
+def _bleu(hypotheses, ref_path):
+  """
+  Calculates the corpus BLEU of the hypotheses with the
+  multi-bleu.perl script, returns None if it can not be run.
+  """
+  with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as fp:
+    fp.write('\n'.join(hypotheses) + '\n')
+  try:
+    with open(fp.name, 'r') as hyp:
+      output = subprocess.check_output(
+        ['perl', 'src/tools/multi-bleu.perl', ref_path], stdin=hyp,
+        stderr=subprocess.DEVNULL).decode('utf-8')
+  except (OSError, subprocess.CalledProcessError):
+    return None
+  finally:
+    os.remove(fp.name)
+  match = re.search(r'BLEU = ([0-9.]+)', output)
+
+  return float(match.group(1)) if match else None
+
+
+def benchmark_train(params):
+  model_args = params['args']
+  set_precision_policy(model_args)
+  (dataset, eval_set, test_set, BUFFER_SIZE, BATCH_SIZE, steps_per_epoch,
+   src_vocab_size, src_vocab, tgt_vocab_size, tgt_vocab,
+   max_length_targ, dataset_size, _) = GetGATDataset(model_args)
+  batches = list(dataset.repeat(-1).take(args.warmup + args.steps))
+
+  results = {}
+  for mode in ['eager', 'compiled']:
+    step_args = copy.copy(model_args)
+    step_args.eager = 'True' if mode == 'eager' else 'False'
+    step_args.xla = args.xla
+
+    model = TransGAT(model_args, src_vocab_size, src_vocab,
+                     tgt_vocab_size, max_length_targ, tgt_vocab)
+    loss_layer = LossLayer(tgt_vocab_size, 0.1, getattr(model_args, 'num_sampled', 0))
+    optimizer = tf.train.AdamOptimizer(learning_rate=1e-4, beta1=0.9, beta2=0.98,
+                                       epsilon=1e-9)
+    train_loss = tf.keras.metrics.Mean(name='train_loss')
+    train_step = _get_train_step(step_args, model, loss_layer, optimizer, train_loss)
+
+    results[mode] = _steps_per_sec(train_step, batches, args.warmup)
+    print('{} train step : {:.2f} steps/sec'.format(mode, results[mode]))
+
+  print('Speed-up of the compiled step : {:.2f}x'.format(
+    results['compiled'] / results['eager']))
+
+
+def benchmark_decode():
+  model, src_vocab, tgt_vocab = LoadModel('gat', args.lang, args.dtype,
+                                          quantized=args.quantized == 'True')
+  if args.beam_size is not None:
+    model.args.beam_size = args.beam_size
+  model.greedy_decoding = args.greedy == 'True'
+  model.compact_every = args.compact_every
+  nodes, labels, node1, node2 = PreProcess(args.triples, args.lang)
+  if args.sort_batches == 'True':
+    nodes, labels, node1, node2, order = _sort_by_size(nodes, labels, node1, node2)
+  dataset = _tensorize_triples(nodes, labels, node1, node2, src_vocab, args.batch_size)
+  batches = list(dataset)
+
+  if args.draft_lang is not None:
+    draft_model, _, _ = LoadModel('gat', args.draft_lang, args.dtype)
+    predict_step = compile_step(
+      lambda nodes, labels, node1, node2: model.speculate(
+        draft_model, nodes, labels, node1, node2, args.draft_steps),
+      graph_input_signature(), args)
+  elif args.shortlist > 0:
+    batches = [batch + (_shortlist_candidates(nodes[i * args.batch_size:(i + 1) * args.batch_size],
+                                              tgt_vocab, args.shortlist, args.sentencepiece,
+                                              args.lang),)
+               for i, batch in enumerate(batches)]
+    predict_step = compile_step(
+      lambda nodes, labels, node1, node2, shortlist: model(
+        nodes, labels, node1, node2, targ=None, mask=None, shortlist=shortlist),
+      graph_input_signature() + [tf.TensorSpec([None], tf.int32, name='shortlist')], args)
+  else:
+    predict_step = compile_step(
+      lambda nodes, labels, node1, node2: model(nodes, labels, node1, node2, targ=None, mask=None),
+      graph_input_signature(), args)
+  # build and trace the model before timing
+  predict_step(*batches[0])
+
+  results = []
+  target_steps = 0
+  start = time.time()
+  for batch in batches:
+    predictions = predict_step(*batch)
+    pred = predictions['outputs'].numpy().tolist()
+    results.extend(_decode_predictions(pred, tgt_vocab, args.sentencepiece))
+    if args.draft_lang is not None:
+      target_steps += int(predictions['target_steps'])
+  elapsed = time.time() - start
+  if args.sort_batches == 'True':
+    results = _restore_order(results, order)
+
+  print('Compute dtype {}'.format(model.float_dtype.name))
+  # the int8 weights are dequantized when loaded, the model in memory is
+  # as large as the float one
+  print('Weights in memory {:.2f} MB'.format(
+    sum(w.numpy().nbytes for w in model.weights) / 2 ** 20))
+  if args.quantized == 'True':
+    print('int8 weights file {:.2f} MB'.format(
+      os.path.getsize(quantized_weights_path(args.lang)) / 2 ** 20))
+  if args.draft_lang is not None:
+    print('Mean model forward passes per batch {:.2f}'.format(target_steps / len(batches)))
+  if args.shortlist > 0:
+    print('Mean shortlist size {:.0f}'.format(
+      sum(len(batch[-1]) for batch in batches) / len(batches)))
+  print('Decoded {} inputs in {:.2f}s : {:.2f} sentences/sec, {:.2f} ms per batch'.format(
+    len(results), elapsed, len(results) / elapsed, 1000 * elapsed / len(batches)))
+  if args.ref is not None:
+    references = open(args.ref, 'r').read().strip().split('\n')
+    print('ROUGE {:.4f}'.format(rouge_n(results, references)))
+    bleu = _bleu(results, args.ref)
+    if bleu is not None:
+      print('BLEU {:.2f}'.format(bleu))
+
+
+if __name__ == "__main__":
+  if args.mode == 'train':
+    benchmark_train(_load_params(args.lang))
+  elif args.mode == 'decode':
+    benchmark_decode()
+  else:
+    raise ValueError("mode {} is not valid.".format(args.mode))
@@ -0,0 +1,40 @@
+""" Script to export a trained GAT-Transformer model as an inference-only
+    SavedModel, with the vocabs bundled as assets and a
+    verbalize(nodes, labels, node1, node2) signature.
+    Use it with translate.py --saved_model <export_dir>.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+
+import sentencepiece as spm
+
+from src.utils.InferenceUtils import LoadModel
+from src.utils.export import export_saved_model
+from src.utils.quantization import build_model
+
+parser = argparse.ArgumentParser(description="Export Arguments")
+
+parser.add_argument(
+  '--lang', type=str, required=True, help='Language of the trained model')
+parser.add_argument(
+  '--export_dir', type=str, required=False, default=None,
+  help='Directory of the SavedModel, defaults to exports/<lang>')
+parser.add_argument(
+  '--dtype', type=str, required=False, default=None,
+  help='Compute dtype of the exported model float32 | bfloat16, defaults to the training one')
+
+args = parser.parse_args()
+
+if __name__ == "__main__":
+  model, src_vocab, tgt_vocab = LoadModel('gat', args.lang, args.dtype)
+  build_model(model)
+
+  sentencepiece_path = None
+  if isinstance(tgt_vocab, spm.SentencePieceProcessor):
+    sentencepiece_path = 'vocabs/gat/' + args.lang + '/train_tgt.model'
+  export_dir = args.export_dir or 'exports/' + args.lang
+  export_saved_model(model, args.lang, src_vocab, tgt_vocab, export_dir, sentencepiece_path)
+  print('Exported the ' + args.lang + ' model to ' + export_dir)
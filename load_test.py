@@ -0,0 +1,79 @@
+""" Load test of the verbalization server (serve.py), sends the triple
+    sets of a file from concurrent clients over keep-alive connections
+    and reports the throughput and the latency percentiles.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import http.client
+import json
+import threading
+import time
+
+import numpy as np
+
+parser = argparse.ArgumentParser(description="Load Test Arguments")
+
+parser.add_argument(
+  '--host', type=str, required=False, default='127.0.0.1', help='Address of the server')
+parser.add_argument(
+  '--port', type=int, required=False, default=8080, help='Port of the server')
+parser.add_argument(
+  '--triples', type=str, required=True, help='Path to the triple file')
+parser.add_argument(
+  '--concurrency', type=int, required=False, default=8, help='Number of concurrent clients')
+parser.add_argument(
+  '--requests', type=int, required=False, default=200, help='Number of requests sent in total')
+parser.add_argument(
+  '--per_request', type=int, required=False, default=1, help='Number of triple sets per request')
+
+args = parser.parse_args()
+
+
+def _client(bodies, latencies, errors):
+  """Sends the request bodies one after the other over one connection."""
+  connection = http.client.HTTPConnection(args.host, args.port)
+  for body in bodies:
+    start = time.time()
+    connection.request('POST', '/verbalize', body=body.encode('utf-8'),
+                       headers={'Content-Type': 'text/plain'})
+    response = connection.getresponse()
+    response.read()
+    if response.status == 200:
+      latencies.append(time.time() - start)
+    else:
+      errors.append(response.status)
+  connection.close()
+
+
+if __name__ == "__main__":
+  with open(args.triples, 'r') as f:
+    triple_sets = [line.strip() for line in f if line.strip()]
+  bodies = ['\n'.join(triple_sets[(i * args.per_request + j) % len(triple_sets)]
+                      for j in range(args.per_request))
+            for i in range(args.requests)]
+
+  latencies, errors = [], []
+  clients = [threading.Thread(target=_client, args=(bodies[i::args.concurrency], latencies, errors))
+             for i in range(args.concurrency)]
+  start = time.time()
+  for client in clients:
+    client.start()
+  for client in clients:
+    client.join()
+  elapsed = time.time() - start
+
+  latencies = np.array(latencies) * 1000.
+  print('{} requests ({} errors) in {:.2f}s : {:.2f} requests/sec, {:.2f} triple sets/sec'.format(
+    len(bodies), len(errors), elapsed, len(latencies) / elapsed,
+    len(latencies) * args.per_request / elapsed))
+  if len(latencies) > 0:
+    print('Client latency ms p50 {:.1f} p90 {:.1f} p99 {:.1f}'.format(
+      *np.percentile(latencies, [50, 90, 99])))
+
+  connection = http.client.HTTPConnection(args.host, args.port)
+  connection.request('GET', '/stats')
+  print('Server stats : ' + json.dumps(json.loads(connection.getresponse().read().decode('utf-8'))))
+  connection.close()
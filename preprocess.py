@@ -22,8 +22,9 @@ import sentencepiece as spm
 import tensorflow as tf
 from loguru import logger
 
+from src.serving.templates import delexicalize, delexicalize_corpus
 from src.utils.PreprocessingUtils import PreProcess
-from src.utils.model_utils import PreProcessSentence
+from src.utils.model_utils import PreProcessSentence, UNKNOWN_NODE, target_words_by_count
 
 parser = argparse.ArgumentParser(description="preprocessor parser")
 parser.add_argument(
@@ -52,6 +53,10 @@ parser.add_argument(
   '--sentencepiece_model', type=str, required=False, help='SentencePiece model')
 parser.add_argument(
   '--sentencepiece', type=str, required=True, help='Use SentencePiece or not ')
+parser.add_argument(
+  '--delex', type=str, required=False, default='False',
+  help='Replace the entities of the triple sets and of their sentences by slots, '
+       'for the GAT models used with translate.py or serve.py --templates True')
 
 args = parser.parse_args()
 
@@ -59,27 +64,33 @@ if __name__ == '__main__':
   os.makedirs(('vocabs/gat/' + args.lang), exist_ok=True)
 
   if args.model == 'gat':
-    train_nodes, train_labels, train_node1, train_node2 = PreProcess(args.train_src, args.lang)
-    eval_nodes, eval_labels, eval_node1, eval_node2 = PreProcess(args.eval_src, args.lang)
-    test_nodes, test_labels, test_node1, test_node2 = PreProcess(args.test_src, args.lang)
+    train_src, eval_src, test_src = args.train_src, args.eval_src, args.test_src
+    train_tgt = io.open(args.train_tgt, encoding='UTF-8').read().strip().split('\n')
+    eval_tgt = io.open(args.eval_tgt, encoding='UTF-8').read().strip().split('\n')
+    if args.delex == 'True':
+      if args.sentencepiece == 'True':
+        parser.error('--delex is not supported with --sentencepiece')
+      train_src, train_tgt = delexicalize_corpus(args.train_src, train_tgt)
+      eval_src, eval_tgt = delexicalize_corpus(args.eval_src, eval_tgt)
+      test_src = [delexicalize(triples)[0] for triples in
+                  io.open(args.test_src, encoding='UTF-8').read().strip().split('\n')]
+    train_nodes, train_labels, train_node1, train_node2 = PreProcess(train_src, args.lang)
+    eval_nodes, eval_labels, eval_node1, eval_node2 = PreProcess(eval_src, args.lang)
+    test_nodes, test_labels, test_node1, test_node2 = PreProcess(test_src, args.lang)
 
     # Build and save the vocab
     print('Building the  Source Vocab file... ')
-    train_tgt = io.open(args.train_tgt, encoding='UTF-8').read().strip().split('\n')
     train_tgt = [PreProcessSentence(w, args.sentencepiece, args.lang) for w in train_tgt]
     # vocab_train_tgt = [tokenizer(w) for w in train_tgt]
-    eval_tgt = io.open(args.eval_tgt, encoding='UTF-8').read().strip().split('\n')
     eval_tgt = [PreProcessSentence(w, args.sentencepiece, args.lang) for w in eval_tgt]
 
     vocab = tf.keras.preprocessing.text.Tokenizer(filters='')
+    # id of the nodes not seen in training
+    vocab.fit_on_texts([[UNKNOWN_NODE]])
     vocab.fit_on_texts(train_nodes)
     vocab.fit_on_texts(train_labels)
-    vocab.fit_on_texts(train_node1)
-    vocab.fit_on_texts(train_node2)
     vocab.fit_on_texts(eval_nodes)
     vocab.fit_on_texts(eval_labels)
-    vocab.fit_on_texts(eval_node1)
-    vocab.fit_on_texts(eval_node2)
 
     if args.sentencepiece == 'True':
       spm.SentencePieceTrainer.Train('--input={},{} --model_prefix=vocabs/{}/{}/train_vocab'
@@ -93,6 +104,7 @@ if __name__ == '__main__':
     else:
       vocab.fit_on_texts(train_tgt)
       vocab.fit_on_texts(eval_tgt)
+      vocab.target_words = target_words_by_count(train_tgt + eval_tgt)
 
     logger.info('Vocab Size : {}\n'.format(len(vocab.word_index)))
 
@@ -0,0 +1,35 @@
+""" Script to export the int8 compressed weights of a trained GAT-Transformer
+    model, loaded by translate.py --quantized True. The weights are
+    dequantized when loaded, so the file is smaller but the decoding is
+    not faster. Compare the ROUGE / BLEU of both models with
+    benchmark.py --mode decode [--quantized True].
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+
+from src.utils.InferenceUtils import LoadModel
+from src.utils.quantization import build_model, export_quantized, quantized_weights_path
+
+parser = argparse.ArgumentParser(description="Quantization Arguments")
+
+parser.add_argument(
+  '--lang', type=str, required=True, help='Language of the trained model')
+
+args = parser.parse_args()
+
+if __name__ == "__main__":
+  model, src_vocab, tgt_vocab = LoadModel('gat', args.lang)
+  build_model(model)
+
+  path = quantized_weights_path(args.lang)
+  num_quantized = export_quantized(model, path)
+
+  float_size = sum(w.numpy().nbytes for w in model.weights)
+  print('Quantized {} weight matrices to int8'.format(num_quantized))
+  print('Float32 weights {:.2f} MB, int8 weights file {:.2f} MB'.format(
+    float_size / 2 ** 20, os.path.getsize(path) / 2 ** 20))
+  print('Saved to ' + path)
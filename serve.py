@@ -0,0 +1,132 @@
+""" Script to run the local verbalization server, it keeps the trained
+    models of the languages requested loaded and decodes the triple sets
+    of concurrent requests in micro-batches.
+
+    curl -X POST localhost:8080/verbalize \
+      --data 'Dwarak | lives_in | India <TSP> Dwarak | loves | Physics'
+    curl -X POST 'localhost:8080/verbalize?lang=de' \
+      --data 'Dwarak | lives_in | India'
+    curl localhost:8080/stats
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+
+from src.serving.batching import MicroBatcher
+from src.serving.cache import ResultCache
+from src.serving.server import VerbalizationServer
+from src.serving.stats import LatencyStats
+from src.utils.inference_config import load_inference_config, set_thread_pools
+
+parser = argparse.ArgumentParser(description="Server Arguments")
+
+parser.add_argument(
+  '--model', type=str, required=False, default='gat', help='The model used to verbalise the triples')
+parser.add_argument(
+  '--lang', type=str, required=True,
+  help='Language of the target sentences of the requests giving none, its model is loaded at startup')
+parser.add_argument(
+  '--sentencepiece', type=str, required=False, default='False', help='Use sentencepiece or not')
+parser.add_argument(
+  '--host', type=str, required=False, default='127.0.0.1', help='Address the server listens on')
+parser.add_argument(
+  '--port', type=int, required=False, default=8080, help='Port the server listens on')
+parser.add_argument(
+  '--max_batch_size', type=int, required=False, default=None,
+  help='Maximum number of triple sets decoded together, defaults to the batch size of the '
+       'inference config written by autotune.py, else 32')
+parser.add_argument(
+  '--max_wait_ms', type=float, required=False, default=10.,
+  help='Maximum time a triple set waits for others to fill its batch')
+parser.add_argument(
+  '--intra_op_threads', type=int, required=False, default=0,
+  help='Threads used inside a TensorFlow op, 0 for the inference config, else the TensorFlow default')
+parser.add_argument(
+  '--inter_op_threads', type=int, required=False, default=0,
+  help='TensorFlow ops run in parallel, 0 for the inference config, else the TensorFlow default')
+parser.add_argument(
+  '--eager', type=str, required=False, default='False',
+  help='Run the predict step eagerly instead of as a tf.function graph (debugging)')
+parser.add_argument(
+  '--xla', type=str, required=False, default='False', help='Use XLA JIT compilation for the predict step')
+parser.add_argument(
+  '--dtype', type=str, required=False, default=None,
+  help='Compute dtype used for inference float32 | bfloat16, defaults to the training one')
+parser.add_argument(
+  '--quantized', type=str, required=False, default='False',
+  help='Load the model from the int8 file exported by quantize.py instead of the checkpoint, '
+       'a smaller file but not a faster model')
+parser.add_argument(
+  '--saved_model', type=str, required=False, default=None,
+  help='Directory of a model exported by export.py, used instead of the training checkpoint, '
+       '{lang} is replaced by the language of the model')
+parser.add_argument(
+  '--langs', type=str, required=False, default=None,
+  help='Comma separated languages the requests can ask for, defaults to the ones '
+       'with a trained model on disk, requests for others get a 400')
+parser.add_argument(
+  '--memory_budget_mb', type=float, required=False, default=None,
+  help='Memory the weights of the loaded models can use, the least recently used '
+       'ones are evicted above it')
+
+parser.add_argument(
+  '--cache_size', type=int, required=False, default=10000,
+  help='Number of verbalizations cached in memory, 0 to disable the cache')
+parser.add_argument(
+  '--cache', type=str, required=False, default=None,
+  help='Path of the sqlite file persisting the cached verbalizations')
+parser.add_argument(
+  '--templates', type=str, required=False, default='False',
+  help='Verbalize and cache the delexicalized patterns of the triple sets and put their '
+       'entities back in the sentences, needs models preprocessed with --delex True')
+parser.add_argument(
+  '--stand_in', type=str, required=False, default='False',
+  help='Answer with the entities of the triple sets instead of loading a model, '
+       'to test the clients without TensorFlow')
+parser.add_argument(
+  '--stand_in_delay_ms', type=float, required=False, default=20.,
+  help='Time the stand-in takes to decode a batch')
+
+args = parser.parse_args()
+
+if __name__ == "__main__":
+  config = load_inference_config(args.lang)
+  if args.max_batch_size is None:
+    args.max_batch_size = config.get('batch_size', 32)
+  if args.stand_in == 'True':
+    from src.serving.standin import StandInRegistry
+
+    registry = StandInRegistry(args, args.stand_in_delay_ms)
+  else:
+    # TensorFlow is only imported when serving models
+    from src.serving.registry import ModelRegistry
+
+    set_thread_pools(args.intra_op_threads or config.get('intra_op_parallelism', 0),
+                     args.inter_op_threads or config.get('inter_op_parallelism', 0))
+    registry = ModelRegistry(args, args.memory_budget_mb,
+                             args.langs.split(',') if args.langs else None)
+    if args.templates == 'True':
+      from src.serving.templates import check_template_vocab
+
+      check_template_vocab(registry.get(args.lang).src_vocab)
+    else:
+      registry.get(args.lang)
+  stats = LatencyStats()
+  cache = None
+  if args.cache_size > 0:
+    cache = ResultCache(args.lang, registry.version(args.lang), args.cache_size, args.cache)
+  batcher = MicroBatcher(registry.verbalize, args.max_batch_size, args.max_wait_ms, stats)
+  server = VerbalizationServer((args.host, args.port), registry, batcher, stats, cache,
+                               templates=args.templates == 'True')
+  print('Serving the ' + args.lang + ' model on http://{}:{}'.format(args.host, args.port))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    batcher.stop()
+    if cache is not None:
+      cache.close()
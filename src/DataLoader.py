@@ -8,7 +8,8 @@ import pickle
 import sentencepiece as spm
 import tensorflow as tf
 
-from src.utils.model_utils import max_length, _tensorize, Padding as padding
+from src.utils.model_utils import decode_length_table, max_length, _tensorize, _tensorize_indices, \
+  _tensorize_nodes, Padding as padding
 
 
 def LoadDataset(train_path, eval_path, test_path,
@@ -88,20 +89,20 @@ def LoadGatDataset(train_path, eval_path, test_path, srv_vocab,
   (eval_nodes, eval_labels, eval_node1, eval_node2) = zip(*eval_input)
   (test_nodes, test_labels, test_node1, test_node2) = zip(*test_set)
 
-  train_["train_node_tensor"] = _tensorize(src_vocab, train_nodes)
+  train_["train_node_tensor"] = _tensorize_nodes(src_vocab, train_nodes)
   train_["train_label_tensor"] = _tensorize(src_vocab, train_labels)
-  train_["train_node1_tensor"] = _tensorize(src_vocab, train_node1)
-  train_["train_node2_tensor"] = _tensorize(src_vocab, train_node2)
+  train_["train_node1_tensor"] = _tensorize_indices(train_node1)
+  train_["train_node2_tensor"] = _tensorize_indices(train_node2)
 
-  eval_["eval_node_tensor"] = _tensorize(src_vocab, eval_nodes)
+  eval_["eval_node_tensor"] = _tensorize_nodes(src_vocab, eval_nodes)
   eval_["eval_label_tensor"] = _tensorize(src_vocab, eval_labels)
-  eval_["eval_node1_tensor"] = _tensorize(src_vocab, eval_node1)
-  eval_["eval_node2_tensor"] = _tensorize(src_vocab, eval_node2)
+  eval_["eval_node1_tensor"] = _tensorize_indices(eval_node1)
+  eval_["eval_node2_tensor"] = _tensorize_indices(eval_node2)
 
-  test_["test_node_tensor"] = _tensorize(src_vocab, test_nodes)
+  test_["test_node_tensor"] = _tensorize_nodes(src_vocab, test_nodes)
   test_["test_label_tensor"] = _tensorize(src_vocab, test_labels)
-  test_["test_node1_tensor"] = _tensorize(src_vocab, test_node1)
-  test_["test_node2_tensor"] = _tensorize(src_vocab, test_node2)
+  test_["test_node1_tensor"] = _tensorize_indices(test_node1)
+  test_["test_node2_tensor"] = _tensorize_indices(test_node2)
 
   if sentencepiece == 'True':
     train_tgt_tensor = [sp.encode_as_ids(w) for w in train_tgt]
@@ -186,6 +187,8 @@ def GetGATDataset(args, set=None):
     tgt_vocab_size = len(tgt_vocab.word_index) + 1
 
   dataset_size = train["train_tgt_tensor"].shape[0]
+  decode_lengths = decode_length_table(train["train_label_tensor"], train["train_tgt_tensor"],
+                                       getattr(args, 'decode_margin', 0.2), max_length_targ)
 
   dataset = tf.data.Dataset.from_tensor_slices((node_tensor, label_tensor,
                                                 node1_tensor, node2_tensor, train["train_tgt_tensor"])).shuffle(
@@ -207,7 +210,7 @@ def GetGATDataset(args, set=None):
   if set == None:
     return (dataset, eval_set, test_set, TRAIN_BUFFER_SIZE, BATCH_SIZE, steps_per_epoch,
             src_vocab_size, src_vocab, tgt_vocab_size, tgt_vocab,
-            max_length_targ, dataset_size)
+            max_length_targ, dataset_size, decode_lengths)
   elif set == 'test':
     return (test_set, TRAIN_BUFFER_SIZE, BATCH_SIZE, steps_per_epoch,
             src_vocab_size, src_vocab, tgt_vocab_size, tgt_vocab)
@@ -7,7 +7,8 @@ import sentencepiece as spm
 import tensorflow as tf
 
 from src.utils.PreprocessingUtils import PreProcess
-from src.utils.model_utils import PreProcessSentence, _tensorize, Padding as padding
+from src.utils.model_utils import PreProcessSentence, UNKNOWN_NODE, _tensorize, \
+  _tensorize_indices, _tensorize_nodes, target_words_by_count, Padding as padding
 
 languages = ['eng', 'ger', 'rus']
 
@@ -37,7 +38,10 @@ def LoadMultlingualDataset(args):
 
   # create vocabs for the source
   src_vocab = tf.keras.preprocessing.text.Tokenizer(filters='')
+  # id of the nodes not seen in training
+  src_vocab.fit_on_texts([[UNKNOWN_NODE]])
   target_str = ''
+  target_sentences = []
   spl_sym = DATA_PATH + 'special_symbols'
 
   for lang in languages:
@@ -61,16 +65,13 @@ def LoadMultlingualDataset(args):
     # fit the vocab
     src_vocab.fit_on_texts(dataset[lang + '_train_nodes'])
     src_vocab.fit_on_texts(dataset[lang + '_train_labels'])
-    src_vocab.fit_on_texts(dataset[lang + '_train_node1'])
-    src_vocab.fit_on_texts(dataset[lang + '_train_node2'])
     src_vocab.fit_on_texts(dataset[lang + '_eval_nodes'])
     src_vocab.fit_on_texts(dataset[lang + '_eval_labels'])
-    src_vocab.fit_on_texts(dataset[lang + '_eval_node1'])
-    src_vocab.fit_on_texts(dataset[lang + '_eval_node2'])
 
     if args.sentencepiece == 'False':
       src_vocab.fit_on_texts(dataset[lang + '_train_tgt'])
       src_vocab.fit_on_texts(dataset[lang + '_eval_tgt'])
+      target_sentences += dataset[lang + '_train_tgt'] + dataset[lang + '_eval_tgt']
 
   if args.sentencepiece == 'True':
     print('Tragers : ' + target_str)
@@ -85,6 +86,7 @@ def LoadMultlingualDataset(args):
   if args.sentencepiece == 'True':
     return dataset, src_vocab, sp
   else:
+    src_vocab.target_words = target_words_by_count(target_sentences)
     return dataset, src_vocab, src_vocab
 
 
@@ -131,13 +133,13 @@ def ProcessMultilingualDataset(args, set=None):
 
     for part in ['train', 'eval', 'test']:
       dataset[lang + '_' + part + '_nodes'] = padding(
-        _tensorize(src_vocab, dataset[lang + '_' + part + '_nodes']), 16)
+        _tensorize_nodes(src_vocab, dataset[lang + '_' + part + '_nodes']), 16)
       dataset[lang + '_' + part + '_labels'] = padding(
         _tensorize(src_vocab, dataset[lang + '_' + part + '_labels']), 16)
       dataset[lang + '_' + part + '_node1'] = padding(
-        _tensorize(src_vocab, dataset[lang + '_' + part + '_node1']), 16)
+        _tensorize_indices(dataset[lang + '_' + part + '_node1']), 16)
       dataset[lang + '_' + part + '_node2'] = padding(
-        _tensorize(src_vocab, dataset[lang + '_' + part + '_node2']), 16)
+        _tensorize_indices(dataset[lang + '_' + part + '_node2']), 16)
 
     TRAIN_BUFFER_SIZE += (dataset[lang + '_train_nodes']).shape[0]
     EVAL_BUFFER_SIZE += (dataset[lang + '_eval_nodes']).shape[0]
@@ -65,6 +65,26 @@ parser.add_argument(
   '--checkpoint', type=int, required=False, help='Save checkpoint every these steps')
 parser.add_argument(
   '--checkpoint_dir', type=str, required=False, help='Path to checkpoints')
+parser.add_argument(
+  '--eager', type=str, required=False, default='False',
+  help='Run the train, eval and predict steps eagerly instead of as tf.function graphs (debugging)')
+parser.add_argument(
+  '--xla', type=str, required=False, default='False', help='Use XLA JIT compilation for the compiled steps')
+parser.add_argument(
+  '--dtype', type=str, required=False, default='float32',
+  help='Compute dtype of the model float32 | bfloat16 (variables stay float32)')
+parser.add_argument(
+  '--num_sampled', type=int, required=False, default=0,
+  help='Train with a sampled softmax loss over this many sampled target tokens, '
+       '0 for the full softmax (eval always uses the full softmax)')
+parser.add_argument(
+  '--accum_steps', type=int, required=False, default=1,
+  help='Sum the gradients of this many batches before each optimizer update, '
+       'the effective batch size is batch_size * accum_steps')
+parser.add_argument(
+  '--decode_margin', type=float, required=False, default=0.2,
+  help='Fraction added to the longest training target of graphs with as many edges, '
+       'to get the maximum decode length of an input')
 
 parser.add_argument(
   '--epochs', type=int, default=None,
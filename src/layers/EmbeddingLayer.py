@@ -40,51 +40,64 @@ class EmbeddingSharedWeights(tf.keras.layers.Layer):
       "hidden_size": self.hidden_size,
     }
 
-  def call(self, inputs, mode="embedding"):
+  def call(self, inputs, mode="embedding", shortlist=None):
     """Get token embeddings of inputs.
 
     Args:
       inputs: An int64 tensor with shape [batch_size, length]
       mode: string, a valid value is one of "embedding" and "linear".
+      shortlist: (Used in "linear" mode) optional int32 tensor with shape
+        [shortlist_size] of the vocab ids the logits are computed for.
     Returns:
       outputs: (1) If mode == "embedding", output embedding tensor, float32 with
         shape [batch_size, length, embedding_size]; (2) mode == "linear", output
-        linear tensor, float32 with shape [batch_size, length, vocab_size].
+        linear tensor, float32 with shape [batch_size, length, vocab_size], or
+        [batch_size, length, shortlist_size] if a shortlist is given.
     Raises:
       ValueError: if mode is not valid.
     """
     if mode == "embedding":
       return self._embedding(inputs)
     elif mode == "linear":
-      return self._linear(inputs)
+      return self._linear(inputs, shortlist)
     else:
       raise ValueError("mode {} is not valid.".format(mode))
 
   def _embedding(self, inputs):
     """Applies embedding based on inputs tensor."""
     with tf.name_scope("embedding"):
-      # Create binary mask of size [batch_size, length]
-      mask = tf.cast(tf.not_equal(inputs, 0), tf.float32)
       embeddings = tf.gather(self.shared_weights, inputs)
+      # Create binary mask of size [batch_size, length]
+      mask = tf.cast(tf.not_equal(inputs, 0), embeddings.dtype)
       embeddings *= tf.expand_dims(mask, -1)
       # Scale embedding by the sqrt of the hidden size
       embeddings *= self.hidden_size ** 0.5
 
       return embeddings
 
-  def _linear(self, inputs):
+  def _linear(self, inputs, shortlist=None):
     """Computes logits by running inputs through a linear layer.
 
     Args:
       inputs: A float32 tensor with shape [batch_size, length, hidden_size]
+      shortlist: optional int32 tensor with the vocab ids to compute logits
+        for, the projection then only uses those rows of the weights.
     Returns:
-      float32 tensor with shape [batch_size, length, vocab_size].
+      float32 tensor with shape [batch_size, length, vocab_size], or
+      [batch_size, length, shortlist_size] if a shortlist is given.
     """
     with tf.name_scope("presoftmax_linear"):
       batch_size = tf.shape(inputs)[0]
       length = tf.shape(inputs)[1]
 
+      if shortlist is None:
+        weights = self.shared_weights
+        vocab_size = self.vocab_size
+      else:
+        weights = tf.gather(self.shared_weights, shortlist)
+        vocab_size = tf.shape(shortlist)[0]
+
       x = tf.reshape(inputs, [-1, self.hidden_size])
-      logits = tf.matmul(x, self.shared_weights, transpose_b=True)
+      logits = tf.matmul(x, weights, transpose_b=True)
 
-      return tf.reshape(logits, [batch_size, length, self.vocab_size])
+      return tf.reshape(logits, [batch_size, length, vocab_size])
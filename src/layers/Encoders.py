@@ -31,14 +31,18 @@ class GraphEncoder(tf.keras.layers.Layer):
     self.dropout = tf.keras.layers.Dropout(rate)
     self.layernorm = tf.contrib.layers.layer_norm
 
-  def call(self, node_tensor, label_tensor, node1_tensor, node2_tensor, num_heads, training):
-    # adding embedding and position encoding.
-
-    edge_tensor = tf.concat([node1_tensor, node2_tensor], 2)
-    edge_tensor = tf.cast(self.node_role_layer(edge_tensor), dtype=tf.float32)
+  def call(self, node_tensor, label_tensor, labels, node1, node2, num_heads, training):
+    # the edge features are the embeddings of their end nodes, gathered
+    # by position from the embedded nodes. Padding edges (label 0) are
+    # zeroed, like the embedding layer does for padding ids.
+    edge_mask = tf.cast(tf.not_equal(labels, 0), node_tensor.dtype)
+    node1_tensor = tf.gather(node_tensor, node1, batch_dims=1)
+    node2_tensor = tf.gather(node_tensor, node2, batch_dims=1)
+    edge_tensor = tf.concat([node1_tensor, node2_tensor], 2) * tf.expand_dims(edge_mask, -1)
+    edge_tensor = tf.cast(self.node_role_layer(edge_tensor), dtype=node_tensor.dtype)
     # node_tensor = tf.add(node_tensor, role_tensor)
-    node_tensor *= tf.math.sqrt(tf.cast(self.d_model, tf.float32))
-    edge_tensor *= tf.math.sqrt(tf.cast(self.d_model, tf.float32))
+    node_tensor *= tf.math.sqrt(tf.cast(self.d_model, node_tensor.dtype))
+    edge_tensor *= tf.math.sqrt(tf.cast(self.d_model, node_tensor.dtype))
     # node_tensor += self.node_pos_enc[:, :node_seq_len, :]
 
     for i, layer in enumerate(self.enc_layers):
@@ -51,7 +55,9 @@ class GraphEncoder(tf.keras.layers.Layer):
         x = self.enc_layers[i][1](x, training=self.trainable)
         x += shortcut
 
-    return self.layernorm(x)  # (batch_size, input_seq_len, d_model)
+    # layer norm is always computed in float32
+    output = self.layernorm(tf.cast(x, tf.float32))
+    return tf.cast(output, x.dtype)  # (batch_size, input_seq_len, d_model)
 
 
 class RNNEncoder(tf.keras.layers.Layer):
@@ -6,6 +6,8 @@ from __future__ import print_function
 
 import tensorflow as tf
 
+from src.layers.AttentionLayer import _float32_softmax
+
 tf.enable_eager_execution()
 
 
@@ -72,7 +74,7 @@ class GraphAttentionLayer(tf.keras.layers.Layer):
       # dense += mask_local
 
       # Apply softmax to get attention coefficients
-      dense = tf.math.softmax(dense)  # (N x N)
+      dense = _float32_softmax(dense)  # (N x N)
 
       # Apply dropout to features and attention coefficients
       if training is True:
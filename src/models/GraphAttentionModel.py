@@ -12,8 +12,14 @@ from src.layers.Encoders import GraphEncoder
 from src.models.Transformer import DecoderStack
 from src.utils import TransformerUtils
 from src.utils import beam_search
+from src.utils import greedy_search
+from src.utils import sampling
+from src.utils import speculative
 from src.utils.metrics import MetricLayer
-from src.utils.model_utils import loss_function
+from src.utils.model_utils import get_compute_dtype, loss_function
+
+# Id of the token that ends the decoded sequences
+EOS_ID = 6
 
 
 class GATModel(tf.keras.Model):
@@ -52,10 +58,8 @@ class GATModel(tf.keras.Model):
     """
     node_tensor = tf.cast(self.emb_layer(nodes), dtype=tf.flaot32)
     label_tensor = tf.cast(self.emb_layer(labels), dtype=tf.float32)
-    node1_tensor = tf.cast(self.emb_layer(node1), dtype=tf.float32)
-    node2_tensor = tf.cast(self.emb_layer(node2), dtype=tf.float32)
 
-    enc_output = self.encoder(node_tensor, label_tensor, node1_tensor, node2_tensor,
+    enc_output = self.encoder(node_tensor, label_tensor, labels, node1, node2,
                               self.num_heads, self.encoder.trainable)
     batch = enc_output.shape[0]
     self.enc_output_hidden = tf.reshape(enc_output, shape=[batch, -1])
@@ -100,19 +104,33 @@ class TransGAT(tf.keras.Model):
     self.args = args
     self.num_heads = args.num_heads
     self.max_len = max_seq_len
+    # dtype the layers compute in, variables, softmax, layer norm
+    # and the loss stay in float32.
+    self.float_dtype = get_compute_dtype(args)
+    # decode with the greedy search instead of the beam search when
+    # the beam size is 1
+    self.greedy_decoding = True
+    # drop the finished sentences from the beam search every
+    # compact_every steps, 0 to keep the whole batch until the end
+    self.compact_every = 0
+    # maximum decode length indexed by the number of edges of the input
+    # graph, fitted on the training set (decode_length_table), None to
+    # always decode up to max_len
+    self.decode_lengths = None
     if self.args.distillation == 'True':
       self.temp = tf.constant(self.args.temp
                               , dtype=tf.float32)
     else:
       self.temp = tf.constant(1, dtype=tf.float32)
 
-  def _get_symbols_to_logits_fn(self, max_decode_length, training):
-    """Returns a decoding function that calculates logits of the next tokens."""
+  def _get_symbols_to_logits_fn(self, max_decode_length, training, shortlist=None):
+    """Returns a decoding function that calculates logits of the next tokens.
 
-    timing_signal = TransformerUtils.get_position_encoding(
-      max_decode_length + 1, self.args.emb_dim)
-    decoder_self_attention_bias = TransformerUtils.get_decoder_self_attention_bias(
-      max_decode_length)
+    If a shortlist is given the ids are positions in the shortlist, and
+    logits are only calculated for the shortlisted vocab ids.
+    """
+
+    block_logits_fn = self._get_block_logits_fn(max_decode_length, training, shortlist)
 
     def symbols_to_logits_fn(ids, i, cache):
       """Generate logits for next potential IDs.
@@ -128,13 +146,46 @@ class TransGAT(tf.keras.Model):
            updated cache values)
       """
       # Set decoder input to the last generated IDs
-      decoder_input = ids[:, -1:]
+      logits, cache = block_logits_fn(ids[:, -1:], i, cache)
+      return tf.squeeze(logits, axis=[1]), cache
+
+    return symbols_to_logits_fn
+
+  def _get_block_logits_fn(self, max_decode_length, training, shortlist=None):
+    """Returns a decoding function that calculates the logits of a block of
+    consecutive ids at once, from the decoder cache of the previous ids."""
+
+    timing_signal = TransformerUtils.get_position_encoding(
+      max_decode_length + 1, self.args.emb_dim)
+    timing_signal = tf.cast(timing_signal, self.float_dtype)
+    decoder_self_attention_bias = TransformerUtils.get_decoder_self_attention_bias(
+      max_decode_length, dtype=self.float_dtype)
+
+    def block_logits_fn(ids, i, cache):
+      """Generate logits for the ids following each id of the block.
+      Args:
+        ids: int tensor with shape [batch_size, block_length], the ids at
+          positions i to i + block_length - 1
+        i: Position of the first id of the block
+        cache: dictionary of values storing the encoder output, encoder-decoder
+          attention bias, and the decoder attention values of the i previous
+          positions.
+      Returns:
+        Tuple of
+          (logits with shape [batch_size, block_length, vocab_size],
+           updated cache values)
+      """
+      block_length = tf.shape(ids)[1]
+      decoder_input = ids
+      if shortlist is not None:
+        decoder_input = tf.gather(shortlist, decoder_input)
 
       # Preprocess decoder input by getting embeddings and adding timing signal.
       decoder_input = self.tgt_emb_layer(decoder_input)
-      decoder_input += timing_signal[i:i + 1]
+      decoder_input += timing_signal[i:i + block_length]
 
-      self_attention_bias = decoder_self_attention_bias[:, :, i:i + 1, :i + 1]
+      self_attention_bias = decoder_self_attention_bias[:, :, i:i + block_length,
+                                                        :i + block_length]
       decoder_outputs = self.decoder_stack(
         decoder_input,
         cache.get("encoder_outputs"),
@@ -142,48 +193,184 @@ class TransGAT(tf.keras.Model):
         cache.get("encoder_decoder_attention_bias"),
         training=training,
         cache=cache)
-      logits = self.tgt_emb_layer(decoder_outputs, mode="linear")
-      logits = tf.squeeze(logits, axis=[1])
-      return logits, cache
+      logits = self.tgt_emb_layer(decoder_outputs, mode="linear", shortlist=shortlist)
+      return tf.cast(logits, tf.float32), cache
 
-    return symbols_to_logits_fn
+    return block_logits_fn
 
-  def predict(self, encoder_outputs, encoder_decoder_attention_bias, training):
-    """Return predicted sequence."""
-    encoder_outputs = tf.cast(encoder_outputs, tf.float32)
-    batch_size = tf.shape(encoder_outputs)[0]
-    input_length = tf.shape(encoder_outputs)[1]
-    max_decode_length = self.max_len
+  def _max_decode_length(self, labels):
+    """Maximum decode length of the batch, from the number of edges of its
+    largest graph when the decode length table is known."""
+    if self.decode_lengths is None or labels is None:
+      return self.max_len
+    num_edges = tf.math.count_nonzero(labels, axis=1, dtype=tf.int32)
+    num_edges = tf.minimum(num_edges, len(self.decode_lengths) - 1)
 
-    symbols_to_logits_fn = self._get_symbols_to_logits_fn(
-      max_decode_length, training)
+    return tf.reduce_max(tf.gather(tf.constant(self.decode_lengths, tf.int32), num_edges))
+
+  def _initial_decoder_state(self, encoder_outputs, encoder_decoder_attention_bias):
+    """Returns the start ids and the empty decoder cache of a batch."""
+    encoder_outputs = tf.cast(encoder_outputs, self.float_dtype)
+    batch_size = tf.shape(encoder_outputs)[0]
     # Create initial set of IDs that will be passed into symbols_to_logits_fn.
     initial_ids = tf.zeros([batch_size], dtype=tf.int32)
     cache = {
       "layer_%d" % layer: {
-        "k": tf.zeros([batch_size, 0, self.args.hidden_size]),
-        "v": tf.zeros([batch_size, 0, self.args.hidden_size])
-      } for layer in range(self.args.enc_layers)
+        "k": tf.zeros([batch_size, 0, self.args.hidden_size], dtype=self.float_dtype),
+        "v": tf.zeros([batch_size, 0, self.args.hidden_size], dtype=self.float_dtype)
+      } for layer in range(self.args.dec_layers)
     }
     cache["encoder_outputs"] = encoder_outputs
     cache["encoder_decoder_attention_bias"] = encoder_decoder_attention_bias
+
+    return initial_ids, cache
+
+  def predict(self, encoder_outputs, encoder_decoder_attention_bias, training,
+              shortlist=None, labels=None):
+    """Return predicted sequence, and the beam_size best sequences with
+    their scores as nbest_outputs and nbest_scores.
+
+    shortlist is an optional int32 tensor of candidate target ids for the
+    batch, the search then only runs over those ids. shortlist[0] must be
+    the padding id 0 and shortlist[1] the EOS_ID.
+    labels are the edge labels of the input graphs, used to size the
+    search from the number of edges instead of the longest training target.
+    """
+    max_decode_length = self._max_decode_length(labels)
+
+    symbols_to_logits_fn = self._get_symbols_to_logits_fn(
+      max_decode_length, training, shortlist)
+    initial_ids, cache = self._initial_decoder_state(encoder_outputs,
+                                                     encoder_decoder_attention_bias)
     # Use beam search to find the top beam_size sequences and scores.
-    decoded_ids, scores = beam_search.sequence_beam_search(
+    if shortlist is None:
+      vocab_size, eos_id = self.vocab_tgt_size, EOS_ID
+    else:
+      vocab_size, eos_id = tf.shape(shortlist)[0], 1
+    if self.args.beam_size == 1 and self.greedy_decoding:
+      decoded_ids, scores = greedy_search.sequence_greedy_search(
+        symbols_to_logits_fn=symbols_to_logits_fn,
+        initial_ids=initial_ids,
+        initial_cache=cache,
+        alpha=self.args.beam_alpha,
+        max_decode_length=max_decode_length,
+        eos_id=eos_id)
+    else:
+      decoded_ids, scores = beam_search.sequence_beam_search(
+        symbols_to_logits_fn=symbols_to_logits_fn,
+        initial_ids=initial_ids,
+        initial_cache=cache,
+        vocab_size=vocab_size,
+        beam_size=self.args.beam_size,
+        alpha=self.args.beam_alpha,
+        max_decode_length=max_decode_length,
+        eos_id=eos_id,
+        compact_every=self.compact_every,
+        decode_length_cap=self.max_len)
+
+    if shortlist is not None:
+      # map the shortlist positions back to vocab ids
+      decoded_ids = tf.gather(shortlist, decoded_ids)
+
+    # Get the top sequence for each batch element, and all the hypotheses
+    # ordered by score for n-best output
+    top_decoded_ids = decoded_ids[:, 0, 1:]
+    top_scores = scores[:, 0]
+    return {"outputs": top_decoded_ids, "scores": top_scores,
+            "nbest_outputs": decoded_ids[:, :, 1:], "nbest_scores": scores}
+
+  def sample(self, nodes, labels, node1, node2, num_samples, temperature=1.0,
+             top_k=0, top_p=1.0):
+    """
+    Samples several verbalisations of every input graph, the graphs are
+    encoded once and their samples decoded in one batch.
+    :param nodes: node features
+    :type nodes: tf.tensor
+    :param num_samples: number of sentences sampled per graph
+    :type num_samples: int
+    :param temperature: the logits are divided by the temperature
+    :type temperature: float
+    :param top_k: sample from the top_k most probable tokens, 0 for all
+    :type top_k: int
+    :param top_p: sample from the most probable tokens whose cumulative
+                  probability reaches top_p, 1.0 for all
+    :type top_p: float
+    :return: sampled ids [batch, num_samples, length] and their
+             log probabilities [batch, num_samples]
+    :rtype: dict
+    """
+    enc_output, attention_bias = self._encode(nodes, labels, node1, node2)
+    max_decode_length = self._max_decode_length(labels)
+
+    symbols_to_logits_fn = self._get_symbols_to_logits_fn(max_decode_length, False)
+    initial_ids, cache = self._initial_decoder_state(enc_output, attention_bias)
+    sampled_ids, scores = sampling.sequence_sample(
       symbols_to_logits_fn=symbols_to_logits_fn,
       initial_ids=initial_ids,
       initial_cache=cache,
-      vocab_size=self.vocab_tgt_size,
-      beam_size=self.args.beam_size,
+      num_samples=num_samples,
       alpha=self.args.beam_alpha,
       max_decode_length=max_decode_length,
-      eos_id=6)
+      eos_id=EOS_ID,
+      temperature=temperature,
+      top_k=top_k,
+      top_p=top_p)
 
-    # Get the top sequence for each batch element
-    top_decoded_ids = decoded_ids[:, 0, 1:]
-    top_scores = scores[:, 0]
-    return {"outputs": top_decoded_ids, "scores": top_scores}
+    return {"outputs": sampled_ids[:, :, 1:], "scores": scores}
+
+  def speculate(self, draft_model, nodes, labels, node1, node2, draft_steps=4):
+    """
+    Greedy decoding where a smaller draft model, e.g. the distilled
+    student, proposes draft_steps ids that this model verifies in one
+    forward pass. The output is the greedy output of this model.
+    :param draft_model: The draft model, with the same vocabs
+    :type draft_model: TransGAT
+    :param nodes: node features
+    :type nodes: tf.tensor
+    :param draft_steps: number of ids proposed every step
+    :type draft_steps: int
+    :return: decoded ids and scores like predict, and the number of forward
+             passes of this model as target_steps
+    :rtype: dict
+    """
+    enc_output, attention_bias = self._encode(nodes, labels, node1, node2)
+    draft_output, draft_bias = draft_model._encode(nodes, labels, node1, node2)
+    max_decode_length = self._max_decode_length(labels)
+
+    # the last step runs up to draft_steps positions past the maximum length
+    target_fn = self._get_block_logits_fn(max_decode_length + draft_steps, False)
+    draft_fn = draft_model._get_block_logits_fn(max_decode_length + draft_steps, False)
+    initial_ids, target_cache = self._initial_decoder_state(enc_output, attention_bias)
+    _, draft_cache = draft_model._initial_decoder_state(draft_output, draft_bias)
+    decoded_ids, scores, target_steps = speculative.sequence_speculative_search(
+      target_fn=target_fn,
+      draft_fn=draft_fn,
+      initial_ids=initial_ids,
+      target_cache=target_cache,
+      draft_cache=draft_cache,
+      draft_steps=draft_steps,
+      alpha=self.args.beam_alpha,
+      max_decode_length=max_decode_length,
+      eos_id=EOS_ID)
+
+    return {"outputs": decoded_ids[:, 0, 1:], "scores": scores[:, 0],
+            "target_steps": target_steps}
 
-  def __call__(self, nodes, labels, node1, node2, targ, mask):
+  def _encode(self, nodes, labels, node1, node2):
+    """Returns the encoder outputs and the encoder-decoder attention bias."""
+    node_tensor = tf.cast(self.emb_layer(nodes), dtype=self.float_dtype)
+    label_tensor = tf.cast(self.emb_layer(labels), dtype=self.float_dtype)
+
+    # the edge end points are positions in the node list
+    enc_output = self.encoder(node_tensor, label_tensor, labels, node1, node2,
+                              self.num_heads, self.encoder.trainable)
+    attention_bias = TransformerUtils.get_padding_bias(nodes)
+    attention_bias = tf.cast(attention_bias, self.float_dtype)
+
+    return enc_output, attention_bias
+
+  def __call__(self, nodes, labels, node1, node2, targ, mask, shortlist=None,
+               hidden_only=False):
     """
     Puts the tensors through encoders and decoders
     :param adj: Adjacency matrices of input example
@@ -192,35 +379,31 @@ class TransGAT(tf.keras.Model):
     :type nodes: tf.tensor
     :param targ: target sequences
     :type targ: tf.tensor
+    :param shortlist: candidate target ids used when decoding (targ is None)
+    :type shortlist: tf.tensor
+    :param hidden_only: return the decoder outputs before the output
+                        projection, used by the sampled softmax loss
+    :type hidden_only: bool
     :return: output probability distribution
     :rtype: tf.tensor
     """
-    node_tensor = self.emb_layer(nodes)
-    label_tensor = tf.cast(self.emb_layer(labels), dtype=tf.float32)
-    node1_tensor = tf.cast(self.emb_layer(node1), dtype=tf.float32)
-    node2_tensor = tf.cast(self.emb_layer(node2), dtype=tf.float32)
-
-    enc_output = self.encoder(node_tensor, label_tensor, node1_tensor, node2_tensor,
-                              self.num_heads, self.encoder.trainable)
-    attention_bias = TransformerUtils.get_padding_bias(nodes)
-    attention_bias = tf.cast(attention_bias, tf.float32)
+    enc_output, attention_bias = self._encode(nodes, labels, node1, node2)
 
     if targ is not None:
-      decoder_inputs = tf.cast(self.tgt_emb_layer(targ), dtype=tf.float32)
+      decoder_inputs = tf.cast(self.tgt_emb_layer(targ), dtype=self.float_dtype)
     else:
-      predictions = self.predict(enc_output, attention_bias, False)
+      predictions = self.predict(enc_output, attention_bias, False, shortlist, labels)
       return predictions
 
     with tf.name_scope("shift_targets"):
       # Shift targets to the right, and remove the last element
       decoder_inputs = tf.pad(decoder_inputs,
                               [[0, 0], [1, 0], [0, 0]])[:, :-1, :]
-    attention_bias = tf.cast(attention_bias, tf.float32)
     with tf.name_scope("add_pos_encoding"):
       length = tf.shape(decoder_inputs)[1]
       pos_encoding = TransformerUtils.get_position_encoding(
         length, self.args.hidden_size)
-      pos_encoding = tf.cast(pos_encoding, tf.float32)
+      pos_encoding = tf.cast(pos_encoding, self.float_dtype)
       decoder_inputs += pos_encoding
     if self.trainable:
       decoder_inputs = tf.nn.dropout(
@@ -228,13 +411,15 @@ class TransGAT(tf.keras.Model):
 
       # Run values
     decoder_self_attention_bias = TransformerUtils.get_decoder_self_attention_bias(
-      length, dtype=tf.float32)
+      length, dtype=self.float_dtype)
     outputs = self.decoder_stack(
       decoder_inputs,
       enc_output,
       decoder_self_attention_bias,
       attention_bias,
       training=self.trainable)
+    if hidden_only:
+      return outputs
 
     logits = self.tgt_emb_layer(outputs, mode="linear")
     logits = tf.cast(logits, tf.float32)
@@ -0,0 +1,267 @@
+"""
+Asyncio client of the verbalization server (serve.py).
+
+Requests are pipelined over a small pool of keep-alive HTTP/1.1
+connections: up to max_pipeline requests are written on a connection
+before their responses are read back, in order. With batch_size, the
+triple sets of concurrent verbalize calls are also sent together in one
+request. Timed out requests and dropped connections are retried.
+
+  client = VerbalizerClient('127.0.0.1', 8080, batch_size=16)
+  sentence, score = await client.verbalize('Dwarak | lives_in | India')
+  await client.close()
+
+Only the standard library is used, the client runs on Python 3.6.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import asyncio
+import collections
+import json
+
+
+class VerbalizerError(Exception):
+  """Error response of the server, or a request failing after its retries."""
+
+  def __init__(self, message, status=None):
+    super(VerbalizerError, self).__init__(message)
+    self.status = status
+
+
+class _Connection(object):
+  """A keep-alive connection, its responses are matched to the requests in order."""
+
+  def __init__(self, reader, writer):
+    self.reader = reader
+    self.writer = writer
+    self.pending = collections.deque()
+    self.closed = False
+    self.reading = asyncio.ensure_future(self._read_responses())
+
+  @classmethod
+  async def open(cls, host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    return cls(reader, writer)
+
+  def send(self, request):
+    """Writes a request, returns the future of its (status, body) response."""
+    future = asyncio.get_event_loop().create_future()
+    self.pending.append(future)
+    self.writer.write(request)
+    return future
+
+  async def _read_response(self):
+    status_line = await self.reader.readline()
+    if not status_line:
+      raise ConnectionError('The server closed the connection')
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+      line = await self.reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+      name, _, value = line.decode('latin-1').partition(':')
+      if name.strip().lower() == 'content-length':
+        length = int(value.strip())
+    body = await self.reader.readexactly(length) if length else b''
+    return status, body
+
+  async def _read_responses(self):
+    try:
+      while True:
+        response = await self._read_response()
+        if self.pending:
+          future = self.pending.popleft()
+          if not future.done():
+            future.set_result(response)
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+      self.close(ConnectionError('Connection lost: {}'.format(e)))
+    except asyncio.CancelledError:
+      pass
+
+  def close(self, error=None):
+    """Closes the connection, failing the requests waiting for their response."""
+    if self.closed:
+      return
+    self.closed = True
+    self.writer.close()
+    self.reading.cancel()
+    while self.pending:
+      future = self.pending.popleft()
+      if not future.done():
+        future.set_exception(error or ConnectionError('Connection closed'))
+
+
+class VerbalizerClient(object):
+  """Pooled, pipelined and optionally batching client of the verbalization server."""
+
+  def __init__(self, host='127.0.0.1', port=8080, pool_size=4, max_pipeline=8,
+               timeout=30., retries=2, retry_backoff=0.1, batch_size=0, batch_wait_ms=5.,
+               lang=None):
+    """
+    :param host: Address of the server
+    :type host: str
+    :param port: Port of the server
+    :type port: int
+    :param pool_size: Maximum number of connections to the server
+    :type pool_size: int
+    :param max_pipeline: Maximum number of requests in flight on a connection
+    :type max_pipeline: int
+    :param timeout: Seconds a request waits for its response
+    :type timeout: float
+    :param retries: Number of times a timed out or failed request is sent again
+    :type retries: int
+    :param retry_backoff: Seconds before the first retry, doubled at each retry
+    :type retry_backoff: float
+    :param batch_size: Maximum number of triple sets of the concurrent
+                       verbalize calls sent in one request, 0 to send every
+                       call on its own
+    :type batch_size: int
+    :param batch_wait_ms: Maximum time a triple set waits for others to fill
+                          its batch
+    :type batch_wait_ms: float
+    :param lang: Language of the sentences, defaults to the one of the server
+    :type lang: str
+    """
+    self.host = host
+    self.port = port
+    self.pool_size = pool_size
+    self.max_pipeline = max_pipeline
+    self.timeout = timeout
+    self.retries = retries
+    self.retry_backoff = retry_backoff
+    self.batch_size = batch_size
+    self.batch_wait = batch_wait_ms / 1000.
+    self.lang = lang
+    self.connections = []
+    self.slots = asyncio.Semaphore(pool_size * max_pipeline)
+    self.connecting = asyncio.Lock()
+    # triple sets waiting for their client side batch, per language
+    self.batches = {}
+    self.batch_tasks = set()
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self.close()
+
+  async def verbalize(self, triples, lang=None):
+    """
+    Verbalizes a triple set.
+    :param triples: The triple set, 's | p | o <TSP> ...'
+    :type triples: str
+    :param lang: Language of the sentence, defaults to the one of the client
+    :type lang: str
+    :return: the sentence and its score
+    :rtype: tuple
+    """
+    lang = lang or self.lang
+    if self.batch_size <= 0:
+      return (await self.verbalize_many([triples], lang))[0]
+
+    future = asyncio.get_event_loop().create_future()
+    batch = self.batches.setdefault(lang, [])
+    batch.append((triples, future))
+    if len(batch) >= self.batch_size:
+      self._send_batch(lang)
+    elif len(batch) == 1:
+      asyncio.get_event_loop().call_later(self.batch_wait, self._send_batch, lang, batch)
+    return await future
+
+  def _send_batch(self, lang, batch=None):
+    """Sends the waiting triple sets of a language, if batch is still waiting."""
+    if batch is not None and self.batches.get(lang) is not batch:
+      return
+    batch = self.batches.pop(lang)
+
+    async def send():
+      try:
+        results = await self.verbalize_many([triples for triples, _ in batch], lang)
+      except Exception as e:
+        for _, future in batch:
+          if not future.done():
+            future.set_exception(e)
+      else:
+        for (_, future), result in zip(batch, results):
+          if not future.done():
+            future.set_result(result)
+
+    task = asyncio.ensure_future(send())
+    self.batch_tasks.add(task)
+    task.add_done_callback(self.batch_tasks.discard)
+
+  async def verbalize_many(self, triple_sets, lang=None):
+    """
+    Verbalizes triple sets in one request.
+    :param triple_sets: The triple sets, 's | p | o <TSP> ...' strings
+    :type triple_sets: list
+    :param lang: Language of the sentences, defaults to the one of the client
+    :type lang: str
+    :return: (sentence, score) of every triple set
+    :rtype: list
+    :raises VerbalizerError: if the server rejects the request, or if it
+                             still fails after the retries
+    """
+    payload = {"triples": list(triple_sets)}
+    if lang or self.lang:
+      payload["lang"] = lang or self.lang
+    body = json.dumps(payload).encode('utf-8')
+    request = ('POST /verbalize HTTP/1.1\r\nHost: {}:{}\r\n'
+               'Content-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+               .format(self.host, self.port, len(body))).encode('latin-1') + body
+
+    for attempt in range(self.retries + 1):
+      try:
+        status, response = await self._send(request)
+      except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+        error = VerbalizerError('Request failed: {!r}'.format(e))
+      else:
+        if status == 200:
+          return [(result["output"], result["score"])
+                  for result in json.loads(response.decode('utf-8'))["results"]]
+        error = VerbalizerError('Server error {}: {}'.format(status, response.decode('utf-8')),
+                                status)
+        if status < 500:
+          raise error
+      if attempt < self.retries:
+        await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    raise error
+
+  async def _send(self, request):
+    """Sends a request on the least busy connection, opening one if needed."""
+    async with self.slots:
+      connection = await self._connection()
+      future = connection.send(request)
+      await connection.writer.drain()
+      try:
+        return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+      except asyncio.TimeoutError:
+        # the responses of the requests pipelined after this one would be
+        # matched to the wrong futures, so the connection is dropped
+        connection.close(ConnectionError('Connection closed after a timeout'))
+        future.exception()
+        raise
+
+  async def _connection(self):
+    async with self.connecting:
+      self.connections = [c for c in self.connections if not c.closed]
+      idle = min(self.connections, key=lambda c: len(c.pending), default=None)
+      if idle is None or (len(idle.pending) > 0 and len(self.connections) < self.pool_size):
+        idle = await _Connection.open(self.host, self.port)
+        self.connections.append(idle)
+
+      return idle
+
+  async def close(self):
+    """Sends the waiting batches and closes the connections."""
+    for lang in list(self.batches):
+      self._send_batch(lang)
+    if self.batch_tasks:
+      await asyncio.wait(list(self.batch_tasks))
+    for connection in self.connections:
+      connection.close()
+    self.connections = []
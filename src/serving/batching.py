@@ -0,0 +1,122 @@
+"""
+Dynamic micro-batching of the concurrent verbalization requests.
+
+The triple sets of all the requests are put in one queue, a worker
+thread takes them in micro-batches that close when max_batch_size triple
+sets are queued or when the oldest one has waited max_wait_ms, and
+decodes every micro-batch with one model call.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from src.serving.stats import LatencyStats
+
+
+class _Item(object):
+  """A queued triple set and the future of its result."""
+
+  def __init__(self, triples):
+    self.triples = triples
+    self.future = Future()
+    self.enqueued = time.time()
+
+
+class MicroBatcher(object):
+  """Groups the triple sets submitted by concurrent requests into batches."""
+
+  def __init__(self, process_fn, max_batch_size=32, max_wait_ms=10, stats=None):
+    """
+    :param process_fn: Function decoding a list of submitted items, triple
+                       sets or (lang, triple set) pairs, returns one result
+                       per item
+    :type process_fn: callable
+    :param max_batch_size: Maximum number of triple sets in a batch
+    :type max_batch_size: int
+    :param max_wait_ms: Maximum time the oldest triple set of a batch waits
+                        for more triple sets
+    :type max_wait_ms: float
+    :param stats: Statistics the batch sizes are recorded in
+    :type stats: LatencyStats
+    """
+    self.process_fn = process_fn
+    self.max_batch_size = max_batch_size
+    self.max_wait = max_wait_ms / 1000.
+    self.stats = stats if stats is not None else LatencyStats()
+    self.queue = queue.Queue()
+    self.worker = threading.Thread(target=self._run, name='micro-batcher')
+    self.worker.daemon = True
+    self.worker.start()
+
+  def submit(self, triple_sets):
+    """
+    Queues triple sets to be decoded.
+    :param triple_sets: The triple sets, 's | p | o <TSP> ...' strings
+    :type triple_sets: list
+    :return: one future per triple set
+    :rtype: list
+    """
+    items = [_Item(triples) for triples in triple_sets]
+    for item in items:
+      self.queue.put(item)
+
+    return [item.future for item in items]
+
+  def stop(self):
+    """Stops the worker thread once the queued triple sets are decoded."""
+    self.queue.put(None)
+    self.worker.join()
+
+  def _next_batch(self):
+    """Waits for the next batch, None once stopped."""
+    first = self.queue.get()
+    if first is None:
+      return None
+    batch = [first]
+    deadline = first.enqueued + self.max_wait
+    while len(batch) < self.max_batch_size:
+      timeout = deadline - time.time()
+      try:
+        item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+      except queue.Empty:
+        break
+      if item is None:
+        # stop after this batch
+        self.queue.put(None)
+        break
+      batch.append(item)
+
+    return batch
+
+  def _run(self):
+    while True:
+      batch = self._next_batch()
+      if batch is None:
+        return
+      try:
+        results = self.process_fn([item.triples for item in batch])
+      except Exception as e:
+        if len(batch) == 1:
+          batch[0].future.set_exception(e)
+        else:
+          # the items are decoded one by one, so only the failing ones fail
+          self._run_items(batch)
+      else:
+        for item, result in zip(batch, results):
+          item.future.set_result(result)
+      self.stats.record_batch(len(batch))
+
+  def _run_items(self, batch):
+    """Decodes the items of a failed batch on their own."""
+    for item in batch:
+      try:
+        result = self.process_fn([item.triples])[0]
+      except Exception as e:
+        item.future.set_exception(e)
+      else:
+        item.future.set_result(result)
@@ -0,0 +1,169 @@
+"""
+Cache of the verbalizations of triple sets.
+
+Results are keyed by a canonical form of the triple set: whitespace
+normalized triples in sorted order, with the language and the version
+of the model and decoding options, so the same facts in a different
+order hit the same entry. An in-memory LRU tier is backed by an
+optional sqlite file that persists across runs.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+
+
+def canonical_triples(triples):
+  """
+  Canonical form of a triple set, its whitespace normalized triples sorted.
+  :param triples: The triple set, 's | p | o <TSP> ...'
+  :type triples: str
+  :return: the canonical triple set
+  :rtype: str
+  """
+  canonical = []
+  for triple in triples.split('<TSP>'):
+    parts = [' '.join(part.split()) for part in triple.split('|')]
+    if any(parts):
+      canonical.append(' | '.join(parts))
+
+  return ' <TSP> '.join(sorted(canonical))
+
+
+def model_version(lang, saved_model=None, options=()):
+  """
+  Identifies the weights of a model, from the modification time of its
+  checkpoint index or SavedModel, and the options changing its outputs.
+  :param lang: Language of the model
+  :type lang: str
+  :param saved_model: Directory of the exported model, if used
+  :type saved_model: str
+  :param options: Decoding options the outputs depend on
+  :type options: tuple
+  :return: the model version
+  :rtype: str
+  """
+  if saved_model is not None:
+    path = os.path.join(saved_model, 'saved_model.pb')
+  else:
+    path = 'ckpts/{}/gat_transformer/checkpoint'.format(lang)
+  modified = os.path.getmtime(path) if os.path.isfile(path) else 0
+
+  return '|'.join([path, str(modified)] + [str(option) for option in options])
+
+
+class ResultCache(object):
+  """Thread safe LRU cache of (sentence, score) results, with a disk tier."""
+
+  def __init__(self, lang, version, capacity=10000, path=None):
+    """
+    :param lang: Language of the model
+    :type lang: str
+    :param version: Version of the model, as returned by model_version
+    :type version: str
+    :param capacity: Number of results kept in memory
+    :type capacity: int
+    :param path: Path of the sqlite file of the disk tier, None to only
+                 cache in memory
+    :type path: str
+    """
+    self.prefix = lang + '\n' + version + '\n'
+    self.capacity = capacity
+    self.memory = collections.OrderedDict()
+    self.lock = threading.Lock()
+    self.memory_hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+    self.db = None
+    if path is not None:
+      if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      self.db = sqlite3.connect(path, check_same_thread=False)
+      self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                      '(key TEXT PRIMARY KEY, output TEXT, score REAL)')
+      self.db.commit()
+
+  def key(self, triples, lang=None, version=None):
+    """
+    Cache key of a triple set.
+    :param triples: The triple set, 's | p | o <TSP> ...'
+    :type triples: str
+    :param lang: Language of the model, when it is not the one of the cache
+    :type lang: str
+    :param version: Version of the model of lang
+    :type version: str
+    :return: the cache key
+    :rtype: str
+    """
+    prefix = self.prefix if lang is None else lang + '\n' + version + '\n'
+    return hashlib.sha1((prefix + canonical_triples(triples)).encode('utf-8')).hexdigest()
+
+  def get_many(self, keys):
+    """
+    Looks results up, in memory then on disk.
+    :param keys: The cache keys
+    :type keys: list
+    :return: (sentence, score) of every key, None for the misses
+    :rtype: list
+    """
+    results = []
+    with self.lock:
+      for key in keys:
+        result = self.memory.get(key)
+        if result is not None:
+          self.memory.move_to_end(key)
+          self.memory_hits += 1
+        elif self.db is not None:
+          row = self.db.execute('SELECT output, score FROM results WHERE key = ?',
+                                (key,)).fetchone()
+          if row is not None:
+            result = (row[0], row[1])
+            self._remember(key, result)
+            self.disk_hits += 1
+        if result is None:
+          self.misses += 1
+        results.append(result)
+
+    return results
+
+  def put_many(self, items):
+    """
+    Stores results, in memory and on disk.
+    :param items: (key, (sentence, score)) pairs
+    :type items: list
+    """
+    with self.lock:
+      for key, result in items:
+        self._remember(key, result)
+      if self.db is not None and items:
+        self.db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                            [(key, result[0], result[1]) for key, result in items])
+        self.db.commit()
+
+  def _remember(self, key, result):
+    self.memory[key] = result
+    self.memory.move_to_end(key)
+    while len(self.memory) > self.capacity:
+      self.memory.popitem(last=False)
+
+  def stats(self):
+    """
+    Hit and miss counts of the cache.
+    :return: memory and disk hits, misses, hit rate and memory size
+    :rtype: dict
+    """
+    with self.lock:
+      lookups = self.memory_hits + self.disk_hits + self.misses
+      return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits,
+              "misses": self.misses,
+              "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.,
+              "memory_size": len(self.memory)}
+
+  def close(self):
+    if self.db is not None:
+      self.db.close()
@@ -0,0 +1,148 @@
+"""
+Registry of the models of several languages served by one process.
+
+Models are loaded on their first request and share their vocab objects.
+When the models loaded exceed the memory budget, the least recently used
+ones are dropped, and loaded again on their next request. Only the
+languages of the allow-list, or with a trained model on disk, are served.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import gc
+import glob
+import os
+import threading
+
+from src.serving.cache import model_version
+from src.serving.server import valid_lang
+from src.serving.verbalizer import Verbalizer
+
+
+def available_langs(args):
+  """
+  Languages with a model on disk, their parameters and checkpoints, or
+  their SavedModel if --saved_model is given.
+  :param args: The server arguments
+  :type args: argparse.Namespace
+  :return: the languages
+  :rtype: set
+  """
+  if args.saved_model is not None:
+    if '{lang}' not in args.saved_model:
+      return {args.lang}
+    prefix, _, suffix = args.saved_model.partition('{lang}')
+    langs = [path[len(prefix):len(path) - len(suffix)]
+             for path in glob.glob(args.saved_model.format(lang='*'))]
+  else:
+    params = '_model_params'
+    names = os.listdir('data/logs') if os.path.isdir('data/logs') else []
+    langs = [name[:-len(params)] for name in names
+             if name.endswith(params) and os.path.isdir(os.path.join('ckpts', name[:-len(params)]))]
+
+  return set(lang for lang in langs if valid_lang(lang))
+
+
+class ModelRegistry(object):
+  """Lazily loaded Verbalizers, evicted in LRU order over a memory budget."""
+
+  def __init__(self, args, memory_budget_mb=None, langs=None):
+    """
+    :param args: The server arguments, used to load every model
+    :type args: argparse.Namespace
+    :param memory_budget_mb: Memory the weights of the loaded models can
+                             use, None for no limit. The model in use is
+                             never evicted, even if it exceeds the budget.
+    :type memory_budget_mb: float
+    :param langs: Languages served, defaults to the ones with a model on disk
+    :type langs: list
+    """
+    self.args = args
+    self.langs = set(langs) if langs else available_langs(args)
+    self.langs.add(args.lang)
+    self.memory_budget = memory_budget_mb * 2 ** 20 if memory_budget_mb else None
+    self.verbalizers = collections.OrderedDict()
+    self.vocab_cache = {}
+    self.lock = threading.Lock()
+    self.loads = 0
+    self.evictions = 0
+
+  def serves(self, lang):
+    """Whether the model of a language can be requested."""
+    return valid_lang(lang) and lang in self.langs
+
+  def get(self, lang):
+    """
+    The Verbalizer of a language, loaded if it is not.
+    :param lang: Language of the model
+    :type lang: str
+    :return: the verbalizer
+    :rtype: Verbalizer
+    """
+    with self.lock:
+      verbalizer = self.verbalizers.get(lang)
+      if verbalizer is not None:
+        self.verbalizers.move_to_end(lang)
+        return verbalizer
+
+      verbalizer = Verbalizer(self.args, lang, self.vocab_cache)
+      self.verbalizers[lang] = verbalizer
+      self.loads += 1
+      self._evict()
+
+      return verbalizer
+
+  def _evict(self):
+    """Drops the least recently used models until the budget is met."""
+    if self.memory_budget is None:
+      return
+    evicted = False
+    while (len(self.verbalizers) > 1 and
+           sum(v.memory_size for v in self.verbalizers.values()) > self.memory_budget):
+      lang, _ = self.verbalizers.popitem(last=False)
+      print('Evicted the ' + lang + ' model')
+      self.evictions += 1
+      evicted = True
+    if evicted:
+      # release the variables of the dropped models now
+      gc.collect()
+
+  def verbalize(self, items):
+    """
+    Verbalizes triple sets of several languages, every language is
+    decoded in one batch.
+    :param items: (lang, triple set) pairs
+    :type items: list
+    :return: (sentence, score) of every item
+    :rtype: list
+    """
+    positions = collections.OrderedDict()
+    for i, (lang, _) in enumerate(items):
+      positions.setdefault(lang, []).append(i)
+
+    results = [None] * len(items)
+    for lang, indices in positions.items():
+      for i, result in zip(indices, self.get(lang).verbalize([items[i][1] for i in indices])):
+        results[i] = result
+
+    return results
+
+  def version(self, lang):
+    """Version of the model of a language, used in the result cache keys."""
+    saved_model = self.args.saved_model
+    return model_version(lang, saved_model.format(lang=lang) if saved_model else None,
+                         (self.args.dtype, self.args.quantized))
+
+  def stats(self):
+    """
+    Models loaded and their memory.
+    :return: memory of every loaded model in MB, load and eviction counts
+    :rtype: dict
+    """
+    with self.lock:
+      return {"loaded": collections.OrderedDict(
+                (lang, v.memory_size / 2 ** 20) for lang, v in self.verbalizers.items()),
+              "loads": self.loads, "evictions": self.evictions,
+              "langs": sorted(self.langs)}
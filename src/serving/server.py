@@ -0,0 +1,210 @@
+"""
+Local HTTP verbalization server.
+
+  POST /verbalize  body: triple sets, one 's | p | o <TSP> ...' per line,
+                   or JSON {"triples": "..."} / {"triples": ["...", ...]},
+                   the language is {"lang": ...} or /verbalize?lang=...
+                   and defaults to the one of the server
+                   returns {"results": [{"output": ..., "score": ...}, ...]}
+  GET  /stats      request latency percentiles, mean batch size, the hit
+                   rate of the result cache and the models loaded
+  GET  /health     ok once the server is started
+
+Every connection is served by its own thread and kept alive (HTTP/1.1),
+the triple sets of concurrent requests are decoded together by a
+MicroBatcher, after looking them up in the result cache. The models of
+the languages requested are loaded and evicted by a ModelRegistry.
+With templates, the entities of the triple sets are replaced by slots
+first, so the triple sets sharing a pattern share their cache entry, and
+put back in the sentences.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from src.serving.templates import delexicalize, relexicalize
+
+# the languages are used in the paths of the models
+_LANG_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class VerbalizationServer(ThreadingMixIn, HTTPServer):
+  """Threaded HTTP server holding the micro-batcher of the models."""
+
+  daemon_threads = True
+  # the pooled clients open many connections at once
+  request_queue_size = 128
+
+  def __init__(self, server_address, registry, batcher, stats, cache=None, templates=False):
+    """
+    :param server_address: (host, port) the server listens on
+    :type server_address: tuple
+    :param registry: The models of the languages served
+    :type registry: ModelRegistry
+    :param batcher: The micro-batcher decoding the (lang, triple set) items
+    :type batcher: MicroBatcher
+    :param stats: Statistics the request latencies are recorded in
+    :type stats: LatencyStats
+    :param cache: The result cache, None to always decode
+    :type cache: ResultCache
+    :param templates: Verbalize the delexicalized patterns of the triple sets
+    :type templates: bool
+    """
+    HTTPServer.__init__(self, server_address, VerbalizationHandler)
+    self.registry = registry
+    self.batcher = batcher
+    self.stats = stats
+    self.cache = cache
+    self.templates = templates
+    self.versions = {}
+
+  def verbalize(self, triple_sets, lang=None):
+    """
+    Verbalizes triple sets, only the ones missing from the cache are decoded.
+    :param triple_sets: The triple sets, 's | p | o <TSP> ...' strings
+    :type triple_sets: list
+    :param lang: Language of the sentences, defaults to the one of the server
+    :type lang: str
+    :return: (sentence, score) of every triple set
+    :rtype: list
+    """
+    lang = lang or self.registry.args.lang
+    if self.templates:
+      triple_sets, entities = zip(*[delexicalize(triples) for triples in triple_sets])
+    if self.cache is None:
+      results = [future.result()
+                 for future in self.batcher.submit([(lang, triples) for triples in triple_sets])]
+    else:
+      if lang not in self.versions:
+        self.versions[lang] = self.registry.version(lang) + ('|templates' if self.templates else '')
+      keys = [self.cache.key(triples, lang, self.versions[lang]) for triples in triple_sets]
+      results = self.cache.get_many(keys)
+      misses = [i for i, result in enumerate(results) if result is None]
+      futures = self.batcher.submit([(lang, triple_sets[i]) for i in misses])
+      for i, future in zip(misses, futures):
+        results[i] = future.result()
+      self.cache.put_many([(keys[i], results[i]) for i in misses])
+    if self.templates:
+      results = [(relexicalize(sentence, line_entities), score)
+                 for (sentence, score), line_entities in zip(results, entities)]
+
+    return results
+
+  def summary(self):
+    """Statistics reported by /stats."""
+    summary = self.stats.summary()
+    if self.cache is not None:
+      summary["cache"] = self.cache.stats()
+    summary["models"] = self.registry.stats()
+    summary["templates"] = self.templates
+    return summary
+
+
+def parse_triple_sets(body, content_type):
+  """
+  Reads the triple sets of a request body.
+  :param body: The request body
+  :type body: bytes
+  :param content_type: The Content-Type header of the request
+  :type content_type: str
+  :return: the triple sets and the language of the JSON body, if any
+  :rtype: tuple
+  :raises ValueError: if the body holds no triple set, or one that is
+                     not a string of 's | p | o' triples
+  """
+  text = body.decode('utf-8')
+  lang = None
+  if 'json' in (content_type or ''):
+    request = json.loads(text)
+    triples = request["triples"]
+    triple_sets = [triples] if isinstance(triples, str) else list(triples)
+    lang = request.get("lang")
+  else:
+    triple_sets = text.split('\n')
+  if not all(isinstance(triples, str) for triples in triple_sets):
+    raise ValueError('The triple sets must be strings.')
+  triple_sets = [triples.strip() for triples in triple_sets if triples.strip()]
+  if not triple_sets:
+    raise ValueError('The request holds no triple set.')
+  for triples in triple_sets:
+    if not is_triple_set(triples):
+      raise ValueError('Every triple of a triple set must be \'s | p | o\': {!r}'.format(triples))
+
+  return triple_sets, lang
+
+
+def valid_lang(lang):
+  """Whether a language name is safe to use in the paths of its model."""
+  return isinstance(lang, str) and _LANG_PATTERN.match(lang) is not None
+
+
+def is_triple_set(triples):
+  """
+  Checks that a triple set can be read by PreProcess.
+  :param triples: The triple set, 's | p | o <TSP> ...'
+  :type triples: str
+  :return: whether every triple has a subject, a predicate and an object
+  :rtype: bool
+  """
+  return all(len(triple.strip().split(' | ')) == 3 for triple in triples.split('<TSP>'))
+
+
+class VerbalizationHandler(BaseHTTPRequestHandler):
+  """Handles the requests of a connection."""
+
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    if self.path == '/stats':
+      self._send_json(200, self.server.summary())
+    elif self.path == '/health':
+      self._send_json(200, {"status": "ok"})
+    else:
+      self._send_json(404, {"error": "Unknown path {}".format(self.path)})
+
+  def do_POST(self):
+    start = time.time()
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    url = urlparse(self.path)
+    if url.path != '/verbalize':
+      self._send_json(404, {"error": "Unknown path {}".format(url.path)})
+      return
+    try:
+      triple_sets, lang = parse_triple_sets(body, self.headers.get('Content-Type'))
+    except (ValueError, KeyError, TypeError) as e:
+      self._send_json(400, {"error": "Invalid request: {}".format(e)})
+      return
+    lang = lang or parse_qs(url.query).get('lang', [None])[0]
+    if lang is not None and not self.server.registry.serves(lang):
+      self._send_json(400, {"error": "Language {!r} is not served".format(lang)})
+      return
+
+    try:
+      results = self.server.verbalize(triple_sets, lang)
+    except Exception as e:
+      self._send_json(500, {"error": str(e)})
+      return
+    latency = time.time() - start
+    self.server.stats.record_request(latency)
+    self._send_json(200, {"results": [{"output": output, "score": score}
+                                      for output, score in results],
+                          "latency_ms": latency * 1000.})
+
+  def _send_json(self, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    """Requests are not logged, the latencies are in /stats."""
+    pass
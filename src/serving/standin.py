@@ -0,0 +1,63 @@
+"""
+Stand-in for the models of the verbalization server, to test the clients
+(async_client.py, load_test.py) without TensorFlow or a trained model.
+
+It answers through the same server, micro-batcher and cache as the real
+models, with the entities of the triple sets joined into a sentence
+after a fixed per batch delay.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+from src.serving.server import valid_lang
+
+
+class StandInRegistry(object):
+  """Has the interface of ModelRegistry, without loading any model."""
+
+  def __init__(self, args, delay_ms=20.):
+    """
+    :param args: The server arguments, args.lang is the default language
+    :type args: argparse.Namespace
+    :param delay_ms: Time a batch takes to decode
+    :type delay_ms: float
+    """
+    self.args = args
+    self.delay = delay_ms / 1000.
+    self.allowed = set(args.langs.split(',')) | {args.lang} if args.langs else None
+    self.langs = set()
+    self.lock = threading.Lock()
+
+  def verbalize(self, items):
+    """
+    Verbalizes (lang, triple set) items as 'lang: subject predicate object ...'.
+    :param items: (lang, triple set) pairs
+    :type items: list
+    :return: (sentence, score) of every item
+    :rtype: list
+    """
+    time.sleep(self.delay)
+    results = []
+    for lang, triples in items:
+      with self.lock:
+        self.langs.add(lang)
+      words = [part.strip() for triple in triples.split('<TSP>') for part in triple.split('|')]
+      sentence = ' '.join(word.replace('_', ' ') for word in words if word)
+      results.append((lang + ': ' + sentence, -float(len(words))))
+
+    return results
+
+  def serves(self, lang):
+    """Any valid language, or the ones of --langs."""
+    return valid_lang(lang) and (self.allowed is None or lang in self.allowed)
+
+  def version(self, lang):
+    return 'stand-in'
+
+  def stats(self):
+    with self.lock:
+      return {"stand_in": True, "langs": sorted(self.langs)}
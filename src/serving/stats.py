@@ -0,0 +1,60 @@
+"""
+Latency and batch size statistics of the verbalization server.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import threading
+
+import numpy as np
+
+
+class LatencyStats(object):
+  """Thread safe record of the latest request latencies and batch sizes."""
+
+  def __init__(self, window=10000):
+    """
+    :param window: Number of latest requests and batches the statistics
+                   are computed over
+    :type window: int
+    """
+    self.lock = threading.Lock()
+    self.latencies = collections.deque(maxlen=window)
+    self.batch_sizes = collections.deque(maxlen=window)
+    self.requests = 0
+    self.batches = 0
+
+  def record_request(self, latency):
+    """Records the latency of a request, in seconds."""
+    with self.lock:
+      self.latencies.append(latency)
+      self.requests += 1
+
+  def record_batch(self, batch_size):
+    """Records the size of a decoded micro-batch."""
+    with self.lock:
+      self.batch_sizes.append(batch_size)
+      self.batches += 1
+
+  def summary(self):
+    """
+    Statistics of the recorded requests and batches.
+    :return: request and batch counts, latency percentiles in ms and
+             the mean batch size
+    :rtype: dict
+    """
+    with self.lock:
+      latencies = np.array(self.latencies) * 1000.
+      batch_sizes = list(self.batch_sizes)
+      summary = {"requests": self.requests, "batches": self.batches}
+
+    if len(latencies) > 0:
+      for percentile in [50, 90, 95, 99]:
+        summary["latency_p{}_ms".format(percentile)] = float(np.percentile(latencies, percentile))
+      summary["latency_mean_ms"] = float(latencies.mean())
+    if batch_sizes:
+      summary["mean_batch_size"] = sum(batch_sizes) / len(batch_sizes)
+
+    return summary
@@ -0,0 +1,133 @@
+"""
+Delexicalized templates of the triple sets.
+
+The subjects and objects of a triple set are replaced by numbered slots,
+ENTITY0, ENTITY1 ... in the order they appear once the triples are sorted
+by property, so the triple sets sharing their properties and their shape
+share one pattern:
+
+  Alan_Bean | birthPlace | Wheeler,_Texas <TSP> Alan_Bean | occupation | Test_pilot
+  ENTITY0 | birthPlace | ENTITY1 <TSP> ENTITY0 | occupation | ENTITY2
+
+A model trained on delexicalized data (preprocess.py --delex True) verbalizes
+the pattern, the verbalization is cached by pattern and the entities are put
+back in it, like webnlg_scripts/webnlg_baseline_input.py does with its
+replacement dictionaries.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import re
+
+SLOT = 'ENTITY{}'
+# the slots as the models write them, lower cased by the vocabs
+_SLOT_PATTERN = re.compile(r'\bentity(\d+)\b', re.IGNORECASE)
+
+
+def entity_text(entity):
+  """
+  Surface form of an entity, 'Wheeler,_Texas' -> 'Wheeler, Texas'.
+  :param entity: The subject or object of a triple
+  :type entity: str
+  :return: the entity as it is written in a sentence
+  :rtype: str
+  """
+  return ' '.join(entity.replace('_', ' ').replace('"', '').split())
+
+
+def delexicalize(triples):
+  """
+  Replaces the entities of a triple set by slots.
+  :param triples: The triple set, 's | p | o <TSP> ...'
+  :type triples: str
+  :return: the pattern of the triple set, and the surface form of the
+           entity of every slot
+  :rtype: str, list
+  :raises ValueError: if a triple is not 's | p | o', like PreProcess reads them
+  """
+  parsed = []
+  for triple in triples.split('<TSP>'):
+    parts = [' '.join(part.split()) for part in triple.strip().split(' | ')]
+    if len(parts) != 3:
+      raise ValueError('Every triple of a triple set must be \'s | p | o\': {!r}'.format(triples))
+    parsed.append(parts)
+  parsed.sort(key=lambda triple: triple[1])
+
+  slots = {}
+  pattern = []
+  for subject, prop, obj in parsed:
+    for entity in (subject, obj):
+      if entity not in slots:
+        slots[entity] = len(slots)
+    pattern.append(' | '.join([SLOT.format(slots[subject]), prop, SLOT.format(slots[obj])]))
+
+  return ' <TSP> '.join(pattern), [entity_text(entity) for entity in sorted(slots, key=slots.get)]
+
+
+def delexicalize_sentence(sentence, entities):
+  """
+  Replaces the entities of a reference sentence by their slots, the
+  longest entities first.
+  :param sentence: The reference sentence
+  :type sentence: str
+  :param entities: Surface form of the entity of every slot
+  :type entities: list
+  :return: the delexicalized sentence
+  :rtype: str
+  """
+  for slot in sorted(range(len(entities)), key=lambda slot: -len(entities[slot])):
+    if entities[slot]:
+      sentence = re.sub(r'(?<!\w)' + re.escape(entities[slot]) + r'(?!\w)',
+                        SLOT.format(slot), sentence, flags=re.IGNORECASE)
+
+  return sentence
+
+
+def relexicalize(sentence, entities):
+  """
+  Puts the entities back in the verbalization of a pattern.
+  :param sentence: The verbalization of the pattern
+  :type sentence: str
+  :param entities: Surface form of the entity of every slot
+  :type entities: list
+  :return: the verbalization of the triple set
+  :rtype: str
+  """
+  return _SLOT_PATTERN.sub(
+    lambda match: entities[int(match.group(1))] if int(match.group(1)) < len(entities)
+    else match.group(0), sentence)
+
+
+def delexicalize_corpus(src_path, sentences):
+  """
+  Delexicalizes a parallel corpus of triple sets and reference sentences.
+  :param src_path: Path to the triple file
+  :type src_path: str
+  :param sentences: The reference sentence of every triple set
+  :type sentences: list
+  :return: the patterns and the delexicalized sentences
+  :rtype: list, list
+  """
+  triple_sets = io.open(src_path, encoding='UTF-8').read().strip().split('\n')
+  patterns = []
+  delex_sentences = []
+  for triples, sentence in zip(triple_sets, sentences):
+    pattern, entities = delexicalize(triples)
+    patterns.append(pattern)
+    delex_sentences.append(delexicalize_sentence(sentence, entities))
+
+  return patterns, delex_sentences
+
+
+def check_template_vocab(src_vocab):
+  """
+  Checks that a model was trained on delexicalized triple sets.
+  :param src_vocab: The source vocab of the model
+  :type src_vocab: tf tokenizer or TextVocab
+  :raises ValueError: if the slots are not in the vocab
+  """
+  if SLOT.format(0).lower() not in src_vocab.word_index:
+    raise ValueError('The model was not trained on delexicalized triple sets, '
+                     'preprocess its data with --delex True to use templates.')
@@ -0,0 +1,71 @@
+"""
+Model kept loaded by the verbalization server.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+from src.utils.InferenceUtils import LoadModel, LoadSavedModel, _decode_predictions, \
+  _tensorize_triples
+from src.utils.PreprocessingUtils import PreProcess
+from src.utils.model_utils import compile_step, graph_input_signature
+
+
+def _directory_size(path):
+  """Total size in bytes of the files under path."""
+  return sum(os.path.getsize(os.path.join(root, name))
+             for root, _, names in os.walk(path) for name in names)
+
+
+class Verbalizer(object):
+  """Loads a model once and verbalizes batches of triple sets."""
+
+  def __init__(self, args, lang=None, vocab_cache=None):
+    """
+    :param args: The server arguments, with the model, lang, dtype,
+                 quantized, saved_model, eager and xla flags
+    :type args: argparse.Namespace
+    :param lang: Language of the model, defaults to args.lang
+    :type lang: str
+    :param vocab_cache: Vocabs shared with the other loaded models
+    :type vocab_cache: dict
+    """
+    self.lang = lang or args.lang
+    if args.saved_model is not None:
+      # the SavedModel directory can depend on the language
+      export_dir = args.saved_model.format(lang=self.lang)
+      self.predict_step, self.src_vocab, self.tgt_vocab, self.sentencepiece = \
+        LoadSavedModel(export_dir)
+      self.memory_size = _directory_size(os.path.join(export_dir, 'variables'))
+    else:
+      from src.utils.quantization import build_model
+
+      model, self.src_vocab, self.tgt_vocab = LoadModel(args.model, self.lang, args.dtype,
+                                                        quantized=args.quantized == 'True',
+                                                        vocab_cache=vocab_cache)
+      self.sentencepiece = args.sentencepiece
+      # create the variables now, to know the memory used by the model
+      build_model(model)
+      self.memory_size = sum(w.numpy().nbytes for w in model.weights)
+      self.predict_step = compile_step(
+        lambda nodes, labels, node1, node2: model(nodes, labels, node1, node2,
+                                                  targ=None, mask=None),
+        graph_input_signature(), args)
+
+  def verbalize(self, triple_sets):
+    """
+    Verbalizes triple sets in one batch.
+    :param triple_sets: The triple sets, 's | p | o <TSP> ...' strings
+    :type triple_sets: list
+    :return: (sentence, score) of every triple set
+    :rtype: list
+    """
+    nodes, labels, node1, node2 = PreProcess(triple_sets, self.lang)
+    dataset = _tensorize_triples(nodes, labels, node1, node2, self.src_vocab, len(nodes))
+    predictions = self.predict_step(*next(iter(dataset)))
+    sentences = _decode_predictions(predictions['outputs'].numpy().tolist(),
+                                    self.tgt_vocab, self.sentencepiece)
+
+    return list(zip(sentences, predictions['scores'].numpy().tolist()))
@@ -16,9 +16,136 @@ from src.DataLoader import GetGATDataset
 from src.models.GraphAttentionModel import TransGAT
 from src.utils.metrics import LossLayer
 from src.utils.model_utils import CustomSchedule, _set_up_dirs
+from src.utils.model_utils import compile_step, dedup_predict, graph_input_signature, \
+  set_precision_policy
 from src.utils.rogue import rouge_n
 
 
+def _get_loss_fn(model, loss_layer):
+  """
+  Returns the function computing the training loss of a batch.
+  With the full softmax loss it also updates the metrics of the model.
+  """
+
+  def loss_fn(nodes, labels, node1, node2, targ):
+    if loss_layer.num_sampled > 0:
+      hidden = model(nodes, labels, node1, node2, targ, None, hidden_only=True)
+      return loss_layer([hidden, targ, model.tgt_emb_layer.shared_weights])
+
+    predictions = model(nodes, labels, node1, node2, targ, None)
+    predictions = model.metric_layer([predictions, targ])
+    return loss_layer([predictions, targ])
+
+  return loss_fn
+
+
+def _get_train_step(args, model, loss_layer, optimizer, train_loss):
+  """
+  Builds the training step of the GAT-Transformer model, compiled
+  into a graph unless args.eager is set.
+  With a sampled softmax loss layer the step only returns the loss,
+  the full softmax metrics are then computed by the metric step.
+  """
+  loss_fn = _get_loss_fn(model, loss_layer)
+
+  def train_step(nodes, labels, node1, node2, targ):
+    with tf.GradientTape() as tape:
+      batch_loss = loss_fn(nodes, labels, node1, node2, targ)
+
+    gradients = tape.gradient(batch_loss, model.trainable_weights)
+    optimizer.apply_gradients(zip(gradients, model.trainable_weights))
+    batch_loss = train_loss(batch_loss)
+    if loss_layer.num_sampled > 0:
+      return batch_loss
+    acc = model.metrics[0].result()
+    ppl = model.metrics[-1].result()
+
+    return batch_loss, acc, ppl
+
+  return compile_step(train_step, graph_input_signature(with_target=True), args)
+
+
+def _get_accum_train_step(args, model, loss_layer, optimizer, train_loss):
+  """
+  Builds the training steps used with gradient accumulation, both
+  compiled into graphs unless args.eager is set.
+  The accumulation step adds the gradients of a micro-batch, with the
+  loss scaled by 1 / args.accum_steps, to the accumulators and returns
+  the same outputs as the train step. The apply step applies the summed
+  gradients with the optimizer and resets the accumulators.
+  """
+  loss_fn = _get_loss_fn(model, loss_layer)
+  accum_grads = []
+
+  def accum_step(nodes, labels, node1, node2, targ):
+    with tf.GradientTape() as tape:
+      batch_loss = loss_fn(nodes, labels, node1, node2, targ)
+      scaled_loss = batch_loss / args.accum_steps
+
+    gradients = tape.gradient(scaled_loss, model.trainable_weights)
+    # the accumulators are created with the model weights on the first call
+    if not accum_grads:
+      accum_grads.extend(tf.Variable(tf.zeros_like(w), trainable=False)
+                         for w in model.trainable_weights)
+    for accum_grad, grad in zip(accum_grads, gradients):
+      if grad is not None:
+        accum_grad.assign_add(tf.convert_to_tensor(grad))
+    batch_loss = train_loss(batch_loss)
+    if loss_layer.num_sampled > 0:
+      return batch_loss
+    acc = model.metrics[0].result()
+    ppl = model.metrics[-1].result()
+
+    return batch_loss, acc, ppl
+
+  def apply_step():
+    optimizer.apply_gradients(
+      zip([accum_grad.read_value() for accum_grad in accum_grads],
+          model.trainable_weights))
+    for accum_grad in accum_grads:
+      accum_grad.assign(tf.zeros_like(accum_grad))
+
+    return tf.constant(True)
+
+  return (compile_step(accum_step, graph_input_signature(with_target=True), args),
+          compile_step(apply_step, [], args))
+
+
+def _get_metric_step(args, model):
+  """
+  Builds the step computing the full softmax accuracy and perplexity
+  of a batch without updating the model, used when training with
+  the sampled softmax loss.
+  """
+
+  def metric_step(nodes, labels, node1, node2, targ):
+    # the model runs in training mode while model.trainable is set, the
+    # metrics are computed without dropout like the ROUGE eval loop does.
+    # Under tf.function this is read once, when the step is traced.
+    model.trainable = False
+    try:
+      predictions = model(nodes, labels, node1, node2, targ, None)
+    finally:
+      model.trainable = True
+    model.metric_layer([predictions, targ])
+
+    return model.metrics[0].result(), model.metrics[-1].result()
+
+  return compile_step(metric_step, graph_input_signature(with_target=True), args)
+
+
+def _get_predict_step(args, model):
+  """
+  Builds the inference step (encoder + beam search) of the GAT-Transformer
+  model, compiled into a graph unless args.eager is set.
+  """
+
+  def predict_step(nodes, labels, node1, node2):
+    return model(nodes, labels, node1, node2, targ=None, mask=None)
+
+  return compile_step(predict_step, graph_input_signature(), args)
+
+
 def _train_gat_trans(args):
   # set up dirs
   (OUTPUT_DIR, EvalResultsFile,
@@ -31,18 +158,23 @@ def _train_gat_trans(args):
   OUTPUT_DIR += '/{}_{}'.format(args.enc_type, args.dec_type)
 
   (dataset, eval_set, test_set, BUFFER_SIZE, BATCH_SIZE, steps_per_epoch,
-   src_vocab_size, src_vocab, tgt_vocab_size, tgt_vocab, max_length_targ, dataset_size) = GetGATDataset(args)
+   src_vocab_size, src_vocab, tgt_vocab_size, tgt_vocab, max_length_targ, dataset_size,
+   decode_lengths) = GetGATDataset(args)
 
+  set_precision_policy(args)
   model = TransGAT(args, src_vocab_size, src_vocab,
                    tgt_vocab_size, max_length_targ, tgt_vocab)
-  loss_layer = LossLayer(tgt_vocab_size, 0.1)
+  num_sampled = getattr(args, 'num_sampled', 0)
+  loss_layer = LossLayer(tgt_vocab_size, 0.1, num_sampled)
+  # The learning rate is kept in a variable so that the compiled train
+  # step reads the current value instead of the one it was traced with.
   if args.decay is not None:
     learning_rate = CustomSchedule(args.emb_dim, warmup_steps=args.decay_steps)
-    optimizer = tf.train.AdamOptimizer(learning_rate=learning_rate, beta1=0.9, beta2=0.98,
-                                       epsilon=1e-9)
+    lr = tf.Variable(0.0, trainable=False, dtype=tf.float32)
   else:
-    optimizer = tf.train.AdamOptimizer(learning_rate=args.learning_rate, beta1=0.9, beta2=0.98,
-                                       epsilon=1e-9)
+    lr = tf.Variable(args.learning_rate, trainable=False, dtype=tf.float32)
+  optimizer = tf.train.AdamOptimizer(learning_rate=lr, beta1=0.9, beta2=0.98,
+                                     epsilon=1e-9)
 
   # Save model parameters for future use
   if os.path.isfile('{}/{}_{}_params'.format(log_dir, args.lang, args.model)):
@@ -57,9 +189,13 @@ def _train_gat_trans(args):
       "src_vocab_size": src_vocab_size,
       "tgt_vocab_size": tgt_vocab_size,
       "max_tgt_length": max_length_targ,
+      "decode_lengths": decode_lengths,
       "dataset_size": dataset_size,
       "step": 0
     }
+  # params saved before the decode length table was added get the one
+  # of the current training set
+  model.decode_lengths = PARAMS.setdefault("decode_lengths", decode_lengths)
 
   loss_object = tf.keras.losses.SparseCategoricalCrossentropy(from_logits=True, reduction='none')
   train_loss = tf.keras.metrics.Mean(name='train_loss')
@@ -76,27 +212,24 @@ def _train_gat_trans(args):
     ckpt.restore(ckpt_manager.latest_checkpoint).expect_partial()
     print('Latest checkpoint restored!!')
 
+  # PARAMS['step'], the learning rate schedule, logging, eval and
+  # checkpoints all count optimizer updates of accum_steps batches.
+  accum_steps = getattr(args, 'accum_steps', 1)
   if args.epochs is not None:
-    steps = args.epochs * steps_per_epoch
+    steps = args.epochs * steps_per_epoch // accum_steps
   else:
     steps = args.steps
 
-  def train_step(nodes, labels, node1, node2, targ):
-    with tf.GradientTape() as tape:
-      predictions = model(nodes, labels, node1, node2, targ, None)
-      predictions = model.metric_layer([predictions, targ])
-      batch_loss = loss_layer([predictions, targ])
-
-    gradients = tape.gradient(batch_loss, model.trainable_weights)
-    optimizer.apply_gradients(zip(gradients, model.trainable_weights))
-    acc = model.metrics[0].result()
-    ppl = model.metrics[-1].result()
-    batch_loss = train_loss(batch_loss)
-
-    return batch_loss, acc, ppl
-
-    # Eval function
+  if accum_steps > 1:
+    train_step, apply_step = _get_accum_train_step(args, model, loss_layer,
+                                                   optimizer, train_loss)
+  else:
+    train_step = _get_train_step(args, model, loss_layer, optimizer, train_loss)
+  predict_step = _get_predict_step(args, model)
+  if num_sampled > 0:
+    metric_step = _get_metric_step(args, model)
 
+  # Eval function
   def eval_step(steps=None):
     model.trainable = False
     results = []
@@ -106,11 +239,14 @@ def _train_gat_trans(args):
       dev_set = eval_set
     else:
       dev_set = eval_set.take(steps)
+    # the triple sets with several references are decoded once
+    memo = {}
+    decoded = 0
 
     for (batch, (nodes, labels, node1, node2, targets)) in tqdm(enumerate(dev_set)):
-      predictions = model(nodes, labels, node1,
-                          node2, targ=None, mask=None)
-      pred = [(predictions['outputs'].numpy().tolist())]
+      ids, batch_decoded = dedup_predict(predict_step, memo, nodes, labels, node1, node2)
+      decoded += batch_decoded
+      pred = [ids]
 
       if args.sentencepiece == 'True':
         for i in range(len(pred[0])):
@@ -128,6 +264,7 @@ def _train_gat_trans(args):
             ref_target.append(reference.readline())
             results.append(w)
 
+    print('Dedup : decoded {} distinct of {} triple sets'.format(decoded, len(results)))
     rogue = (rouge_n(results, ref_target))
     eval_results.close()
     model.trainable = True
@@ -140,11 +277,13 @@ def _train_gat_trans(args):
     results = []
     ref_target = []
     eval_results = open(TestResults, 'w+')
+    memo = {}
+    decoded = 0
 
     for (batch, (nodes, labels, node1, node2)) in tqdm(enumerate(test_set)):
-      predictions = model(nodes, labels, node1,
-                          node2, targ=None, mask=None)
-      pred = [(predictions['outputs'].numpy().tolist())]
+      ids, batch_decoded = dedup_predict(predict_step, memo, nodes, labels, node1, node2)
+      decoded += batch_decoded
+      pred = [ids]
       if args.sentencepiece == 'True':
         for i in range(len(pred[0])):
           sentence = (tgt_vocab.DecodeIds(list(pred[0][i])))
@@ -160,6 +299,7 @@ def _train_gat_trans(args):
             eval_results.write((w + '\n'))
             ref_target.append(reference.readline())
             results.append(w)
+    print('Dedup : decoded {} distinct of {} triple sets'.format(decoded, len(results)))
     rogue = (rouge_n(results, ref_target))
     score = 0
     eval_results.close()
@@ -172,40 +312,57 @@ def _train_gat_trans(args):
 
   for (batch, (nodes, labels,
                node1, node2, targ)) in tqdm(enumerate(dataset.repeat(-1))):
-    if PARAMS['step'] < steps:
+    micro_batch = batch % accum_steps
+    if micro_batch == 0 and PARAMS['step'] >= steps:
+      break
+
+    if micro_batch == 0:
       start = time.time()
       PARAMS['step'] += 1
 
       if args.decay is not None:
-        optimizer._lr = learning_rate(tf.cast(PARAMS['step'], dtype=tf.float32))
+        lr.assign(learning_rate(tf.cast(PARAMS['step'], dtype=tf.float32)))
 
+    if num_sampled > 0:
+      batch_loss = train_step(nodes, labels, node1, node2, targ)
+    else:
       batch_loss, acc, ppl = train_step(nodes, labels, node1, node2, targ)
-      if batch % 100 == 0:
-        print('Step {} Learning Rate {:.4f} Train Loss {:.4f} '
-              'Accuracy {:.4f} Perplex {:.4f}'.format(PARAMS['step'],
-                                                      optimizer._lr,
-                                                      train_loss.result(),
-                                                      acc.numpy(),
-                                                      ppl.numpy()))
-        print('Time {} \n'.format(time.time() - start))
-      # log the training results
+    if micro_batch < accum_steps - 1:
+      continue
+    if accum_steps > 1:
+      apply_step()
+
+    # from here on batch counts the optimizer updates
+    batch = batch // accum_steps
+    # the full softmax metrics are only computed at the logging steps
+    if num_sampled > 0 and batch % 100 == 0:
+      acc, ppl = metric_step(nodes, labels, node1, node2, targ)
+    if batch % 100 == 0:
+      print('Step {} Learning Rate {:.4f} Train Loss {:.4f} '
+            'Accuracy {:.4f} Perplex {:.4f}'.format(PARAMS['step'],
+                                                    lr.numpy(),
+                                                    train_loss.result(),
+                                                    acc.numpy(),
+                                                    ppl.numpy()))
+      print('Time {} \n'.format(time.time() - start))
+    # log the training results, with the sampled softmax loss only at the
+    # steps the full softmax metrics were computed for
+    if num_sampled == 0 or batch % 100 == 0:
       tf.io.write_file(log_file,
                        f"Step {PARAMS['step']} Train Accuracy: {acc.numpy()}"
                        f" Loss: {train_loss.result()} Perplexity: {ppl.numpy()} \n")
 
-      if batch % args.eval_steps == 0:
-        metric_dict = eval_step(5)
-        print('\n' + '---------------------------------------------------------------------' + '\n')
-        print('ROGUE {:.4f}'.format(metric_dict))
-        print('\n' + '---------------------------------------------------------------------' + '\n')
-
-      if batch % args.checkpoint == 0:
-        print("Saving checkpoint \n")
-        ckpt_save_path = ckpt_manager.save()
-        with open(log_dir + '/' + args.lang + '_' + args.model + '_params', 'wb+') as fp:
-          pickle.dump(PARAMS, fp)
-    else:
-      break
+    if batch % args.eval_steps == 0:
+      metric_dict = eval_step(5)
+      print('\n' + '---------------------------------------------------------------------' + '\n')
+      print('ROGUE {:.4f}'.format(metric_dict))
+      print('\n' + '---------------------------------------------------------------------' + '\n')
+
+    if batch % args.checkpoint == 0:
+      print("Saving checkpoint \n")
+      ckpt_save_path = ckpt_manager.save()
+      with open(log_dir + '/' + args.lang + '_' + args.model + '_params', 'wb+') as fp:
+        pickle.dump(PARAMS, fp)
 
   rogue, score = test_step()
   print('\n' + '---------------------------------------------------------------------' + '\n')
@@ -0,0 +1,292 @@
+"""
+Utils used at inference time to load the trained models,
+convert triples into model inputs and model outputs into sentences.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import tensorflow as tf
+
+from src.utils.model_utils import Padding as padding
+from src.utils.model_utils import PreProcessSentence, _node_sequences, _tensorize_indices, \
+  set_precision_policy
+from src.utils.vocab import TextVocab
+
+# the model code and sentencepiece are imported by the functions using
+# them, exported models are loaded without them, so eager execution is
+# enabled here rather than by the layers
+tf.enable_eager_execution()
+
+
+def _load_vocab(path, vocab_cache=None):
+  """
+  Unpickles a vocab, the vocabs with the same contents are loaded once
+  and shared by the models loaded with the same vocab_cache.
+  :param path: Path of the pickled vocab
+  :type path: str
+  :param vocab_cache: The vocabs already loaded, keyed by content hash
+  :type vocab_cache: dict
+  :return: the vocab
+  :rtype: tf tokenizer
+  """
+  with open(path, 'rb') as fp:
+    contents = fp.read()
+  if vocab_cache is None:
+    return pickle.loads(contents)
+  key = hashlib.sha1(contents).hexdigest()
+  if key not in vocab_cache:
+    vocab_cache[key] = pickle.loads(contents)
+
+  return vocab_cache[key]
+
+
+def LoadModel(model, lang, dtype=None, quantized=False, vocab_cache=None):
+  """
+  Function to load the model from stored checkpoint.
+  :param model: The model used to verbalise the triples
+  :type model: str
+  :param lang: Language of the target sentences
+  :type lang: str
+  :param dtype: Compute dtype used for inference, overrides the
+                one the model was trained with (float32, bfloat16)
+  :type dtype: str
+  :param quantized: Load the int8 weights exported by quantize.py
+  :type quantized: bool
+  :param vocab_cache: Vocabs shared between the loaded models, see _load_vocab
+  :type vocab_cache: dict
+  :return: model, source vocab, target vocab
+  :rtype: tf.keras.Model, tf tokenizer, tf tokenizer or sentencepiece processor
+  """
+  from src.models import GraphAttentionModel
+  from src.utils.quantization import build_model, load_quantized, quantized_weights_path
+
+  if model == 'gat':
+
+    log_dir = 'data/logs'
+    with open(log_dir + '/' + lang + '_model_params', 'rb') as fp:
+      params = pickle.load(fp)
+
+    model_args = params['args']
+    if dtype is not None:
+      model_args.dtype = dtype
+    set_precision_policy(model_args)
+
+    if model_args.use_colab is None:
+      OUTPUT_DIR = 'ckpts/' + model_args.lang
+      if not os.path.isdir(OUTPUT_DIR): os.mkdir(OUTPUT_DIR)
+    else:
+      from google.colab import drive
+
+      drive.mount('/content/gdrive')
+      OUTPUT_DIR = '/content/gdrive/My Drive/ckpts/' + model_args.lang
+      if not os.path.isdir(OUTPUT_DIR): os.mkdir(OUTPUT_DIR)
+
+    if model_args.enc_type == 'gat' and model_args.dec_type == 'transformer':
+      OUTPUT_DIR += '/' + model_args.enc_type + '_' + model_args.dec_type
+
+      # Load the vocabs
+      src_vocab = _load_vocab('vocabs/' + model_args.model + '/' +
+                              lang + '/' + model_args.opt + '_src_vocab', vocab_cache)
+      # loading the target vocab
+      model_args.sentencepiece = 'False'
+      if model_args.sentencepiece == 'True':
+        import sentencepiece as spm
+
+        sp = spm.SentencePieceProcessor()
+        sp.load('vocabs/' + model_args.model + '/' +
+                lang + '/' + 'train_tgt.model')
+        tgt_vocab = sp
+      else:
+        tgt_vocab = src_vocab
+
+      print('Loaded ' + lang + ' Parameters..')
+      model = GraphAttentionModel.TransGAT(params['args'], params['src_vocab_size'], src_vocab,
+                                           params['tgt_vocab_size'], params['max_tgt_length'], tgt_vocab)
+      model.decode_lengths = params.get('decode_lengths')
+
+      if quantized:
+        # the file exported by quantize.py holds every weight, the
+        # training checkpoint is not needed
+        build_model(model)
+        model = load_quantized(model, quantized_weights_path(lang))
+        print('Loaded the dequantized int8 weights')
+      else:
+        # Load the latest checkpoints
+        optimizer = tf.train.AdamOptimizer(beta1=0.9, beta2=0.98,
+                                           epsilon=1e-9)
+
+        ckpt = tf.train.Checkpoint(
+          model=model,
+          optimizer=optimizer
+        )
+
+        ckpt_manager = tf.train.CheckpointManager(ckpt, OUTPUT_DIR, max_to_keep=5)
+        if ckpt_manager.latest_checkpoint:
+          ckpt.restore(ckpt_manager.latest_checkpoint).expect_partial()
+
+    print('Loaded ' + lang + ' model !')
+
+    return model, src_vocab, tgt_vocab
+
+
+def LoadSavedModel(export_dir):
+  """
+  Function to load a model exported by export.py, without the
+  model code, the pickled parameters or the training checkpoint.
+  :param export_dir: Directory of the SavedModel
+  :type export_dir: str
+  :return: the verbalize function, source vocab, target vocab
+           and whether the target vocab is a sentencepiece model
+  :rtype: tf.function, TextVocab, TextVocab or sentencepiece processor, str
+  """
+  loaded = tf.compat.v2.saved_model.load(export_dir)
+  with open(loaded.params_file.asset_path.numpy().decode('utf-8'), 'r') as fp:
+    params = json.load(fp)
+
+  src_vocab = TextVocab(loaded.src_vocab_file.asset_path.numpy().decode('utf-8'))
+  tgt_vocab_path = loaded.tgt_vocab_file.asset_path.numpy().decode('utf-8')
+  if params['sentencepiece'] == 'True':
+    import sentencepiece as spm
+
+    tgt_vocab = spm.SentencePieceProcessor()
+    tgt_vocab.load(tgt_vocab_path)
+  else:
+    tgt_vocab = TextVocab(tgt_vocab_path)
+  print('Loaded exported ' + params['lang'] + ' model !')
+
+  return loaded.verbalize, src_vocab, tgt_vocab, params['sentencepiece']
+
+
+def _tensorize_triples(nodes, labels,
+                       node1, node2, src_vocab, batch_size):
+  """
+  Converts the preprocessed triples into padded id tensors and
+  batches them into a tf.data dataset.
+  """
+  node_tensor = _node_sequences(src_vocab, nodes)
+  label_tensor = src_vocab.texts_to_sequences(labels)
+  node_tensor = padding(
+    tf.keras.preprocessing.sequence.pad_sequences(node_tensor, padding='post'), 16)
+  label_tensor = padding(
+    tf.keras.preprocessing.sequence.pad_sequences(label_tensor, padding='post'), 16)
+  node1_tensor = padding(_tensorize_indices(node1), 16)
+  node2_tensor = padding(_tensorize_indices(node2), 16)
+
+  dataset = tf.data.Dataset.from_tensor_slices((node_tensor, label_tensor,
+                                                node1_tensor, node2_tensor))
+  dataset = dataset.batch(batch_size, drop_remainder=False)
+
+  return dataset
+
+
+def _sort_by_size(nodes, labels, node1, node2):
+  """
+  Sorts the preprocessed triples by number of edges and nodes, so that
+  the batches hold graphs of similar sizes and their decoding stops
+  at similar lengths.
+  :param nodes: The node lists of the inputs
+  :type nodes: list
+  :return: sorted nodes, labels, node1, node2, and the original position
+           of every sorted input
+  :rtype: list, list, list, list, list
+  """
+  order = sorted(range(len(nodes)), key=lambda i: (len(labels[i]), len(nodes[i])))
+
+  return ([nodes[i] for i in order], [labels[i] for i in order],
+          [node1[i] for i in order], [node2[i] for i in order], order)
+
+
+def _restore_order(results, order):
+  """
+  Puts the results of sorted inputs back in the original order, every
+  input can have several consecutive results (e.g. samples).
+  :param results: The results of the sorted inputs
+  :type results: list
+  :param order: The original position of every sorted input, as returned
+                by _sort_by_size
+  :type order: list
+  :return: results in the original order
+  :rtype: list
+  """
+  group = len(results) // len(order)
+  restored = [None] * len(order)
+  for position, index in enumerate(order):
+    restored[index] = results[position * group:(position + 1) * group]
+
+  return [result for results_group in restored for result in results_group]
+
+
+def _decode_predictions(pred, tgt_vocab, sentencepiece):
+  """
+  Converts a batch of predicted ids into sentences, stripping
+  the start and end tokens.
+  :param pred: predicted ids [batch_size, length]
+  :type pred: list
+  :param tgt_vocab: The target vocab
+  :type tgt_vocab: tf tokenizer or sentencepiece processor
+  :param sentencepiece: Is sentencepiece being used ?
+  :type sentencepiece: str
+  :return: sentences
+  :rtype: list
+  """
+  if sentencepiece == 'True':
+    sentences = [tgt_vocab.DecodeIds(list(ids)) for ids in pred]
+  else:
+    sentences = tgt_vocab.sequences_to_texts(pred)
+
+  return [sentence.partition("<start>")[2].partition("<end>")[0] for sentence in sentences]
+
+
+def _shortlist_candidates(nodes, tgt_vocab, top_k, sentencepiece, lang):
+  """
+  Builds the candidate target vocab for a batch of graphs, used to
+  restrict the output projection and beam search while decoding.
+  The candidates are the special symbols, the top_k most frequent
+  target tokens and the words of the source graph nodes, tokenized
+  like the target sentences.
+  :param nodes: The node strings of the graphs in the batch
+  :type nodes: list
+  :param tgt_vocab: The target vocab
+  :type tgt_vocab: tf tokenizer or sentencepiece processor
+  :param top_k: Number of most frequent target tokens to keep
+  :type top_k: int
+  :param sentencepiece: Is sentencepiece being used ?
+  :type sentencepiece: str
+  :param lang: Language of the target sentences
+  :type lang: str
+  :return: shortlist of target ids, with the padding id first
+           and the end id second as TransGAT.predict expects
+  :rtype: np.array
+  """
+  from src.models.GraphAttentionModel import EOS_ID
+
+  words = set()
+  for graph in nodes:
+    # the first node is the language token
+    for node in graph[1:]:
+      words.update(PreProcessSentence(node.replace('_', ' '), sentencepiece, lang).split()[1:-1])
+
+  if sentencepiece == 'True':
+    candidates = set(range(min(top_k, tgt_vocab.get_piece_size())))
+    candidates.update(tgt_vocab.EncodeAsIds(' '.join(sorted(words))))
+  elif getattr(tgt_vocab, 'target_words', None) is not None:
+    candidates = set(tgt_vocab.word_index[w] for w in tgt_vocab.target_words[:top_k])
+  else:
+    # vocabs preprocessed without target_words, the keras word_index is
+    # ranked by the frequency of the source and target tokens, starting at 1
+    candidates = set(range(1, min(top_k, len(tgt_vocab.word_index)) + 1))
+  if sentencepiece != 'True':
+    candidates.update(tgt_vocab.word_index[w] for w in ['<start>', '<end>']
+                      if w in tgt_vocab.word_index)
+    candidates.update(tgt_vocab.word_index[w] for w in words
+                      if w in tgt_vocab.word_index)
+  candidates.difference_update([0, EOS_ID])
+
+  return np.array([0, EOS_ID] + sorted(candidates), dtype=np.int32)
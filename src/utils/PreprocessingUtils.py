@@ -122,15 +122,19 @@ def PreProcess(path, lang):
   node 1 - Dwarak, node2 - loves, node3 - Physics
   Label of edge between node1 - node2 - A_ZERO
   Label of edge between node3 - node3 - A_ONE
+  The edges are stored as the positions of their end nodes
+  in the node list, (1, 2) and (2, 3) here, as the language
+  token is at position 0.
 
   This way we impart the structural information of the triple set
   into the models inputs.
 
-  :param path: The path to the RDF triple source file
-  :type path: str
+  :param path: The path to the RDF triple source file, or the triple
+               set lines themselves
+  :type path: str or list
   :param lang: The language on which we are operating
   :type lang: str
-  :return: nodes_list, node1 of edges, node2 of edges, and edge labels
+  :return: nodes_list, edge labels, node1 and node2 positions of edges
   :rtype:list
 
   """
@@ -138,7 +142,7 @@ def PreProcess(path, lang):
   labels = []
   node1 = []
   node2 = []
-  dest = open(path, 'r')
+  dest = open(path, 'r') if isinstance(path, str) else path
   lang = '<' + lang + '>'
   for line in dest:
     g = nx.MultiDiGraph()
@@ -159,15 +163,17 @@ def PreProcess(path, lang):
     # print(node_list)
     nodes.append(node_list)
     edge_list = list(g.edges.data())
+    positions = {node: i for i, node in enumerate(node_list)}
     for edge in edge_list:
-      temp_node1.append(edge[0])
-      temp_node2.append(edge[1])
+      temp_node1.append(positions[edge[0]])
+      temp_node2.append(positions[edge[1]])
       label = (edge[2]['label'])
       temp_label.append(label)
     node1.append(temp_node1)
     node2.append(temp_node2)
     labels.append(temp_label)
 
-  dest.close()
+  if isinstance(path, str):
+    dest.close()
 
   return nodes, labels, node1, node2
@@ -67,7 +67,6 @@ class SequenceBeamSearch(object):
     finished_state = finished_state[0]
 
     alive_seq = finished_state[_StateKeys.ALIVE_SEQ]
-    alive_log_probs = finished_state[_StateKeys.ALIVE_LOG_PROBS]
     finished_seq = finished_state[_StateKeys.FINISHED_SEQ]
     finished_scores = finished_state[_StateKeys.FINISHED_SCORES]
     finished_flags = finished_state[_StateKeys.FINISHED_FLAGS]
@@ -78,9 +77,16 @@ class SequenceBeamSearch(object):
     finished_seq = tf.where(
       tf.reduce_any(finished_flags, 1), finished_seq, alive_seq)
     finished_scores = tf.where(
-      tf.reduce_any(finished_flags, 1), finished_scores, alive_log_probs)
+      tf.reduce_any(finished_flags, 1), finished_scores,
+      self._normalized_alive_scores(finished_state))
     return finished_seq, finished_scores
 
+  def _normalized_alive_scores(self, state):
+    """Return the log probs of the alive sequences with the length
+    normalization of the finished scores, so both can be compared."""
+    return state[_StateKeys.ALIVE_LOG_PROBS] / _length_normalization(
+      self.alpha, state[_StateKeys.CUR_INDEX])
+
   def _create_initial_state(self, initial_ids, initial_cache):
     """Return initial state dictionary and its shape invariants.
 
@@ -166,12 +172,32 @@ class SequenceBeamSearch(object):
       terminate.
     """
     i = state[_StateKeys.CUR_INDEX]
+
+    not_at_max_decode_length = tf.less(i, self.max_decode_length)
+
+    worst_finished_score_better_than_best_alive_score = tf.reduce_all(
+      self._finished_batch_items(state)
+    )
+
+    return tf.logical_and(
+      not_at_max_decode_length,
+      tf.logical_not(worst_finished_score_better_than_best_alive_score)
+    )
+
+  def _finished_batch_items(self, state):
+    """Return which batch items have provably unchanging finished sequences.
+
+    Args:
+      state: A dictionary with the current loop state.
+
+    Returns:
+      Bool tensor with shape [batch_size], True for the batch items whose
+      worst finished score is better than their best possible alive score.
+    """
     alive_log_probs = state[_StateKeys.ALIVE_LOG_PROBS]
     finished_scores = state[_StateKeys.FINISHED_SCORES]
     finished_flags = state[_StateKeys.FINISHED_FLAGS]
 
-    not_at_max_decode_length = tf.less(i, self.max_decode_length)
-
     # Calculate largest length penalty (the larger penalty, the better score).
     max_length_norm = _length_normalization(self.alpha, self.max_decode_length)
     # Get the best possible scores from alive sequences.
@@ -188,14 +214,7 @@ class SequenceBeamSearch(object):
     lowest_finished_scores += (1.0 -
                                tf.cast(finished_batches, tf.float32)) * -INF
 
-    worst_finished_score_better_than_best_alive_score = tf.reduce_all(
-      tf.greater(lowest_finished_scores, best_alive_scores)
-    )
-
-    return tf.logical_and(
-      not_at_max_decode_length,
-      tf.logical_not(worst_finished_score_better_than_best_alive_score)
-    )
+    return tf.greater(lowest_finished_scores, best_alive_scores)
 
   def _search_step(self, state):
     """Beam search loop body.
@@ -547,7 +566,6 @@ class SequenceBeamSearchV2(SequenceBeamSearch):
     finished_state = finished_state[0]
 
     alive_seq = finished_state[_StateKeys.ALIVE_SEQ]
-    alive_log_probs = finished_state[_StateKeys.ALIVE_LOG_PROBS]
     finished_seq = finished_state[_StateKeys.FINISHED_SEQ]
     finished_scores = finished_state[_StateKeys.FINISHED_SCORES]
     finished_flags = finished_state[_StateKeys.FINISHED_FLAGS]
@@ -561,13 +579,113 @@ class SequenceBeamSearchV2(SequenceBeamSearch):
     # particular batch item. In that case, return alive sequences for that batch
     # item.
     finished_seq = tf.where(seq_cond, finished_seq, alive_seq)
-    finished_scores = tf.where(score_cond, finished_scores, alive_log_probs)
+    finished_scores = tf.where(score_cond, finished_scores,
+                               self._normalized_alive_scores(finished_state))
     return finished_seq, finished_scores
 
 
+class CompactingSequenceBeamSearch(SequenceBeamSearch):
+  """Beam search that drops the finished batch items while searching.
+
+  The search loop is run in chunks of compact_every steps. After each chunk
+  the batch items whose finished sequences are provably unchanging are
+  removed from the alive state and cache, so that symbols_to_logits_fn only
+  runs on the items still searching. The results are put back in the input
+  order at the end.
+  """
+
+  def __init__(self, symbols_to_logits_fn, vocab_size, batch_size, beam_size,
+               alpha, max_decode_length, eos_id, compact_every,
+               decode_length_cap=None):
+    super(CompactingSequenceBeamSearch, self).__init__(
+      symbols_to_logits_fn, vocab_size, batch_size, beam_size, alpha,
+      max_decode_length, eos_id)
+    self.compact_every = compact_every
+    # the chunks are unrolled up to a static length
+    self.decode_length_cap = decode_length_cap or max_decode_length
+
+  def search(self, initial_ids, initial_cache):
+    """Beam search for sequences with highest scores."""
+    state, state_shapes = self._create_initial_state(initial_ids, initial_cache)
+
+    # The search steps read the size of the compacted batch from
+    # self.batch_size, the constructor argument is restored once it is done
+    input_batch_size = self.batch_size
+    try:
+      return self._compacting_search(state, state_shapes)
+    finally:
+      self.batch_size = input_batch_size
+
+  def _compacting_search(self, state, state_shapes):
+    """Runs the search by chunks of compact_every steps, dropping the
+    finished batch items from the state between the chunks."""
+    # Position in the input batch of the batch items still searching
+    batch_index = tf.range(self.batch_size)
+    done_index, done_seq, done_scores = [], [], []
+
+    for chunk_end in range(self.compact_every,
+                           self.decode_length_cap + self.compact_every,
+                           self.compact_every):
+      state = tf.while_loop(
+        lambda state: tf.logical_and(
+          self._continue_search(state),
+          tf.less(state[_StateKeys.CUR_INDEX], chunk_end)),
+        self._search_step, loop_vars=[state],
+        shape_invariants=[state_shapes], parallel_iterations=1,
+        back_prop=False)[0]
+      if chunk_end >= self.decode_length_cap:
+        break
+
+      # Move the results of the finished batch items out of the state
+      finished = self._finished_batch_items(state)
+      seq, scores = self._top_sequences(state)
+      done_index.append(tf.boolean_mask(batch_index, finished))
+      done_seq.append(tf.boolean_mask(seq, finished))
+      done_scores.append(tf.boolean_mask(scores, finished))
+
+      alive = tf.where(tf.logical_not(finished))[:, 0]
+      batch_index = tf.gather(batch_index, alive)
+      cur_index = state.pop(_StateKeys.CUR_INDEX)
+      state = nest.map_structure(lambda t: tf.gather(t, alive), state)
+      state[_StateKeys.CUR_INDEX] = cur_index
+      batch_size = tf.shape(batch_index)[0]
+      self.batch_size = batch_size
+      if tf.executing_eagerly() and (int(batch_size) == 0 or
+                                     chunk_end >= self.max_decode_length):
+        break
+
+    seq, scores = self._top_sequences(state)
+    done_index.append(batch_index)
+    done_seq.append(seq)
+    done_scores.append(scores)
+
+    # The batch items finished at different steps, pad their sequences to the
+    # same length before restoring the input order.
+    max_length = tf.reduce_max([tf.shape(t)[2] for t in done_seq])
+    done_seq = [tf.pad(t, [[0, 0], [0, 0], [0, max_length - tf.shape(t)[2]]])
+                for t in done_seq]
+    order = tf.math.invert_permutation(tf.concat(done_index, axis=0))
+    return (tf.gather(tf.concat(done_seq, axis=0), order),
+            tf.gather(tf.concat(done_scores, axis=0), order))
+
+  def _top_sequences(self, state):
+    """Return the finished sequences and scores of each batch item, or the
+    alive ones for the batch items without finished sequences."""
+    finished_cond = tf.reduce_any(state[_StateKeys.FINISHED_FLAGS], 1)
+    finished_seq = state[_StateKeys.FINISHED_SEQ]
+    finished_scores = state[_StateKeys.FINISHED_SCORES]
+
+    seq = tf.compat.v2.where(_expand_to_same_rank(finished_cond, finished_seq),
+                             finished_seq, state[_StateKeys.ALIVE_SEQ])
+    scores = tf.compat.v2.where(_expand_to_same_rank(finished_cond, finished_scores),
+                                finished_scores, self._normalized_alive_scores(state))
+    return seq, scores
+
+
 def sequence_beam_search(
         symbols_to_logits_fn, initial_ids, initial_cache, vocab_size, beam_size,
-        alpha, max_decode_length, eos_id):
+        alpha, max_decode_length, eos_id, compact_every=None,
+        decode_length_cap=None):
   """Search for sequence of subtoken ids with the largest probability.
 
   Args:
@@ -585,15 +703,24 @@ def sequence_beam_search(
     vocab_size: int size of tokens
     beam_size: int number of beams
     alpha: float defining the strength of length normalization
-    max_decode_length: maximum length to decoded sequence
+    max_decode_length: maximum length to decoded sequence, int or int32
+      scalar tensor
     eos_id: int id of eos token, used to determine when a sequence has finished
+    compact_every: optional int, the finished batch items are dropped from
+      the search every compact_every steps
+    decode_length_cap: int upper bound of max_decode_length, required with
+      compact_every when max_decode_length is a tensor
 
   Returns:
     Top decoded sequences [batch_size, beam_size, max_decode_length]
     sequence scores [batch_size, beam_size]
   """
   batch_size = tf.shape(initial_ids)[0]
-  if is_v2():
+  if compact_every:
+    sbs = CompactingSequenceBeamSearch(symbols_to_logits_fn, vocab_size, batch_size,
+                                       beam_size, alpha, max_decode_length, eos_id,
+                                       compact_every, decode_length_cap)
+  elif is_v2():
     sbs = SequenceBeamSearchV2(symbols_to_logits_fn, vocab_size, batch_size,
                                beam_size, alpha, max_decode_length, eos_id)
   else:
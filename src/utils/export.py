@@ -0,0 +1,80 @@
+"""
+Export of trained models as inference-only SavedModels.
+
+The SavedModel only holds the model variables (no optimizer slots), the
+vocabs as assets and a `verbalize(nodes, labels, node1, node2)` function,
+so it can be loaded with tf.saved_model.load without the model code.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+
+import tensorflow as tf
+
+from src.utils.model_utils import graph_input_signature
+from src.utils.vocab import save_vocab
+
+SRC_VOCAB_FILE = 'src_vocab.txt'
+TGT_VOCAB_FILE = 'tgt_vocab.txt'
+TGT_SENTENCEPIECE_FILE = 'tgt_vocab.model'
+PARAMS_FILE = 'params.json'
+
+
+class VerbalizerModule(tf.Module):
+  """Module exported with the model, its vocabs and the verbalize function."""
+
+  def __init__(self, model, asset_dir, sentencepiece):
+    super(VerbalizerModule, self).__init__()
+    self.model = model
+    self.params_file = tf.compat.v2.saved_model.Asset(os.path.join(asset_dir, PARAMS_FILE))
+    self.src_vocab_file = tf.compat.v2.saved_model.Asset(os.path.join(asset_dir, SRC_VOCAB_FILE))
+    self.tgt_vocab_file = tf.compat.v2.saved_model.Asset(os.path.join(
+      asset_dir, TGT_SENTENCEPIECE_FILE if sentencepiece else TGT_VOCAB_FILE))
+    self.verbalize = tf.function(self._verbalize, input_signature=graph_input_signature())
+
+  def _verbalize(self, nodes, labels, node1, node2):
+    predictions = self.model(nodes, labels, node1, node2, targ=None, mask=None)
+
+    return {"outputs": predictions["outputs"], "scores": predictions["scores"]}
+
+
+def export_saved_model(model, lang, src_vocab, tgt_vocab, export_dir,
+                       sentencepiece_path=None):
+  """
+  Writes the inference-only SavedModel of a built model.
+  :param model: The built model, with its weights restored
+  :type model: TransGAT
+  :param lang: Language of the model
+  :type lang: str
+  :param src_vocab: The source vocab
+  :type src_vocab: tf tokenizer
+  :param tgt_vocab: The target vocab
+  :type tgt_vocab: tf tokenizer or sentencepiece processor
+  :param export_dir: Directory the SavedModel is written to
+  :type export_dir: str
+  :param sentencepiece_path: Path of the sentencepiece model, if the
+                             target vocab is a sentencepiece processor
+  :type sentencepiece_path: str
+  """
+  model.trainable = False
+  asset_dir = tempfile.mkdtemp()
+  try:
+    save_vocab(src_vocab, os.path.join(asset_dir, SRC_VOCAB_FILE))
+    if sentencepiece_path is not None:
+      shutil.copy(sentencepiece_path, os.path.join(asset_dir, TGT_SENTENCEPIECE_FILE))
+    else:
+      save_vocab(tgt_vocab, os.path.join(asset_dir, TGT_VOCAB_FILE))
+    with open(os.path.join(asset_dir, PARAMS_FILE), 'w') as fp:
+      json.dump({"lang": lang,
+                 "sentencepiece": 'True' if sentencepiece_path is not None else 'False'}, fp)
+
+    module = VerbalizerModule(model, asset_dir, sentencepiece_path is not None)
+    tf.compat.v2.saved_model.save(module, export_dir,
+                                  signatures={"verbalize": module.verbalize})
+  finally:
+    shutil.rmtree(asset_dir)
@@ -0,0 +1,147 @@
+"""Greedy search to find the translated sequence, used instead of beam search
+when the beam size is 1.
+
+It returns the same outputs as beam_search.sequence_beam_search with a beam
+of size 1, without the tiling, top_k and cache gathering of the beam search.
+"""
+
+import tensorflow as tf
+from tensorflow.python.util import nest
+
+from src.utils.beam_search import _get_shape_keep_last_dim, _length_normalization
+
+
+class _StateKeys(object):
+  """Keys to dictionary storing the state of the greedy search loop."""
+
+  # Variable storing the loop index.
+  CUR_INDEX = "CUR_INDEX"
+  # Decoded sequences, shape [batch_size, CUR_INDEX + 1]. Sequences that
+  # are finished are padded with 0s.
+  SEQ = "SEQ"
+  # Log probabilities of the sequences. Shape [batch_size]
+  LOG_PROBS = "LOG_PROBS"
+  # Length of the finished sequences (0 while alive). Shape [batch_size]
+  LENGTHS = "LENGTHS"
+  # Flags indicating which sequences have generated an EOS token.
+  FINISHED_FLAGS = "FINISHED_FLAGS"
+  # Dictionary of cached values passed to the symbols_to_logits_fn.
+  CACHE = "CACHE"
+
+
+class SequenceGreedySearch(object):
+  """Implementation of the greedy search loop."""
+
+  def __init__(self, symbols_to_logits_fn, alpha, max_decode_length, eos_id):
+    self.symbols_to_logits_fn = symbols_to_logits_fn
+    self.alpha = alpha
+    self.max_decode_length = max_decode_length
+    self.eos_id = eos_id
+
+  def search(self, initial_ids, initial_cache):
+    """Greedy search for sequences, each row stops at its EOS."""
+    batch_size = tf.shape(initial_ids)[0]
+    state = {
+      _StateKeys.CUR_INDEX: tf.constant(0),
+      _StateKeys.SEQ: tf.expand_dims(initial_ids, 1),
+      _StateKeys.LOG_PROBS: tf.zeros([batch_size]),
+      _StateKeys.LENGTHS: tf.zeros([batch_size], tf.int32),
+      _StateKeys.FINISHED_FLAGS: tf.zeros([batch_size], tf.bool),
+      _StateKeys.CACHE: initial_cache
+    }
+    state_shape_invariants = {
+      _StateKeys.CUR_INDEX: tf.TensorShape([]),
+      _StateKeys.SEQ: tf.TensorShape([None, None]),
+      _StateKeys.LOG_PROBS: tf.TensorShape([None]),
+      _StateKeys.LENGTHS: tf.TensorShape([None]),
+      _StateKeys.FINISHED_FLAGS: tf.TensorShape([None]),
+      _StateKeys.CACHE: nest.map_structure(_get_shape_keep_last_dim, initial_cache)
+    }
+
+    finished_state = tf.while_loop(
+      self._continue_search, self._search_step, loop_vars=[state],
+      shape_invariants=[state_shape_invariants], parallel_iterations=1,
+      back_prop=False)
+    finished_state = finished_state[0]
+
+    # Like the beam search, the scores are length normalized, by the length
+    # of the finished sequences and by the decoded length of the others.
+    finished_flags = finished_state[_StateKeys.FINISHED_FLAGS]
+    log_probs = finished_state[_StateKeys.LOG_PROBS]
+    scores = tf.where(
+      finished_flags,
+      log_probs / _length_normalization(self.alpha, finished_state[_StateKeys.LENGTHS]),
+      log_probs / _length_normalization(self.alpha, finished_state[_StateKeys.CUR_INDEX]))
+
+    return (tf.expand_dims(finished_state[_StateKeys.SEQ], 1),
+            tf.expand_dims(scores, 1))
+
+  def _continue_search(self, state):
+    """Return whether to continue the search loop, stops when the maximum
+    decode length is reached or when all sequences have finished."""
+    not_at_max_decode_length = tf.less(
+      state[_StateKeys.CUR_INDEX], self.max_decode_length)
+    all_finished = tf.reduce_all(state[_StateKeys.FINISHED_FLAGS])
+    return tf.logical_and(not_at_max_decode_length, tf.logical_not(all_finished))
+
+  def _next_ids(self, logits):
+    """Picks the next id of every sequence, the most probable one."""
+    return tf.argmax(logits, axis=1, output_type=tf.int32)
+
+  def _search_step(self, state):
+    """Appends the most probable next id to every alive sequence."""
+    i = state[_StateKeys.CUR_INDEX]
+    seq = state[_StateKeys.SEQ]
+    finished_flags = state[_StateKeys.FINISHED_FLAGS]
+
+    logits, new_cache = self.symbols_to_logits_fn(seq, i, state[_StateKeys.CACHE])
+    log_probs = logits - tf.reduce_logsumexp(logits, axis=1, keepdims=True)
+    next_ids = self._next_ids(logits)
+    next_log_probs = tf.gather(log_probs, tf.expand_dims(next_ids, 1), batch_dims=1)[:, 0]
+
+    # finished sequences are padded with 0s and keep their log probability
+    next_ids = tf.where(finished_flags, tf.zeros_like(next_ids), next_ids)
+    next_log_probs = tf.where(finished_flags, tf.zeros_like(next_log_probs),
+                              next_log_probs)
+    new_finished = tf.logical_and(tf.logical_not(finished_flags),
+                                  tf.equal(next_ids, self.eos_id))
+    lengths = tf.where(new_finished, tf.fill(tf.shape(next_ids), i + 1),
+                       state[_StateKeys.LENGTHS])
+
+    return [{
+      _StateKeys.CUR_INDEX: i + 1,
+      _StateKeys.SEQ: tf.concat([seq, tf.expand_dims(next_ids, 1)], axis=1),
+      _StateKeys.LOG_PROBS: state[_StateKeys.LOG_PROBS] + next_log_probs,
+      _StateKeys.LENGTHS: lengths,
+      _StateKeys.FINISHED_FLAGS: tf.logical_or(finished_flags, new_finished),
+      _StateKeys.CACHE: new_cache
+    }]
+
+
+def sequence_greedy_search(
+        symbols_to_logits_fn, initial_ids, initial_cache, alpha,
+        max_decode_length, eos_id):
+  """Search for sequence of subtoken ids picking the most probable id each step.
+
+  Args:
+    symbols_to_logits_fn: A function that takes in ids, index, and cache as
+      arguments. The passed in arguments will have shape:
+        ids -> [batch_size, index]
+        index -> [] (scalar)
+        cache -> nested dictionary of tensors [batch_size, ...]
+      The function must return logits and new cache.
+        logits -> [batch, vocab_size]
+        new cache -> same shape/structure as inputted cache
+    initial_ids: Starting ids for each batch item.
+      int32 tensor with shape [batch_size]
+    initial_cache: dict containing starting decoder variables information
+    alpha: float defining the strength of length normalization of the scores
+    max_decode_length: maximum length to decoded sequence
+    eos_id: int id of eos token, used to determine when a sequence has finished
+
+  Returns:
+    Decoded sequences [batch_size, 1, decoded_length + 1]
+    sequence scores [batch_size, 1]
+  """
+  sgs = SequenceGreedySearch(symbols_to_logits_fn, alpha, max_decode_length, eos_id)
+  return sgs.search(initial_ids, initial_cache)
@@ -0,0 +1,58 @@
+"""
+Inference settings recommended by autotune.py for a model on this host,
+loaded by translate.py and serve.py when their flags are not given.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+
+
+def inference_config_path(lang):
+  """
+  Path of the inference config of the model of a language.
+  :param lang: Language of the model
+  :type lang: str
+  :return: path of the .json file
+  :rtype: str
+  """
+  return 'data/logs/{}_inference_config.json'.format(lang)
+
+
+def load_inference_config(lang):
+  """
+  Loads the inference config written by autotune.py.
+  :param lang: Language of the model
+  :type lang: str
+  :return: batch_size, intra_op_parallelism and inter_op_parallelism,
+           empty if the model was not tuned
+  :rtype: dict
+  """
+  path = inference_config_path(lang)
+  if not os.path.isfile(path):
+    return {}
+  with open(path, 'r') as fp:
+    config = json.load(fp)
+  print('Loaded the inference config ' + path)
+
+  return config
+
+
+def set_thread_pools(intra_op=0, inter_op=0):
+  """
+  Sizes the TensorFlow thread pools, before any op runs.
+  :param intra_op: Threads used inside an op, 0 for the TensorFlow default
+  :type intra_op: int
+  :param inter_op: Ops run in parallel, 0 for the TensorFlow default
+  :type inter_op: int
+  """
+  if intra_op <= 0 and inter_op <= 0:
+    return
+  import tensorflow as tf
+
+  if intra_op > 0:
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+  if inter_op > 0:
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
@@ -60,6 +60,45 @@ def padded_cross_entropy_loss(logits, labels, smoothing, vocab_size):
     return xentropy * weights, weights
 
 
+def padded_sampled_softmax_loss(hidden, labels, softmax_weights,
+                                num_sampled, vocab_size):
+  """Calculate sampled softmax cross entropy loss while ignoring padding.
+
+  The logits of only num_sampled negative classes (and the true class)
+  are computed, so [batch_size, length, vocab_size] is never materialized.
+  No label smoothing is applied.
+
+  Args:
+    hidden: Tensor of size [batch_size, length_hidden, hidden_size], the
+      decoder outputs before the output projection
+    labels: Tensor of size [batch_size, length_labels]
+    softmax_weights: Tensor of size [vocab_size, hidden_size], the weights
+      of the output projection
+    num_sampled: int number of classes to sample per batch
+    vocab_size: int size of the vocabulary
+
+  Returns:
+    Returns the cross entropy loss and weight tensors: float32 tensors with
+      shape [batch_size, max(length_hidden, length_labels)]
+  """
+  with tf.name_scope("sampled_loss"):
+    hidden, labels = _pad_tensors_to_same_length(tf.cast(hidden, tf.float32), labels)
+    batch_size = tf.shape(labels)[0]
+    length = tf.shape(labels)[1]
+
+    xentropy = tf.nn.sampled_softmax_loss(
+      weights=tf.cast(softmax_weights, tf.float32),
+      biases=tf.zeros([vocab_size], dtype=tf.float32),
+      labels=tf.reshape(tf.cast(labels, tf.int64), [-1, 1]),
+      inputs=tf.reshape(hidden, [batch_size * length, -1]),
+      num_sampled=num_sampled,
+      num_classes=vocab_size)
+    xentropy = tf.reshape(xentropy, [batch_size, length])
+
+    weights = tf.cast(tf.not_equal(labels, 0), tf.float32)
+    return xentropy * weights, weights
+
+
 def padded_accuracy(logits, labels):
   """Percentage of times that predictions matches labels on non-0s."""
   with tf.name_scope("padded_accuracy"):
@@ -114,7 +153,8 @@ class MetricLayer(tf.keras.layers.Layer):
   """Custom a layer of metrics for Transformer model."""
 
   def __init__(self, vocab_size):
-    super(MetricLayer, self).__init__()
+    # metrics are always computed in float32
+    super(MetricLayer, self).__init__(dtype='float32')
     self.vocab_size = vocab_size
     self.metric_mean_fns = []
 
@@ -159,23 +199,55 @@ def transformer_loss(logits, labels, smoothing, vocab_size):
   return tf.reduce_sum(xentropy) / tf.reduce_sum(weights)
 
 
+def sampled_transformer_loss(hidden, labels, softmax_weights,
+                             num_sampled, vocab_size):
+  """Calculates total sampled softmax loss with padding ignored.
+
+  Args:
+    hidden: Tensor of size [batch_size, length_hidden, hidden_size]
+    labels: Tensor of size [batch_size, length_labels]
+    softmax_weights: Tensor of size [vocab_size, hidden_size]
+    num_sampled: int number of classes to sample per batch
+    vocab_size: int size of the vocabulary
+
+  Returns:
+    A scalar float tensor for loss.
+  """
+  xentropy, weights = padded_sampled_softmax_loss(hidden, labels, softmax_weights,
+                                                  num_sampled, vocab_size)
+  return tf.reduce_sum(xentropy) / tf.reduce_sum(weights)
+
+
 class LossLayer(tf.keras.layers.Layer):
-  """Custom a layer of transformer loss for Transformer model."""
+  """Custom a layer of transformer loss for Transformer model.
 
-  def __init__(self, vocab_size, label_smoothing):
-    super(LossLayer, self).__init__()
+  With num_sampled > 0 the layer computes the sampled softmax loss,
+  it then takes [hidden, targets, softmax_weights] as inputs instead
+  of [logits, targets].
+  """
+
+  def __init__(self, vocab_size, label_smoothing, num_sampled=0):
+    # the loss is always computed in float32
+    super(LossLayer, self).__init__(dtype='float32')
     self.vocab_size = vocab_size
     self.label_smoothing = label_smoothing
+    self.num_sampled = num_sampled
 
   def get_config(self):
     return {
       "vocab_size": self.vocab_size,
       "label_smoothing": self.label_smoothing,
+      "num_sampled": self.num_sampled,
     }
 
   def call(self, inputs):
-    logits, targets = inputs[0], inputs[1]
-    loss = transformer_loss(logits, targets, self.label_smoothing,
-                            self.vocab_size)
+    if self.num_sampled > 0:
+      hidden, targets, softmax_weights = inputs[0], inputs[1], inputs[2]
+      loss = sampled_transformer_loss(hidden, targets, softmax_weights,
+                                      self.num_sampled, self.vocab_size)
+    else:
+      logits, targets = inputs[0], inputs[1]
+      loss = transformer_loss(logits, targets, self.label_smoothing,
+                              self.vocab_size)
     self.add_loss(loss)
     return loss
@@ -4,6 +4,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
+import hashlib
 import math
 import os
 import re
@@ -11,9 +13,10 @@ import unicodedata
 
 import numpy as np
 import tensorflow as tf
-import tensorflow.contrib.slim as slim
 
 _NEG_INF = -1e9
+# node of the source vocabs standing for the nodes not seen in training
+UNKNOWN_NODE = '<unk>'
 
 
 def _set_up_dirs(args):
@@ -57,6 +60,57 @@ def _tensorize(vocab, text):
   return tensor
 
 
+def _node_sequences(vocab, nodes):
+  """
+  Function to convert node lists into id lists of the same length,
+  so the edge positions returned by PreProcess still point at their
+  nodes. The nodes missing from the vocab get the id of UNKNOWN_NODE,
+  or the padding id with the vocabs built without it.
+  :param vocab: The source vocab
+  :type vocab: tf.tokenizer obj or TextVocab
+  :param nodes: A list of node lists
+  :type nodes: list
+  :return: the id lists
+  :rtype: list
+  """
+  unknown = vocab.word_index.get(UNKNOWN_NODE, 0)
+
+  return [[vocab.word_index.get(node.lower(), unknown) for node in node_list]
+          for node_list in nodes]
+
+
+def _tensorize_nodes(vocab, nodes):
+  """
+  Function to convert node lists into padded id sequences,
+  one id per node, see _node_sequences.
+  :param vocab: The source vocab
+  :type vocab: tf.tokenizer obj or TextVocab
+  :param nodes: A list of node lists
+  :type nodes: list
+  :return: tensorised nodes
+  :rtype: tf.tensor
+  """
+  tensor = tf.keras.preprocessing.sequence.pad_sequences(_node_sequences(vocab, nodes),
+                                                         padding='post')
+
+  return tensor
+
+
+def _tensorize_indices(indices):
+  """
+  Function to pad lists of integer positions, like the
+  edge endpoints returned by PreProcess, into a tensor.
+  :param indices: A list of lists of positions
+  :type indices: list
+  :return: tensorised positions
+  :rtype: tf.tensor
+  """
+  tensor = tf.keras.preprocessing.sequence.pad_sequences(indices,
+                                                         padding='post')
+
+  return tensor
+
+
 def read_sentencepiece_vocab(filepath):
   voc = []
   with open(filepath, encoding='utf-8') as fi:
@@ -78,6 +132,32 @@ def max_length(tensor):
   return max(len(t) for t in tensor)
 
 
+def decode_length_table(label_tensor, target_tensor, margin, cap):
+  """
+  Maximum decode length for each number of edges of the input graph,
+  fitted on the training set. The longest target seen for graphs with
+  at most that many edges, increased by the margin and capped.
+  :param label_tensor: The padded edge labels of the training set
+  :type label_tensor: np.array
+  :param target_tensor: The padded targets of the training set
+  :type target_tensor: np.array
+  :param margin: Fraction added to the observed lengths
+  :type margin: float
+  :param cap: Maximum decode length, also used for graphs with more
+              edges than seen in the training set (the last entry)
+  :type cap: int
+  :return: decode length indexed by the number of edges
+  :rtype: list
+  """
+  num_edges = np.count_nonzero(label_tensor, axis=1)
+  target_lengths = np.count_nonzero(target_tensor, axis=1)
+  table = np.zeros(num_edges.max() + 1, dtype=np.int64)
+  np.maximum.at(table, num_edges, target_lengths)
+  table = np.ceil(np.maximum.accumulate(table) * (1. + margin)).astype(np.int64)
+
+  return np.minimum(table, cap).tolist() + [cap]
+
+
 def convert(lang, tensor):
   for t in tensor:
     if t != 0:
@@ -125,6 +205,23 @@ def PreProcessSentence(w, sentencepiece, lang):
   return w
 
 
+def target_words_by_count(sentences):
+  """
+  Ranks the words of the preprocessed target sentences by count, as the
+  shared vocab counts the source nodes too. It ranks the shortlist
+  candidates of translate.py --shortlist.
+  :param sentences: The preprocessed target sentences
+  :type sentences: list
+  :return: the target words, the most frequent first
+  :rtype: list
+  """
+  counts = collections.Counter()
+  for sentence in sentences:
+    counts.update(sentence.lower().split())
+
+  return [word for word, _ in counts.most_common()]
+
+
 def model_summary(model):
   """
   Gives summary of model and its params
@@ -133,6 +230,9 @@ def model_summary(model):
   :return: summary text
   :rtype: write obj
   """
+  # tf.contrib is slow to import, only the summary needs it
+  import tensorflow.contrib.slim as slim
+
   model_vars = model.trainable_variables
   slim.model_analyzer.analyze_vars(model_vars, print_info=True)
 
@@ -359,6 +459,113 @@ class CustomSchedule(tf.keras.optimizers.schedules.LearningRateSchedule):
     return tf.math.rsqrt(self.d_model) * tf.math.minimum(arg1, arg2)
 
 
+def graph_input_signature(with_target=False):
+  """
+  Input signature of the graph inputs (nodes, labels, node1, node2)
+  and optionally the target sequences, used to compile the model steps
+  with a fixed signature so they are traced only once.
+
+  :param with_target: Add the target sequence spec to the signature
+  :type with_target: bool
+  :return: list of tensor specs
+  :rtype: list
+  """
+  signature = [tf.TensorSpec([None, None], tf.int32, name=name)
+               for name in ('nodes', 'labels', 'node1', 'node2')]
+  if with_target:
+    signature.append(tf.TensorSpec([None, None], tf.int32, name='targ'))
+
+  return signature
+
+
+def compile_step(fn, input_signature, args):
+  """
+  Compiles a train / eval / predict step into a tf.function graph,
+  optionally with XLA JIT compilation. If the eager flag is set the
+  step is returned as it is, to make debugging easier.
+
+  :param fn: The step function
+  :type fn: callable
+  :param input_signature: list of tf.TensorSpec of the step inputs
+  :type input_signature: list
+  :param args: All arguments that were given to train file
+  :type args: Argparse object
+  :return: compiled step
+  :rtype: callable
+  """
+  if getattr(args, 'eager', 'False') == 'True':
+    return fn
+
+  # XLA is enabled for this step only, not for the whole process
+  return tf.function(fn, input_signature=input_signature,
+                     experimental_compile=getattr(args, 'xla', 'False') == 'True')
+
+
+def dedup_predict(predict_step, memo, nodes, labels, node1, node2):
+  """
+  Runs the predict step only on the distinct graphs of a batch missing
+  from memo, the others reuse the ids predicted for them. The graphs are
+  keyed by their padded input rows, identical in a tensorized dataset.
+
+  :param predict_step: The predict step, returns a dict with the 'outputs' ids
+  :type predict_step: callable
+  :param memo: ids predicted for the graphs decoded so far, updated
+  :type memo: dict
+  :param nodes: node ids of the batch [batch_size, length]
+  :type nodes: tf.Tensor
+  :return: predicted ids of every graph of the batch, number of graphs decoded
+  :rtype: list, int
+  """
+  inputs = [tensor.numpy() for tensor in (nodes, labels, node1, node2)]
+  keys = [hashlib.sha1(b'|'.join(rows[i].tobytes() for rows in inputs)).digest()
+          for i in range(len(inputs[0]))]
+  missing = []
+  for i, key in enumerate(keys):
+    if key not in memo:
+      memo[key] = None
+      missing.append(i)
+  if missing:
+    predictions = predict_step(*[tf.gather(tensor, missing)
+                                 for tensor in (nodes, labels, node1, node2)])
+    for i, ids in zip(missing, predictions['outputs'].numpy().tolist()):
+      memo[keys[i]] = ids
+
+  return [memo[key] for key in keys], len(missing)
+
+
+def get_compute_dtype(args):
+  """
+  Returns the dtype the model computes in, float32 by default and
+  bfloat16 if the mixed precision policy is selected.
+
+  :param args: All arguments that were given to train file
+  :type args: Argparse object
+  :return: compute dtype
+  :rtype: tf.DType
+  """
+  if getattr(args, 'dtype', 'float32') == 'bfloat16':
+    return tf.bfloat16
+
+  return tf.float32
+
+
+def set_precision_policy(args):
+  """
+  Sets the global keras policy so that layers compute in bfloat16
+  while keeping their variables in float32. Must be called before
+  the model is created. Softmax, layer norm and the loss are still
+  computed in float32 by the model itself.
+
+  :param args: All arguments that were given to train file
+  :type args: Argparse object
+  """
+  if get_compute_dtype(args) == tf.bfloat16:
+    policy = tf.keras.mixed_precision.experimental.Policy('mixed_bfloat16')
+  else:
+    policy = tf.keras.mixed_precision.experimental.Policy('float32')
+  tf.keras.mixed_precision.experimental.set_policy(policy)
+
+
 def Padding(tensor, max_length):
   """
   Pads the given tensor to a maximum sequence length along
@@ -0,0 +1,159 @@
+"""
+Int8 weight compression of the GAT-Transformer model.
+
+The kernels of the Dense layers in the graph attention, attention and
+feed forward layers, and the shared embedding matrices, are stored as
+int8 with a symmetric scale per output channel, a quarter of their
+float32 size, next to the other weights in float32. The model is built
+from this file alone, without the training checkpoint and its optimizer
+state. The int8 weights are dequantized once when the model is loaded,
+the model then runs its usual float matmuls: TensorFlow has no fast
+int8 matmul kernels for these layers on CPU, so the inference is not
+faster and uses as much memory as the float model.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from src.layers.AttentionLayer import Attention
+from src.layers.GATLayer import GraphAttentionLayer
+from src.layers.ffn_layer import FeedForwardNetwork
+
+# Layers whose Dense layers are quantized
+QUANTIZED_LAYERS = (GraphAttentionLayer, FeedForwardNetwork, Attention)
+
+
+def quantized_weights_path(lang):
+  """
+  Path of the int8 weights exported for the model of a language.
+  :param lang: Language of the model
+  :type lang: str
+  :return: path of the .npz file
+  :rtype: str
+  """
+  return 'ckpts/{}/gat_transformer_int8.npz'.format(lang)
+
+
+def quantize_tensor(weights, axis):
+  """
+  Quantizes a float matrix to int8 with a symmetric scale per channel.
+  :param weights: The float weights
+  :type weights: np.array
+  :param axis: The axis reduced to compute the scales, 0 for a Dense
+               kernel [in, out] and 1 for an embedding matrix [vocab, hidden]
+  :type axis: int
+  :return: int8 weights, float32 scales (with the reduced axis kept)
+  :rtype: np.array, np.array
+  """
+  scale = np.max(np.abs(weights), axis=axis, keepdims=True) / 127.
+  scale[scale == 0] = 1.
+  quantized = np.clip(np.round(weights / scale), -127, 127).astype(np.int8)
+
+  return quantized, scale.astype(np.float32)
+
+
+def dequantize_tensor(quantized, scale):
+  """
+  Float weights of int8 weights quantized by quantize_tensor.
+  :param quantized: The int8 weights
+  :type quantized: np.array
+  :param scale: The scales returned by quantize_tensor
+  :type scale: np.array
+  :return: float32 weights
+  :rtype: np.array
+  """
+  return quantized.astype(np.float32) * scale
+
+
+def _quantizable_dense_layers(model):
+  """Yields (parent layer, attribute name, Dense layer) of the quantized layers."""
+  for layer in model.submodules:
+    if isinstance(layer, QUANTIZED_LAYERS):
+      for name, value in sorted(vars(layer).items()):
+        if isinstance(value, tf.keras.layers.Dense):
+          yield layer, name, value
+
+
+def build_model(model):
+  """
+  Runs a dummy batch through the model so that all its variables
+  are created, and restored from the checkpoint.
+  :param model: The loaded model
+  :type model: TransGAT
+  """
+  ids = tf.ones([1, 2], dtype=tf.int32)
+  positions = tf.zeros([1, 2], dtype=tf.int32)
+  model(ids, ids, positions, positions, ids, None)
+
+
+def export_quantized(model, path):
+  """
+  Quantizes the weights of a built model and saves them, with the
+  weights left in float32, so the file holds the whole model.
+  :param model: The built model
+  :type model: TransGAT
+  :param path: Path of the .npz file written
+  :type path: str
+  :return: number of quantized weights
+  :rtype: int
+  """
+  # the weights are keyed by their position in the model, variable
+  # names are not guaranteed to be unique in eager mode
+  arrays = {}
+  quantized_ids = set()
+  for i, (_, _, dense) in enumerate(_quantizable_dense_layers(model)):
+    quantized, scale = quantize_tensor(dense.kernel.numpy(), axis=0)
+    arrays['dense_{}/int8'.format(i)] = quantized
+    arrays['dense_{}/scale'.format(i)] = scale
+    quantized_ids.add(id(dense.kernel))
+  for attr in ['emb_layer', 'tgt_emb_layer']:
+    weights = getattr(model, attr).shared_weights
+    quantized, scale = quantize_tensor(weights.numpy(), axis=1)
+    arrays[attr + '/int8'] = quantized
+    arrays[attr + '/scale'] = scale
+    quantized_ids.add(id(weights))
+  for i, weights in enumerate(model.weights):
+    if id(weights) not in quantized_ids:
+      arrays['float_{}'.format(i)] = weights.numpy()
+  np.savez(path, **arrays)
+
+  return len(quantized_ids)
+
+
+def load_quantized(model, path):
+  """
+  Loads the weights stored at path into a built model, the int8 weights
+  of the Dense layers and the embedding layers dequantized.
+  :param model: The built model
+  :type model: TransGAT
+  :param path: Path of the .npz file written by export_quantized
+  :type path: str
+  :return: The model with the dequantized weights
+  :rtype: TransGAT
+  :raises ValueError: if the weights do not match the model
+  """
+  arrays = np.load(path)
+  for i, weights in enumerate(model.weights):
+    name = 'float_{}'.format(i)
+    if name in arrays:
+      if arrays[name].shape != tuple(weights.shape.as_list()):
+        raise ValueError("Weights {} do not match the model.".format(path))
+      weights.assign(tf.cast(arrays[name], weights.dtype))
+  if not any(name.startswith('float_') for name in arrays):
+    raise ValueError("{} only holds the int8 weights, export it again with "
+                     "quantize.py.".format(path))
+  for i, (_, _, dense) in enumerate(list(_quantizable_dense_layers(model))):
+    quantized = arrays['dense_{}/int8'.format(i)]
+    if quantized.shape != tuple(dense.kernel.shape.as_list()):
+      raise ValueError("Quantized weights {} do not match the model.".format(path))
+    dense.kernel.assign(tf.cast(dequantize_tensor(quantized, arrays['dense_{}/scale'.format(i)]),
+                                dense.kernel.dtype))
+  for attr in ['emb_layer', 'tgt_emb_layer']:
+    weights = getattr(model, attr).shared_weights
+    weights.assign(tf.cast(dequantize_tensor(arrays[attr + '/int8'], arrays[attr + '/scale']),
+                           weights.dtype))
+
+  return model
@@ -0,0 +1,101 @@
+"""Sampling decoder, draws several sequences per input with temperature,
+top-k and top-p (nucleus) filtering of the next token distribution.
+
+The samples of all the inputs are decoded in one batch, every input is
+repeated num_samples times, so the encoder outputs are computed once.
+"""
+
+import tensorflow as tf
+from tensorflow.python.util import nest
+
+from src.utils.beam_search import INF, _expand_to_beam_size, _flatten_beam_dim
+from src.utils.greedy_search import SequenceGreedySearch
+
+
+def filter_logits(logits, top_k=0, top_p=1.0):
+  """Masks the logits of the tokens that can not be sampled.
+
+  Args:
+    logits: float tensor with shape [batch_size, vocab_size]
+    top_k: int, only the top_k most probable tokens are kept, 0 to keep all
+    top_p: float, only the most probable tokens whose cumulative probability
+      reaches top_p are kept, 1.0 to keep all
+
+  Returns:
+    logits with shape [batch_size, vocab_size], -INF for the masked tokens
+  """
+  if top_k > 0:
+    top_k = tf.minimum(top_k, tf.shape(logits)[-1])
+    kth_logits = tf.math.top_k(logits, k=top_k).values[:, -1:]
+    logits = tf.compat.v2.where(logits < kth_logits, -INF, logits)
+  if top_p < 1.0:
+    sorted_logits = tf.sort(logits, axis=-1, direction='DESCENDING')
+    # probability of the more probable tokens, the most probable token
+    # is always kept
+    cumulative_probs = tf.cumsum(tf.nn.softmax(sorted_logits), axis=-1, exclusive=True)
+    min_logits = tf.reduce_min(
+      tf.compat.v2.where(cumulative_probs < top_p, sorted_logits, INF), axis=-1, keepdims=True)
+    logits = tf.compat.v2.where(logits < min_logits, -INF, logits)
+
+  return logits
+
+
+class SequenceSampler(SequenceGreedySearch):
+  """Samples the next id of every sequence instead of picking the most
+  probable one."""
+
+  def __init__(self, symbols_to_logits_fn, alpha, max_decode_length, eos_id,
+               temperature, top_k, top_p):
+    super(SequenceSampler, self).__init__(symbols_to_logits_fn, alpha,
+                                          max_decode_length, eos_id)
+    self.temperature = temperature
+    self.top_k = top_k
+    self.top_p = top_p
+
+  def _next_ids(self, logits):
+    """Samples the next id from the filtered, tempered distribution."""
+    logits = filter_logits(logits / self.temperature, self.top_k, self.top_p)
+    return tf.random.categorical(logits, 1, dtype=tf.int32)[:, 0]
+
+
+def sequence_sample(
+        symbols_to_logits_fn, initial_ids, initial_cache, num_samples, alpha,
+        max_decode_length, eos_id, temperature=1.0, top_k=0, top_p=1.0):
+  """Samples num_samples sequences of subtoken ids per input.
+
+  Args:
+    symbols_to_logits_fn: A function that takes in ids, index, and cache as
+      arguments. The passed in arguments will have shape:
+        ids -> [batch_size * num_samples, index]
+        index -> [] (scalar)
+        cache -> nested dictionary of tensors [batch_size * num_samples, ...]
+      The function must return logits and new cache.
+        logits -> [batch * num_samples, vocab_size]
+        new cache -> same shape/structure as inputted cache
+    initial_ids: Starting ids for each batch item.
+      int32 tensor with shape [batch_size]
+    initial_cache: dict containing starting decoder variables information
+    num_samples: int number of sequences sampled per batch item
+    alpha: float defining the strength of length normalization of the scores
+    max_decode_length: maximum length to decoded sequence
+    eos_id: int id of eos token, used to determine when a sequence has finished
+    temperature: float, the logits are divided by it before sampling
+    top_k: int, sample from the top_k most probable tokens, 0 for all
+    top_p: float, sample from the smallest set of tokens whose cumulative
+      probability reaches top_p, 1.0 for all
+
+  Returns:
+    Sampled sequences [batch_size, num_samples, decoded_length + 1]
+    sequence scores (log probabilities under the model) [batch_size, num_samples]
+  """
+  batch_size = tf.shape(initial_ids)[0]
+  initial_ids = _flatten_beam_dim(_expand_to_beam_size(initial_ids, num_samples))
+  initial_cache = nest.map_structure(
+    lambda t: _flatten_beam_dim(_expand_to_beam_size(t, num_samples)), initial_cache)
+
+  sampler = SequenceSampler(symbols_to_logits_fn, alpha, max_decode_length, eos_id,
+                            temperature, top_k, top_p)
+  seq, scores = sampler.search(initial_ids, initial_cache)
+
+  return (tf.reshape(seq, [batch_size, num_samples, -1]),
+          tf.reshape(scores, [batch_size, num_samples]))
@@ -0,0 +1,237 @@
+"""Speculative greedy decoding, a small draft model proposes the next ids
+and the target model verifies them in one forward pass over the block.
+
+Every step the draft model greedily proposes draft_steps ids, the target
+model runs on the last accepted id and the proposed ids at once, from its
+cache, and the longest prefix of proposals matching its own greedy choices
+is kept, followed by the target id after that prefix. The ids are always
+the target's greedy choices, so the output is the one of
+greedy_search.sequence_greedy_search with the target model.
+
+The same number of ids is accepted for the whole batch, the smallest
+prefix of the alive sequences, so the decoder caches stay rectangular.
+"""
+
+import tensorflow as tf
+from tensorflow.python.util import nest
+
+from src.utils.beam_search import _get_shape_keep_last_dim, _length_normalization
+
+
+class _StateKeys(object):
+  """Keys to dictionary storing the state of the speculative search loop."""
+
+  # Position of the last id of SEQ, the target cache holds the positions
+  # before it.
+  CUR_INDEX = "CUR_INDEX"
+  # Number of positions held by the draft cache.
+  DRAFT_INDEX = "DRAFT_INDEX"
+  # Decoded sequences, shape [batch_size, CUR_INDEX + 1]. Sequences that
+  # are finished are padded with 0s.
+  SEQ = "SEQ"
+  # Log probabilities of the sequences under the target model. Shape [batch_size]
+  LOG_PROBS = "LOG_PROBS"
+  # Length of the finished sequences (0 while alive). Shape [batch_size]
+  LENGTHS = "LENGTHS"
+  # Flags indicating which sequences have generated an EOS token.
+  FINISHED_FLAGS = "FINISHED_FLAGS"
+  # Decoder caches of the target and draft models.
+  TARGET_CACHE = "TARGET_CACHE"
+  DRAFT_CACHE = "DRAFT_CACHE"
+  # Number of forward passes of the target model.
+  TARGET_STEPS = "TARGET_STEPS"
+
+
+def _truncate_cache(cache, length):
+  """Keeps the first length positions of the decoder attention values."""
+  truncated = dict(cache)
+  for name, layer_cache in cache.items():
+    if name.startswith("layer_"):
+      truncated[name] = {"k": layer_cache["k"][:, :length],
+                         "v": layer_cache["v"][:, :length]}
+  return truncated
+
+
+class SpeculativeGreedySearch(object):
+  """Implementation of the speculative greedy search loop."""
+
+  def __init__(self, target_fn, draft_fn, draft_steps, alpha, max_decode_length, eos_id):
+    self.target_fn = target_fn
+    self.draft_fn = draft_fn
+    self.draft_steps = draft_steps
+    self.alpha = alpha
+    self.max_decode_length = max_decode_length
+    self.eos_id = eos_id
+
+  def search(self, initial_ids, target_cache, draft_cache):
+    """Greedy search for sequences, with the ids proposed by the draft model."""
+    batch_size = tf.shape(initial_ids)[0]
+    state = {
+      _StateKeys.CUR_INDEX: tf.constant(0),
+      _StateKeys.DRAFT_INDEX: tf.constant(0),
+      _StateKeys.SEQ: tf.expand_dims(initial_ids, 1),
+      _StateKeys.LOG_PROBS: tf.zeros([batch_size]),
+      _StateKeys.LENGTHS: tf.zeros([batch_size], tf.int32),
+      _StateKeys.FINISHED_FLAGS: tf.zeros([batch_size], tf.bool),
+      _StateKeys.TARGET_CACHE: target_cache,
+      _StateKeys.DRAFT_CACHE: draft_cache,
+      _StateKeys.TARGET_STEPS: tf.constant(0)
+    }
+    state_shape_invariants = {
+      _StateKeys.CUR_INDEX: tf.TensorShape([]),
+      _StateKeys.DRAFT_INDEX: tf.TensorShape([]),
+      _StateKeys.SEQ: tf.TensorShape([None, None]),
+      _StateKeys.LOG_PROBS: tf.TensorShape([None]),
+      _StateKeys.LENGTHS: tf.TensorShape([None]),
+      _StateKeys.FINISHED_FLAGS: tf.TensorShape([None]),
+      _StateKeys.TARGET_CACHE: nest.map_structure(_get_shape_keep_last_dim, target_cache),
+      _StateKeys.DRAFT_CACHE: nest.map_structure(_get_shape_keep_last_dim, draft_cache),
+      _StateKeys.TARGET_STEPS: tf.TensorShape([])
+    }
+
+    finished_state = tf.while_loop(
+      self._continue_search, self._search_step, loop_vars=[state],
+      shape_invariants=[state_shape_invariants], parallel_iterations=1,
+      back_prop=False)
+    finished_state = finished_state[0]
+
+    # the last step can accept ids past the maximum decode length, they
+    # are padding
+    seq = finished_state[_StateKeys.SEQ][:, :self.max_decode_length + 1]
+    finished_flags = finished_state[_StateKeys.FINISHED_FLAGS]
+    log_probs = finished_state[_StateKeys.LOG_PROBS]
+    # the unfinished sequences are normalized by their decoded length, like
+    # in the beam search
+    decoded_length = tf.minimum(finished_state[_StateKeys.CUR_INDEX], self.max_decode_length)
+    scores = tf.where(
+      finished_flags,
+      log_probs / _length_normalization(self.alpha, finished_state[_StateKeys.LENGTHS]),
+      log_probs / _length_normalization(self.alpha, decoded_length))
+
+    return (tf.expand_dims(seq, 1), tf.expand_dims(scores, 1),
+            finished_state[_StateKeys.TARGET_STEPS])
+
+  def _continue_search(self, state):
+    """Return whether to continue the search loop, stops when the maximum
+    decode length is reached or when all sequences have finished."""
+    not_at_max_decode_length = tf.less(
+      state[_StateKeys.CUR_INDEX], self.max_decode_length)
+    all_finished = tf.reduce_all(state[_StateKeys.FINISHED_FLAGS])
+    return tf.logical_and(not_at_max_decode_length, tf.logical_not(all_finished))
+
+  def _draft(self, state):
+    """Greedily proposes draft_steps ids with the draft model.
+
+    The draft model first runs on the ids it has not seen yet, one or two
+    depending on whether all the proposals of the previous step were kept.
+    """
+    i = state[_StateKeys.CUR_INDEX]
+    draft_index = state[_StateKeys.DRAFT_INDEX]
+    draft_cache = state[_StateKeys.DRAFT_CACHE]
+
+    logits, draft_cache = self.draft_fn(
+      state[_StateKeys.SEQ][:, draft_index:], draft_index, draft_cache)
+    draft_ids = [tf.argmax(logits[:, -1], axis=-1, output_type=tf.int32)]
+    for step in range(1, self.draft_steps):
+      logits, draft_cache = self.draft_fn(
+        tf.expand_dims(draft_ids[-1], 1), i + step, draft_cache)
+      draft_ids.append(tf.argmax(logits[:, -1], axis=-1, output_type=tf.int32))
+
+    return tf.stack(draft_ids, axis=1), draft_cache
+
+  def _search_step(self, state):
+    """Appends the accepted proposals and the next target id to every
+    alive sequence."""
+    i = state[_StateKeys.CUR_INDEX]
+    seq = state[_StateKeys.SEQ]
+    finished_flags = state[_StateKeys.FINISHED_FLAGS]
+
+    draft_ids, draft_cache = self._draft(state)
+
+    # Run the target model on the last id and the proposals, its logits
+    # give its greedy choice after each prefix of the proposals.
+    logits, target_cache = self.target_fn(
+      tf.concat([seq[:, -1:], draft_ids], axis=1), i, state[_StateKeys.TARGET_CACHE])
+    log_probs = logits - tf.reduce_logsumexp(logits, axis=-1, keepdims=True)
+    target_ids = tf.argmax(logits, axis=-1, output_type=tf.int32)
+
+    # Length of the matching prefix, finished sequences do not limit it
+    matches = tf.cumprod(tf.cast(tf.equal(draft_ids, target_ids[:, :-1]), tf.int32), axis=1)
+    num_accepted = tf.where(finished_flags,
+                            tf.fill(tf.shape(finished_flags), self.draft_steps),
+                            tf.reduce_sum(matches, axis=1))
+    num_accepted = tf.reduce_min(num_accepted)
+
+    next_ids = target_ids[:, :num_accepted + 1]
+    next_log_probs = tf.gather(log_probs[:, :num_accepted + 1],
+                               tf.expand_dims(next_ids, -1), batch_dims=2)[:, :, 0]
+
+    # finished sequences, the ids after an EOS and the ids past the maximum
+    # decode length are padded with 0s
+    positions = i + 1 + tf.range(num_accepted + 1)
+    is_eos = tf.equal(next_ids, self.eos_id)
+    padding = tf.logical_or(
+      tf.logical_or(tf.expand_dims(finished_flags, 1),
+                    tf.cumsum(tf.cast(is_eos, tf.int32), axis=1, exclusive=True) > 0),
+      tf.expand_dims(positions > self.max_decode_length, 0))
+    next_ids = tf.compat.v2.where(padding, 0, next_ids)
+    next_log_probs = tf.compat.v2.where(padding, 0., next_log_probs)
+
+    new_eos = tf.logical_and(is_eos, tf.logical_not(padding))
+    new_finished = tf.reduce_any(new_eos, axis=1)
+    lengths = tf.where(new_finished,
+                       i + 1 + tf.argmax(tf.cast(new_eos, tf.int32), axis=1, output_type=tf.int32),
+                       state[_StateKeys.LENGTHS])
+
+    # Drop the attention values of the rejected proposals
+    new_index = i + num_accepted + 1
+    draft_index = tf.minimum(new_index, i + self.draft_steps)
+
+    return [{
+      _StateKeys.CUR_INDEX: new_index,
+      _StateKeys.DRAFT_INDEX: draft_index,
+      _StateKeys.SEQ: tf.concat([seq, next_ids], axis=1),
+      _StateKeys.LOG_PROBS: state[_StateKeys.LOG_PROBS] + tf.reduce_sum(next_log_probs, axis=1),
+      _StateKeys.LENGTHS: lengths,
+      _StateKeys.FINISHED_FLAGS: tf.logical_or(finished_flags, new_finished),
+      _StateKeys.TARGET_CACHE: _truncate_cache(target_cache, new_index),
+      _StateKeys.DRAFT_CACHE: _truncate_cache(draft_cache, draft_index),
+      _StateKeys.TARGET_STEPS: state[_StateKeys.TARGET_STEPS] + 1
+    }]
+
+
+def sequence_speculative_search(
+        target_fn, draft_fn, initial_ids, target_cache, draft_cache, draft_steps,
+        alpha, max_decode_length, eos_id):
+  """Search for the greedy sequence of the target model, with the ids
+  proposed by the draft model.
+
+  Args:
+    target_fn: A function that takes in a block of ids, the position of its
+      first id, and the cache of the target model as arguments. The passed
+      in arguments will have shape:
+        ids -> [batch_size, block_length]
+        index -> [] (scalar)
+        cache -> nested dictionary of tensors [batch_size, ...]
+      The function must return logits and new cache.
+        logits -> [batch, block_length, vocab_size]
+        new cache -> same structure as inputted cache, with the attention
+          values of the block appended
+    draft_fn: Same as target_fn, for the draft model.
+    initial_ids: Starting ids for each batch item.
+      int32 tensor with shape [batch_size]
+    target_cache: dict containing starting target decoder variables information
+    draft_cache: dict containing starting draft decoder variables information
+    draft_steps: int number of ids proposed by the draft model every step
+    alpha: float defining the strength of length normalization of the scores
+    max_decode_length: maximum length to decoded sequence
+    eos_id: int id of eos token, used to determine when a sequence has finished
+
+  Returns:
+    Decoded sequences [batch_size, 1, decoded_length + 1]
+    sequence scores [batch_size, 1]
+    number of forward passes of the target model, int32 scalar
+  """
+  sss = SpeculativeGreedySearch(target_fn, draft_fn, draft_steps, alpha,
+                                max_decode_length, eos_id)
+  return sss.search(initial_ids, target_cache, draft_cache)
@@ -0,0 +1,65 @@
+"""
+Plain text vocab, used instead of the pickled keras tokenizer
+when loading exported models.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+
+
+def save_vocab(tokenizer, path):
+  """
+  Writes the words of a fitted keras tokenizer to a text file,
+  one word per line in the order of their ids (starting at 1).
+  :param tokenizer: The fitted tokenizer
+  :type tokenizer: tf tokenizer
+  :param path: Path of the vocab file
+  :type path: str
+  """
+  with io.open(path, 'w', encoding='UTF-8') as fp:
+    for i in range(1, len(tokenizer.index_word) + 1):
+      fp.write(tokenizer.index_word[i] + '\n')
+
+
+class TextVocab(object):
+  """
+  Vocab loaded from a file written by save_vocab, with the parts of
+  the keras tokenizer interface the inference code uses.
+  """
+
+  def __init__(self, path):
+    with io.open(path, 'r', encoding='UTF-8') as fp:
+      words = fp.read().split('\n')[:-1]
+    self.index_word = {i + 1: word for i, word in enumerate(words)}
+    self.word_index = {word: i + 1 for i, word in enumerate(words)}
+
+  def texts_to_sequences(self, texts):
+    """
+    Converts texts, or lists of tokens, into lists of ids,
+    dropping the unknown words like the keras tokenizer does.
+    :param texts: list of strings or of lists of strings
+    :type texts: list
+    :return: list of id lists
+    :rtype: list
+    """
+    sequences = []
+    for text in texts:
+      tokens = text if isinstance(text, list) else text.split()
+      sequences.append([self.word_index[token.lower()] for token in tokens
+                        if token.lower() in self.word_index])
+
+    return sequences
+
+  def sequences_to_texts(self, sequences):
+    """
+    Converts lists of ids into space separated texts,
+    skipping the padding and unknown ids.
+    :param sequences: list of id lists
+    :type sequences: list
+    :return: list of texts
+    :rtype: list
+    """
+    return [' '.join(self.index_word[i] for i in sequence if i in self.index_word)
+            for sequence in sequences]
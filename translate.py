@@ -3,15 +3,24 @@ To translate the entirety of test set and calculate bleu score.
 """
 
 import argparse
+import itertools
+import json
+import multiprocessing
 import os
-import pickle
+import shutil
+import time
 
-import sentencepiece as spm
-import tensorflow as tf
+from src.serving.cache import ResultCache, canonical_triples, model_version
+from src.serving.templates import check_template_vocab, delexicalize, relexicalize
+from src.utils.inference_config import load_inference_config, set_thread_pools
 
-from src.models import GraphAttentionModel
-from src.utils.PreprocessingUtils import PreProcess
-from src.utils.model_utils import Padding as padding
+# TensorFlow and the model code are imported by the functions using them,
+# so --help, the argument errors and the process merging the shards of
+# --workers do not wait for them
+_START = time.time()
+_stages = []
+# triple sets of this run and the distinct ones decoded, reported by --dedup
+_dedup = {"triple_sets": 0, "decoded": 0}
 
 parser = argparse.ArgumentParser(description="Main Arguments")
 
@@ -24,123 +33,576 @@ parser.add_argument(
 parser.add_argument(
   '--sentencepiece', type=str, required=True, help='Use sentencepiece or not ')
 parser.add_argument(
-  '--batch_size', type=str, required=True, help='Batch size to do inference ')
+  '--batch_size', type=int, required=False, default=None,
+  help='Batch size to do inference, defaults to the one of the inference config '
+       'written by autotune.py, else 32')
+parser.add_argument(
+  '--eager', type=str, required=False, default='False',
+  help='Run the predict step eagerly instead of as a tf.function graph (debugging)')
+parser.add_argument(
+  '--xla', type=str, required=False, default='False', help='Use XLA JIT compilation for the predict step')
+parser.add_argument(
+  '--dtype', type=str, required=False, default=None,
+  help='Compute dtype used for inference float32 | bfloat16, defaults to the training one')
+parser.add_argument(
+  '--shortlist', type=int, required=False, default=0,
+  help='Decode over a per batch shortlist of the source words and the K most '
+       'frequent target tokens instead of the full target vocab, 0 to disable')
+parser.add_argument(
+  '--quantized', type=str, required=False, default='False',
+  help='Load the model from the int8 file exported by quantize.py instead of the checkpoint, '
+       'a smaller file but not a faster model')
+parser.add_argument(
+  '--saved_model', type=str, required=False, default=None,
+  help='Directory of a model exported by export.py, used instead of the training checkpoint')
+
+parser.add_argument(
+  '--compact_every', type=int, required=False, default=0,
+  help='Drop the finished sentences from the beam search every N steps, 0 to disable')
+parser.add_argument(
+  '--num_samples', type=int, required=False, default=0,
+  help='Sample N sentences per triple set instead of decoding with the beam search, 0 to disable')
+parser.add_argument(
+  '--temperature', type=float, required=False, default=1.0, help='Temperature of the sampling')
+parser.add_argument(
+  '--top_k', type=int, required=False, default=0,
+  help='Sample from the K most probable tokens, 0 for all')
+parser.add_argument(
+  '--top_p', type=float, required=False, default=1.0,
+  help='Sample from the most probable tokens whose cumulative probability reaches P, 1.0 for all')
+parser.add_argument(
+  '--seed', type=int, required=False, default=None, help='Random seed of the sampling')
+parser.add_argument(
+  '--draft_lang', type=str, required=False, default=None,
+  help='Language (params and checkpoint) of a smaller model with the same vocabs, e.g. the '
+       'distilled student, proposing the next tokens for speculative greedy decoding')
+parser.add_argument(
+  '--draft_steps', type=int, required=False, default=4,
+  help='Number of tokens the draft model proposes at each speculative decoding step')
+parser.add_argument(
+  '--sort_batches', type=str, required=False, default='True',
+  help='Batch the triple sets sorted by size, the results keep the order of the file')
+parser.add_argument(
+  '--cache', type=str, required=False, default=None,
+  help='Path of a sqlite file caching the verbalizations across runs, only the triple sets '
+       'missing from it are decoded')
+parser.add_argument(
+  '--cache_size', type=int, required=False, default=10000,
+  help='Number of verbalizations of the cache kept in memory')
+parser.add_argument(
+  '--nbest', type=int, required=False, default=0,
+  help='Also write the K best hypotheses of each triple set with their scores, 0 to disable')
+parser.add_argument(
+  '--nbest_file', type=str, required=False, default='results.nbest.jsonl',
+  help='JSONL file the n-best hypotheses are written to')
+parser.add_argument(
+  '--stream', type=str, required=False, default='False',
+  help='Read the triples file in chunks and write one JSONL record per triple set as soon '
+       'as its chunk is decoded, memory stays constant with the file size')
+parser.add_argument(
+  '--stream_file', type=str, required=False, default='results.jsonl',
+  help='JSONL file the streamed records are written to')
+parser.add_argument(
+  '--chunk_size', type=int, required=False, default=0,
+  help='Number of triple sets read, sorted and written together when streaming, '
+       '0 for the batch size')
+parser.add_argument(
+  '--workers', type=int, required=False, default=1,
+  help='Decode the shards of the triples file in N processes, each with its own model, '
+       'the records are written to --stream_file')
+parser.add_argument(
+  '--shard_size', type=int, required=False, default=1000,
+  help='Number of triple sets of a shard')
+parser.add_argument(
+  '--shard_dir', type=str, required=False, default=None,
+  help='Directory of the finished shards, kept to skip them on a rerun, '
+       'defaults to <stream_file>.shards')
+parser.add_argument(
+  '--intra_op_threads', type=int, required=False, default=0,
+  help='Threads used inside a TensorFlow op, 0 for the inference config written by '
+       'autotune.py, else the TensorFlow default, or the cores shared by the --workers')
+parser.add_argument(
+  '--inter_op_threads', type=int, required=False, default=0,
+  help='TensorFlow ops run in parallel, 0 for the inference config written by autotune.py, '
+       'else the TensorFlow default, or --intra_op_threads with --workers')
+parser.add_argument(
+  '--dedup', type=str, required=False, default='True',
+  help='Decode the identical triple sets once, in any triple order, and copy their outputs')
+parser.add_argument(
+  '--templates', type=str, required=False, default='False',
+  help='Replace the entities by slots, decode and cache the pattern of the triple set once '
+       'and put the entities back in its output, needs a model preprocessed with --delex True')
+parser.add_argument(
+  '--profile_startup', type=str, required=False, default='False',
+  help='Print the time of every startup stage, up to the first decoded batch')
+
+
+def parse_args():
+  """Parses and checks the command line."""
+  args = parser.parse_args()
+  if args.saved_model is not None and args.shortlist > 0:
+    parser.error('--shortlist is not supported with --saved_model')
+  if args.saved_model is not None and args.compact_every > 0:
+    parser.error('--compact_every is not supported with --saved_model')
+  if args.num_samples > 0 and (args.saved_model is not None or args.shortlist > 0):
+    parser.error('--num_samples is not supported with --saved_model or --shortlist')
+  if args.nbest > 0 and (args.saved_model is not None or args.num_samples > 0):
+    parser.error('--nbest is not supported with --saved_model or --num_samples')
+  if args.draft_lang is not None and (args.saved_model is not None or args.shortlist > 0 or
+                                      args.num_samples > 0 or args.nbest > 0):
+    parser.error('--draft_lang is not supported with --saved_model, --shortlist, '
+                 '--num_samples or --nbest')
+  if args.cache is not None and (args.num_samples > 0 or args.nbest > 0):
+    parser.error('--cache is not supported with --num_samples or --nbest')
+  if (args.stream == 'True' or args.workers > 1) and (args.num_samples > 0 or args.nbest > 0):
+    parser.error('--stream and --workers are not supported with --num_samples or --nbest')
+  if args.workers > 1 and args.cache is not None:
+    parser.error('--cache is not supported with --workers')
+
+  return args
+
+
+def mark_stage(name):
+  """Records the first time a startup stage ends, printed by --profile_startup."""
+  if name not in dict(_stages):
+    _stages.append((name, time.time()))
+
+
+def print_stages():
+  """Prints the time of every startup stage."""
+  previous = _START
+  for name, end in _stages:
+    print('{:<14}{:8.3f}s'.format(name, end - previous))
+    previous = end
+  print('{:<14}{:8.3f}s'.format('total', previous - _START))
+
+
+def dedup_positions(triple_sets, positions):
+  """
+  Groups the triple sets to decode by their canonical form, so that
+  the identical graphs are decoded once.
+  :param triple_sets: The triple sets, 's | p | o <TSP> ...' strings
+  :type triple_sets: list
+  :param positions: Positions of the triple sets to decode
+  :type positions: list
+  :return: positions of the distinct triple sets, and the index among
+           them of every position
+  :rtype: list, list
+  """
+  first = {}
+  unique = []
+  source = []
+  for i in positions:
+    key = canonical_triples(triple_sets[i]) if args.dedup == 'True' else i
+    if key not in first:
+      first[key] = len(unique)
+      unique.append(i)
+    source.append(first[key])
+  _dedup["triple_sets"] += len(triple_sets)
+  _dedup["decoded"] += len(unique)
+
+  return unique, source
+
+
+def print_dedup(counts=None):
+  """Prints the share of the triple sets that were not decoded again."""
+  counts = counts or _dedup
+  if counts["triple_sets"]:
+    print('Dedup : decoded {} distinct of {} triple sets, {:.1%} not decoded'.format(
+      counts["decoded"], counts["triple_sets"], 1. - counts["decoded"] / counts["triple_sets"]))
+
+
+def load_predictor(args):
+  """
+  Loads the model and builds its predict step.
+  :param args: The translate.py arguments
+  :type args: argparse.Namespace
+  :return: predict function of a batch and the node lists of its triple
+           sets, source vocab, target vocab
+  :rtype: callable, tf tokenizer, tf tokenizer or sentencepiece processor
+  """
+  import tensorflow as tf
+
+  from src.utils.InferenceUtils import LoadModel, LoadSavedModel, _shortlist_candidates
+  from src.utils.model_utils import compile_step, graph_input_signature
+  mark_stage('imports')
+
+  if args.saved_model is not None:
+    verbalize, src_vocab, tgt_vocab, args.sentencepiece = LoadSavedModel(args.saved_model)
+  else:
+    model, src_vocab, tgt_vocab = LoadModel(args.model, args.lang, args.dtype,
+                                            quantized=args.quantized == 'True')
+    model.compact_every = args.compact_every
+    if args.nbest > model.args.beam_size:
+      model.args.beam_size = args.nbest
+    if args.draft_lang is not None:
+      draft_model, draft_src_vocab, _ = LoadModel(args.model, args.draft_lang, args.dtype)
+      if (draft_src_vocab.word_index != src_vocab.word_index or
+              draft_model.vocab_tgt_size != model.vocab_tgt_size):
+        parser.error('The draft model must use the same vocabs as the model')
+  if args.templates == 'True':
+    check_template_vocab(src_vocab)
+
+  if args.saved_model is not None:
+    predict_step = verbalize
+  elif args.draft_lang is not None:
+    predict_step = compile_step(
+      lambda nodes, labels, node1, node2: model.speculate(
+        draft_model, nodes, labels, node1, node2, args.draft_steps),
+      graph_input_signature(), args)
+  elif args.num_samples > 0:
+    if args.seed is not None:
+      tf.set_random_seed(args.seed)
+    predict_step = compile_step(
+      lambda nodes, labels, node1, node2: model.sample(
+        nodes, labels, node1, node2, args.num_samples, args.temperature,
+        args.top_k, args.top_p),
+      graph_input_signature(), args)
+  elif args.shortlist > 0:
+    predict_step = compile_step(
+      lambda nodes, labels, node1, node2, shortlist: model(
+        nodes, labels, node1, node2, targ=None, mask=None, shortlist=shortlist),
+      graph_input_signature() + [tf.TensorSpec([None], tf.int32, name='shortlist')], args)
+  else:
+    predict_step = compile_step(
+      lambda nodes, labels, node1, node2: model(nodes, labels, node1, node2, targ=None, mask=None),
+      graph_input_signature(), args)
+
+  def predict(batch_nodes, labels, node1, node2, graphs):
+    """Runs the predict step on a batch, graphs are the node lists of its triple sets."""
+    if args.shortlist > 0:
+      shortlist = _shortlist_candidates(graphs, tgt_vocab, args.shortlist, args.sentencepiece,
+                                        args.lang)
+      return predict_step(batch_nodes, labels, node1, node2, shortlist)
+    return predict_step(batch_nodes, labels, node1, node2)
+  mark_stage('load model')
+
+  return predict, src_vocab, tgt_vocab
+
+
+def verbalize_chunk(lines, first_id, predict, src_vocab, tgt_vocab, cache=None):
+  """
+  Verbalizes a chunk of the triples file into streamed records.
+  :param lines: The triple sets of the chunk
+  :type lines: list
+  :param first_id: Line number of the first triple set in the file
+  :type first_id: int
+  :param predict: The predict function returned by load_predictor
+  :type predict: callable
+  :param cache: The result cache, None to decode every triple set
+  :type cache: ResultCache
+  :return: one {"id", "input", "output", "score", "latency_ms"} record per
+           triple set, in the order of the lines
+  :rtype: list
+  """
+  from src.utils.InferenceUtils import _decode_predictions, _sort_by_size, _tensorize_triples
+  from src.utils.PreprocessingUtils import PreProcess
+
+  batch_size = args.batch_size
+  start = time.time()
+  records = [{"id": first_id + i, "input": line.strip()} for i, line in enumerate(lines)]
+  if args.templates == 'True':
+    lines, entities = zip(*[delexicalize(line) for line in lines]) if lines else ([], [])
+  pending = list(range(len(lines)))
+  if cache is not None:
+    keys = [cache.key(triples) for triples in lines]
+    for record, result in zip(records, cache.get_many(keys)):
+      if result is not None:
+        record.update(output=result[0], score=result[1],
+                      latency_ms=(time.time() - start) * 1000.)
+    pending = [i for i, record in enumerate(records) if "output" not in record]
+  unique, source = dedup_positions(lines, pending)
 
-args = parser.parse_args()
+  nodes, labels, node1, node2 = PreProcess([lines[i] for i in unique], args.lang)
+  order = list(range(len(nodes)))
+  if args.sort_batches == 'True' and nodes:
+    nodes, labels, node1, node2, order = _sort_by_size(nodes, labels, node1, node2)
+  dataset = _tensorize_triples(nodes, labels, node1, node2, src_vocab, batch_size) if nodes else []
+  for (batch, (batch_nodes, batch_labels, batch_node1, batch_node2)) in enumerate(dataset):
+    predictions = predict(batch_nodes, batch_labels, batch_node1, batch_node2,
+                          nodes[batch * batch_size:(batch + 1) * batch_size])
+    sentences = _decode_predictions(predictions['outputs'].numpy().tolist(),
+                                    tgt_vocab, args.sentencepiece)
+    latency = (time.time() - start) * 1000.
+    mark_stage('first output')
+    for j, sentence, score in zip(order[batch * batch_size:(batch + 1) * batch_size],
+                                  sentences, predictions['scores'].numpy().tolist()):
+      records[unique[j]].update(output=sentence, score=score, latency_ms=latency)
+  for i, j in zip(pending, source):
+    if i != unique[j]:
+      records[i].update((name, records[unique[j]][name])
+                        for name in ('output', 'score', 'latency_ms'))
 
+  if cache is not None:
+    cache.put_many([(keys[i], (records[i]["output"], records[i]["score"])) for i in unique])
+  if args.templates == 'True':
+    for record, line_entities in zip(records, entities):
+      record["output"] = relexicalize(record["output"], line_entities)
 
-def LoadModel(model, lang):
+  return records
+
+
+def _shard_offsets(path, shard_size):
+  """Byte offset and number of lines of every shard of a file."""
+  shards = []
+  offset = 0
+  with open(path, 'rb') as f:
+    while True:
+      lines = list(itertools.islice(f, shard_size))
+      if not lines:
+        break
+      shards.append((offset, len(lines)))
+      offset += sum(len(line) for line in lines)
+
+  return shards
+
+
+# model of a worker process, loaded once by _init_worker
+_worker = {}
+
+
+def _init_worker(worker_args, threads):
+  """Pins the thread pools of a worker process and loads its model."""
+  global args
+  args = worker_args
+  set_thread_pools(threads, args.inter_op_threads or threads)
+  _worker['model'] = load_predictor(args)
+  _worker['memo'] = _dedup_memo()
+
+
+def _verbalize_shard(shard):
   """
-  Function to load the model from stored checkpoint.
-  :param args: All arguments that were given to train file
-  :type args: Argparse object
-  :return: model
-  :rtype: tf.keras.Model
+  Verbalizes a shard of the triples file in a worker process. The records
+  are written to a temporary file renamed once the shard is complete, so
+  the shards found on a rerun are complete.
   """
+  index, offset, count, first_id, path = shard
+  predict, src_vocab, tgt_vocab = _worker['model']
+  chunk_size = args.chunk_size or args.batch_size
+  with open(args.triples, 'rb') as f, open(path + '.tmp', 'w') as out:
+    f.seek(offset)
+    lines = [line.decode('utf-8') for line in itertools.islice(f, count)]
+    for i in range(0, len(lines), chunk_size):
+      for record in verbalize_chunk(lines[i:i + chunk_size], first_id + i,
+                                    predict, src_vocab, tgt_vocab, _worker['memo']):
+        out.write(json.dumps(record) + '\n')
+  os.rename(path + '.tmp', path)
+  counts = dict(_dedup)
+  _dedup.update(triple_sets=0, decoded=0)
 
-  if model == 'gat':
-
-    log_dir = 'data/logs'
-    with open(log_dir + '/' + lang + '_model_params', 'rb') as fp:
-      params = pickle.load(fp)
-
-    model_args = params['args']
-
-    if model_args.use_colab is None:
-      OUTPUT_DIR = 'ckpts/' + model_args.lang
-      if not os.path.isdir(OUTPUT_DIR): os.mkdir(OUTPUT_DIR)
-    else:
-      from google.colab import drive
-
-      drive.mount('/content/gdrive')
-      OUTPUT_DIR = '/content/gdrive/My Drive/ckpts/' + model_args.lang
-      if not os.path.isdir(OUTPUT_DIR): os.mkdir(OUTPUT_DIR)
-
-    if model_args.enc_type == 'gat' and model_args.dec_type == 'transformer':
-      OUTPUT_DIR += '/' + model_args.enc_type + '_' + model_args.dec_type
-
-      # Load the vocabs
-      with open('vocabs/' + model_args.model + '/' +
-                lang + '/' + model_args.opt + '_src_vocab', 'rb') as fp:
-        src_vocab = pickle.load(fp)
-      # loading the target vocab
-      model_args.sentencepiece = 'False'
-      if model_args.sentencepiece == 'True':
-        sp = spm.SentencePieceProcessor()
-        sp.load('vocabs/' + model_args.model + '/' +
-                lang + '/' + 'train_tgt.model')
-        tgt_vocab = sp
-      else:
-        tgt_vocab = src_vocab
-
-      print('Loaded ' + lang + ' Parameters..')
-      model = GraphAttentionModel.TransGAT(params['args'], params['src_vocab_size'], src_vocab,
-                                           params['tgt_vocab_size'], params['max_tgt_length'], tgt_vocab)
-
-      # Load the latest checkpoints
-      optimizer = tf.train.AdamOptimizer(beta1=0.9, beta2=0.98,
-                                         epsilon=1e-9)
-
-      ckpt = tf.train.Checkpoint(
-        model=model,
-        optimizer=optimizer
-      )
-
-      ckpt_manager = tf.train.CheckpointManager(ckpt, OUTPUT_DIR, max_to_keep=5)
-      if ckpt_manager.latest_checkpoint:
-        ckpt.restore(ckpt_manager.latest_checkpoint).expect_partial()
-
-    print('Loaded ' + lang + ' model !')
-
-    return model, src_vocab, tgt_vocab
-
-
-def _tensorize_triples(nodes, labels,
-                       node1, node2, src_vocab):
-  node_tensor = src_vocab.texts_to_sequences(nodes)
-  label_tensor = src_vocab.texts_to_sequences(labels)
-  node1_tensor = src_vocab.texts_to_sequences(node1)
-  node2_tensor = src_vocab.texts_to_sequences(node2)
-  node_tensor = padding(
-    tf.keras.preprocessing.sequence.pad_sequences(node_tensor, padding='post'), 16)
-  label_tensor = padding(
-    tf.keras.preprocessing.sequence.pad_sequences(label_tensor, padding='post'), 16)
-  node1_tensor = padding(
-    tf.keras.preprocessing.sequence.pad_sequences(node1_tensor, padding='post'), 16)
-  node2_tensor = padding(
-    tf.keras.preprocessing.sequence.pad_sequences(node2_tensor, padding='post'), 16)
-
-  dataset = tf.data.Dataset.from_tensor_slices((node_tensor, label_tensor,
-                                                node1_tensor, node2_tensor))
-  dataset = dataset.batch(int(args.batch_size), drop_remainder=False)
-
-  return dataset
+  return index, counts
+
+
+def _dedup_memo():
+  """
+  In memory cache of the last --cache_size verbalizations, so the triple
+  sets repeated across chunks are decoded once, None without --dedup.
+  """
+  if args.dedup != 'True' or args.cache_size <= 0:
+    return None
+  return ResultCache(args.lang, 'dedup', args.cache_size)
+
+
+def _model_version():
+  """Version of the model and of the decoding options its outputs depend on."""
+  return model_version(args.lang, args.saved_model,
+                       (args.model, args.dtype, args.quantized, args.shortlist,
+                        args.draft_lang, args.templates))
+
+
+def _result_cache():
+  """The result cache of the model and decoding options."""
+  return ResultCache(args.lang, _model_version(), args.cache_size, args.cache)
+
+
+def _shard_manifest():
+  """Identifies the input, the sharding and the model of the shards of a run."""
+  stat = os.stat(args.triples)
+  return {"triples": os.path.abspath(args.triples), "size": stat.st_size,
+          "mtime": stat.st_mtime, "shard_size": args.shard_size, "lang": args.lang,
+          "model_version": _model_version()}
+
+
+def translate_stream():
+  """
+  Verbalizes the triples file chunk by chunk, only one chunk is held in
+  memory and its records are written once its triple sets are decoded.
+  """
+  predict, src_vocab, tgt_vocab = load_predictor(args)
+  cache = _result_cache() if args.cache is not None else _dedup_memo()
+  chunk_size = args.chunk_size or args.batch_size
+  count = 0
+  with open(args.triples, 'r') as f, open(args.stream_file, 'w') as out:
+    while True:
+      lines = list(itertools.islice(f, chunk_size))
+      if not lines:
+        break
+      for record in verbalize_chunk(lines, count, predict, src_vocab, tgt_vocab, cache):
+        out.write(json.dumps(record) + '\n')
+      out.flush()
+      count += len(lines)
+  print('Wrote {} records to {}'.format(count, args.stream_file))
+  print_dedup()
+  if cache is not None:
+    print('Cache : {}'.format(cache.stats()))
+    cache.close()
+
+
+def translate_sharded():
+  """
+  Verbalizes the shards of the triples file in worker processes, each
+  with its own model, and merges the shards in the order of the file.
+  The shards written by a previous run are not decoded again.
+  """
+  shard_dir = args.shard_dir or args.stream_file + '.shards'
+  if not os.path.isdir(shard_dir):
+    os.makedirs(shard_dir)
+  # the shards of a run on another input or model are not resumed
+  manifest = _shard_manifest()
+  manifest_path = os.path.join(shard_dir, 'manifest.json')
+  if os.path.isfile(manifest_path):
+    with open(manifest_path, 'r') as fp:
+      if json.load(fp) != manifest:
+        parser.error('The shards in {} were written for another triples file, model or '
+                     'decoding options, delete the directory or pass another '
+                     '--shard_dir'.format(shard_dir))
+  elif any(name.startswith('shard-') for name in os.listdir(shard_dir)):
+    parser.error('The shards in {} have no manifest, delete the directory or pass another '
+                 '--shard_dir'.format(shard_dir))
+  else:
+    with open(manifest_path, 'w') as fp:
+      json.dump(manifest, fp, indent=2)
+  shards = []
+  first_id = 0
+  offsets = _shard_offsets(args.triples, args.shard_size)
+  for index, (offset, count) in enumerate(offsets):
+    path = os.path.join(shard_dir, 'shard-{:05d}-of-{:05d}.jsonl'.format(index, len(offsets)))
+    shards.append((index, offset, count, first_id, path))
+    first_id += count
+  pending = [shard for shard in shards if not os.path.isfile(shard[-1])]
+  print('{} shards, {} already done'.format(len(shards), len(shards) - len(pending)))
+
+  if pending:
+    threads = args.intra_op_threads or max(1, multiprocessing.cpu_count() // args.workers)
+    # TensorFlow is not fork safe, the workers start from a fresh interpreter
+    pool = multiprocessing.get_context('spawn').Pool(min(args.workers, len(pending)),
+                                                     initializer=_init_worker,
+                                                     initargs=(args, threads))
+    try:
+      for done, (index, counts) in enumerate(pool.imap_unordered(_verbalize_shard, pending)):
+        print('Shard {} done ({}/{})'.format(index, done + 1, len(pending)))
+        for name in counts:
+          _dedup[name] += counts[name]
+    finally:
+      pool.close()
+      pool.join()
+
+  with open(args.stream_file, 'w') as out:
+    for shard in shards:
+      with open(shard[-1], 'r') as f:
+        shutil.copyfileobj(f, out)
+  print('Wrote {} records to {}'.format(first_id, args.stream_file))
+  print_dedup()
 
 
 if __name__ == "__main__":
-  model, src_vocab, tgt_vocab = LoadModel(args.model, args.lang)
-  nodes, labels, node1, node2 = PreProcess(args.triples, args.lang)
-
-  dataset = _tensorize_triples(nodes, labels, node1, node2, src_vocab)
-  results = []
-
-  for (batch, (nodes, labels, node1, node2)) in (enumerate(dataset)):
-    predictions = model(nodes, labels, node1,
-                        node2, targ=None, mask=None)
-    pred = [(predictions['outputs'].numpy().tolist())]
-    if args.sentencepiece == 'True':
-      for i in range(len(pred[0])):
-        sentence = (tgt_vocab.DecodeIds(list(pred[0][i])))
-        sentence = sentence.partition("<start>")[2].partition("<end>")[0]
-        results.append(sentence)
-    else:
-      for i in pred:
-        sentences = tgt_vocab.sequences_to_texts(i)
-        sentence = [j.partition("<start>")[2].partition("<end>")[0] for j in sentences]
-        for w in sentences:
-          results.append(w)
-
-  print(results)
-  results_file = open('results.txt', 'w+')
-  results_file.writelines(results)
-  results_file.close()
+  args = parse_args()
+  config = load_inference_config(args.lang)
+  if args.batch_size is None:
+    args.batch_size = config.get('batch_size', 32)
+  if args.workers <= 1:
+    set_thread_pools(args.intra_op_threads or config.get('intra_op_parallelism', 0),
+                     args.inter_op_threads or config.get('inter_op_parallelism', 0))
+  mark_stage('parse args')
+  if args.workers > 1:
+    translate_sharded()
+  elif args.stream == 'True':
+    translate_stream()
+  else:
+    predict, src_vocab, tgt_vocab = load_predictor(args)
+    from src.utils.InferenceUtils import _decode_predictions, _restore_order, _sort_by_size, \
+      _tensorize_triples
+    from src.utils.PreprocessingUtils import PreProcess
+    from src.utils.beam_search import INF
+    cache = _result_cache() if args.cache is not None else None
+    batch_size = args.batch_size
+    with open(args.triples, 'r') as f:
+      triple_sets = f.readlines()
+    if args.templates == 'True':
+      # the triple sets sharing a pattern are decoded once, by --dedup or --cache
+      triple_sets, entities = (zip(*[delexicalize(triples) for triples in triple_sets])
+                               if triple_sets else ([], []))
+    # positions of the triple sets to decode
+    pending = list(range(len(triple_sets)))
+    if cache is not None:
+      keys = [cache.key(triples) for triples in triple_sets]
+      cached = cache.get_many(keys)
+      pending = [i for i, result in enumerate(cached) if result is None]
+    unique, source = dedup_positions(triple_sets, pending)
+
+    nodes, labels, node1, node2 = PreProcess([triple_sets[i] for i in unique], args.lang)
+    if args.sort_batches == 'True' and nodes:
+      nodes, labels, node1, node2, order = _sort_by_size(nodes, labels, node1, node2)
+
+    dataset = _tensorize_triples(nodes, labels, node1, node2, src_vocab, batch_size) if nodes else []
+    results = []
+    scores = []
+    nbest = []
+
+    for (batch, (batch_nodes, labels, node1, node2)) in (enumerate(dataset)):
+      predictions = predict(batch_nodes, labels, node1, node2,
+                            nodes[batch * batch_size:(batch + 1) * batch_size])
+      pred = predictions['outputs'].numpy()
+      mark_stage('first output')
+      # the samples of a triple set follow each other
+      pred = pred.reshape([-1, pred.shape[-1]]).tolist()
+      results.extend(_decode_predictions(pred, tgt_vocab, args.sentencepiece))
+      scores.extend(predictions['scores'].numpy().reshape([-1]).tolist())
+      if args.nbest > 0:
+        nbest_pred = predictions['nbest_outputs'].numpy()[:, :args.nbest]
+        nbest_scores = predictions['nbest_scores'].numpy()[:, :args.nbest].tolist()
+        sentences = _decode_predictions(nbest_pred.reshape([-1, nbest_pred.shape[-1]]).tolist(),
+                                        tgt_vocab, args.sentencepiece)
+        for i, hypothesis_scores in enumerate(nbest_scores):
+          n = len(hypothesis_scores)
+          # the beams that never finished keep a -INF score and no output
+          nbest.append({"id": len(nbest) if args.sort_batches != 'True' else order[len(nbest)],
+                        "nbest": [{"output": sentence, "score": score} for sentence, score in
+                                  zip(sentences[i * n:(i + 1) * n], hypothesis_scores)
+                                  if score > -INF / 2]})
+
+    if args.sort_batches == 'True' and nodes:
+      results = _restore_order(results, order)
+      scores = _restore_order(scores, order)
+      nbest = sorted(nbest, key=lambda record: record["id"])
+    # the outputs of the distinct triple sets are copied to their duplicates
+    group = max(args.num_samples, 1)
+    results = [results[j * group + k] for j in source for k in range(group)]
+    scores = [scores[j * group + k] for j in source for k in range(group)]
+    nbest = [dict(nbest[j], id=i) for i, j in enumerate(source)] if nbest else nbest
+    print_dedup()
+    if cache is not None:
+      cache.put_many([(keys[i], (results[j], scores[j])) for j, i in enumerate(pending)])
+      for j, i in enumerate(pending):
+        cached[i] = (results[j], scores[j])
+      results = [result[0] for result in cached]
+      print('Cache : {}'.format(cache.stats()))
+      cache.close()
+    if args.templates == 'True':
+      results = [relexicalize(result, entities[i // group]) for i, result in enumerate(results)]
+      for record in nbest:
+        for hypothesis in record["nbest"]:
+          hypothesis["output"] = relexicalize(hypothesis["output"], entities[record["id"]])
+    print(results)
+    # one sentence per line, without the <start> and <end> tokens
+    results_file = open('results.txt', 'w+')
+    results_file.writelines(result.strip() + '\n' for result in results)
+    results_file.close()
+
+    if args.nbest > 0:
+      with open(args.nbest_file, 'w') as fp:
+        for record in nbest:
+          fp.write(json.dumps(record) + '\n')
+
+  if args.profile_startup == 'True':
+    print_stages()